@@ -5,8 +5,11 @@ from diff_match_patch import diff_match_patch
 import datetime
 
 from reversion.admin import VersionAdmin
-from reversion.models import Version
+from reversion.models import Revision, Version
+from django.conf import settings
 from django.conf.urls import url
+from django.core.cache import caches
+from django.db import connections, router
 from django.shortcuts import get_object_or_404, render
 from django.contrib.admin.utils import unquote, quote
 from django.core.urlresolvers import reverse
@@ -42,10 +45,49 @@ class DateModifiedFilter(SimpleListFilter):
             date = datetime.date.today() - datetime.timedelta(days=30)
         if not date:
             return queryset
-        content_type = ContentType.objects.get_for_model(queryset.model)
-        revisions = Version.objects.filter(content_type=content_type, revision__date_created__gte=date)
-        return queryset.filter(pk__in=[x.object_id for x in revisions])
-
+        return modified_since(queryset, date)
+
+
+def modified_since(queryset, date):
+    """Filter queryset to objects with a revision created since date.
+
+       This is a correlated EXISTS against the version table, so it
+       doesn't load any version rows, however long the history is."""
+    model = queryset.model
+    content_type = ContentType.objects.get_for_model(model)
+    model_db = router.db_for_write(model)
+    connection = connections[queryset.db]
+    if queryset.db != Version.objects.db or connection.vendor not in (
+            'sqlite', 'postgresql', 'oracle'):
+        # We can't join across databases, or cast on this backend, so
+        # fall back to a list of ids
+        object_ids = Version.objects.get_for_model(model).filter(
+            revision__date_created__gte=date).order_by().values_list(
+                'object_id', flat=True).distinct()
+        return queryset.filter(pk__in=list(object_ids))
+    qn = connection.ops.quote_name
+    # Version.object_id is a string, so cast the object's pk to match.
+    # Casting this side keeps the version index usable.
+    where = """EXISTS (
+        SELECT 1 FROM {version} V
+        INNER JOIN {revision} R ON R.{revision_pk} = V.{revision_id}
+        WHERE V.{content_type_id} = %s AND V.{db} = %s AND
+              V.{object_id} = CAST({model}.{model_pk} AS {str}) AND
+              R.{date_created} >= %s)""".format(
+        version=qn(Version._meta.db_table),
+        revision=qn(Revision._meta.db_table),
+        revision_pk=qn(Revision._meta.pk.column),
+        revision_id=qn(Version._meta.get_field('revision').column),
+        content_type_id=qn(Version._meta.get_field('content_type').column),
+        db=qn(Version._meta.get_field('db').column),
+        object_id=qn(Version._meta.get_field('object_id').column),
+        model=qn(model._meta.db_table),
+        model_pk=qn(model._meta.pk.column),
+        str=Version._meta.get_field('object_id').db_type(connection),
+        date_created=qn(Revision._meta.get_field('date_created').column),
+    )
+    return queryset.extra(where=[where],
+                          params=[content_type.pk, model_db, date])
 
 
 def get_date(revision):
@@ -58,10 +100,26 @@ def get_author(revision):
     return 'Unknown'
 
 
+# Upper bound, in seconds, on the time spent diffing a single field.
+# diff_match_patch falls back to a coarser diff when it runs out of time.
+DIFF_TIMEOUT = 0.5
+
+# Versions never change, so their diffs can be cached for a long time
+DIFF_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+
+
+def _diff_html(dmp, old_text, new_text):
+    diffs = dmp.diff_main(old_text, new_text)
+    # Merge the character-level noise into human-readable chunks
+    dmp.diff_cleanupSemantic(diffs)
+    return dmp.diff_prettyHtml(diffs)
+
+
 def make_diff(current, revision):
     """Create the difference between the current revision and a previous version"""
     the_diff = []
     dmp = diff_match_patch()
+    dmp.Diff_Timeout = DIFF_TIMEOUT
 
     for field in (set(current.field_dict.keys()) | set(revision.field_dict.keys())):
         # These exclusions really should be configurable
@@ -93,20 +151,35 @@ def make_diff(current, revision):
             # markdown, rather than the rendered result.
             if cur_val.raw == old_val.raw:
                 continue
-            diffs = dmp.diff_main(old_val.raw, cur_val.raw)
-            patch =  dmp.diff_prettyHtml(diffs)
+            patch = _diff_html(dmp, old_val.raw, cur_val.raw)
         elif cur_val == old_val:
             continue
         else:
             # Compare the actual field values
-            diffs = dmp.diff_main(force_text(old_val), force_text(cur_val))
-            patch = dmp.diff_prettyHtml(diffs)
+            patch = _diff_html(dmp, force_text(old_val), force_text(cur_val))
         the_diff.append((field, patch))
 
     the_diff.sort()
     return the_diff
 
 
+def cached_diff(current, revision):
+    """make_diff, cached by the pair of versions being compared."""
+    cache = caches[settings.WAFER_CACHE]
+    cache_key = 'wafer_compare_diff_%s_%s' % (current.pk, revision.pk)
+    the_diff = cache.get(cache_key)
+    if the_diff is None:
+        the_diff = make_diff(current, revision)
+        cache.set(cache_key, the_diff, DIFF_CACHE_TIMEOUT)
+    return the_diff
+
+
+def versions_for_compare(versions):
+    """Version metadata, leaving the serialized data to be loaded only
+       when a diff isn't cached."""
+    return versions.select_related('revision__user').defer('serialized_data')
+
+
 class CompareVersionAdmin(VersionAdmin):
 
     compare_template = "admin/wafer.compare/compare.html"
@@ -130,12 +203,14 @@ class CompareVersionAdmin(VersionAdmin):
         """Actually compare two versions."""
         opts = self.model._meta
         object_id = unquote(object_id)
+        versions = versions_for_compare(
+            Version.objects.get_for_object_reference(self.model, object_id))
         # get_for_object's ordering means this is always the latest revision.
+        current = versions[0]
         # The reversion we want to compare to
-        current = Version.objects.get_for_object_reference(self.model, object_id)[0]
-        revision = Version.objects.get_for_object_reference(self.model, object_id).filter(id=version_id)[0]
+        revision = get_object_or_404(versions, id=version_id)
 
-        the_diff = make_diff(current, revision)
+        the_diff = cached_diff(current, revision)
 
         context = {
             "title": _("Comparing current %(model)s with revision created %(date)s") % {
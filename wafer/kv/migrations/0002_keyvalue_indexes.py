@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import migrations, models
+
+from wafer.utils import backfill
+
+
+def hash_value(value):
+    # A copy of wafer.kv.models.hash_value, as it was at this migration
+    serialized = json.dumps(value, sort_keys=True, separators=(',', ':'),
+                            cls=DjangoJSONEncoder)
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+
+def fill_value_hash(apps, schema_editor):
+    # Use apps to ensure we have the correct version
+    KeyValue = apps.get_model('kv', 'KeyValue')
+    backfill(KeyValue.objects.all(), lambda pairs: dict(
+        (pair.pk, {'value_hash': hash_value(pair.value)}) for pair in pairs))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kv', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='keyvalue',
+            name='value_hash',
+            field=models.CharField(default='', max_length=40, db_index=True, editable=False),
+        ),
+        migrations.AlterIndexTogether(
+            name='keyvalue',
+            index_together=set([('group', 'key')]),
+        ),
+        migrations.RunPython(fill_value_hash,
+                             migrations.RunPython.noop),
+    ]
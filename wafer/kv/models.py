@@ -1,13 +1,47 @@
+import hashlib
+import json
+
 from django.contrib.auth.models import Group
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 
 from jsonfield import JSONField
 
 
+def hash_value(value):
+    """A stable hash of a JSON value, for indexed equality lookups."""
+    serialized = json.dumps(value, sort_keys=True, separators=(',', ':'),
+                            cls=DjangoJSONEncoder)
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+
+class KeyValueQuerySet(models.QuerySet):
+    def with_value(self, value):
+        """Filter to pairs with the given value, using the value_hash
+           index."""
+        return self.filter(value_hash=hash_value(value), value=value)
+
+
 class KeyValue(models.Model):
     group = models.ForeignKey(Group)
     key = models.CharField(max_length=64, db_index=True)
     value = JSONField()
+    # Maintained by save(). Anything that writes value in bulk must update
+    # it too (see hash_value)
+    value_hash = models.CharField(max_length=40, db_index=True,
+                                  editable=False, default='')
+
+    objects = KeyValueQuerySet.as_manager()
+
+    class Meta:
+        index_together = [('group', 'key')]
+
+    def save(self, *args, **kwargs):
+        self.value_hash = hash_value(self.value)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'value' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | set(['value_hash'])
+        super(KeyValue, self).save(*args, **kwargs)
 
     def __unicode__(self):
         return u'KV(%s, %s, %r)' % (self.group.name, self.key, self.value)
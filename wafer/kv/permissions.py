@@ -1,5 +1,14 @@
 from rest_framework.permissions import BasePermission
 
+from wafer.utils import cached_on_user
+
+
+@cached_on_user('_wafer_kv_group_ids')
+def get_user_group_ids(user):
+    """Return the set of ids of the groups the user is a member of."""
+    return user.groups.values_list('pk', flat=True)
+
+
 class KeyValueGroupPermission(BasePermission):
     """Restrict access to a given key / value pair to members of the
        corresponding group."""
@@ -11,12 +20,10 @@ class KeyValueGroupPermission(BasePermission):
     def has_object_permission(self, request, view, obj):
         # Only allow any sort of access if the user is a member of
         # the appropriate group
-        group = obj.group
-        user = request.user
-        if user.groups.filter(name=group.name).exists():
+        if obj.group_id in get_user_group_ids(request.user):
             if request.method in ['PUT', 'PATCH']:
                 # XXX: Better ideas here?
-                if 'group' in request.data and obj.group.pk != int(request.data['group']):
+                if 'group' in request.data and obj.group_id != int(request.data['group']):
                     self.message = "Cannot change the group owning this KeyValue pair"
                     return False
             return True
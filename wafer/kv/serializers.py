@@ -28,3 +28,12 @@ class KeyValueSerializer(serializers.ModelSerializer):
         groups.queryset = user.groups
 
         super(KeyValueSerializer, self).__init__(*args, **kwargs)
+
+
+class KeyValueBulkItemSerializer(serializers.Serializer):
+    """A single pair in a bulk request. Group membership is checked by the
+       view, for the whole request at once."""
+    id = serializers.IntegerField(required=False, allow_null=True)
+    group = serializers.IntegerField()
+    key = serializers.CharField(max_length=64)
+    value = serializers.JSONField()
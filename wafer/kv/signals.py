@@ -0,0 +1,12 @@
+from django.dispatch import Signal
+
+
+# Sent by the bulk KeyValue helpers, which bypass post_save, after they
+# change existing pairs. pks are the ids of the changed pairs.
+pairs_changed = Signal(providing_args=['pks'])
+
+# Sent by delete_pairs before it deletes pairs in bulk, instead of the work
+# done by per-pair pre_delete and post_delete receivers (see
+# wafer.kv.utils.deleting_in_bulk). pks are the ids of the pairs. Receivers
+# may return a function, which is called once the pairs are gone.
+pairs_deleting = Signal(providing_args=['pks'])
@@ -2,7 +2,9 @@
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
+from django.db import connection
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 from wafer.kv.models import KeyValue
 import json
@@ -207,3 +209,109 @@ class KeyValueAPITests(TestCase):
         response = self.client.patch('/kv/api/kv/%d/' % self.kv_2_grp2.pk, data,
                                      format='json')
         self.assertEqual(response.status_code, 404)
+
+
+class KeyValueBulkTests(TestCase):
+    """Tests of the bulk API view."""
+
+    def setUp(self):
+        for grp in ['group_1', 'group_2', 'group_3']:
+            create_group(grp)
+        self.user = create_user('user1', ['group_1', 'group_2'])
+        self.kv_1 = create_kv_pair('Val 1', {'a': 1}, 'group_1')
+        self.kv_2 = create_kv_pair('Val 2', {'b': 2}, 'group_2')
+        self.kv_3 = create_kv_pair('Val 3', {'c': 3}, 'group_3')
+        self.client = APIClient()
+        self.client.login(username='user1', password='password')
+
+    def test_anonymous(self):
+        response = APIClient().get('/kv/api/bulk/', {'ids': self.kv_1.pk})
+        self.assertEqual(response.status_code, 403)
+
+    def test_get(self):
+        ids = '%d,%d,%d' % (self.kv_1.pk, self.kv_2.pk, self.kv_3.pk)
+        response = self.client.get('/kv/api/bulk/', {'ids': ids})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([pair['key'] for pair in response.data['results']],
+                         ['Val 1', 'Val 2'])
+        response = self.client.get('/kv/api/bulk/', {'ids': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_upsert(self):
+        group_1 = get_group('group_1').pk
+        data = [{'id': self.kv_1.pk, 'group': group_1, 'key': 'Val 1',
+                 'value': {'a': 'changed'}}]
+        data.extend({'group': group_1, 'key': 'New %d' % i, 'value': i}
+                    for i in range(10))
+        response = self.client.post('/kv/api/bulk/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 11)
+        self.assertEqual(response.data['results'][0]['id'], self.kv_1.pk)
+        self.assertTrue(all(pair['id'] for pair in response.data['results']))
+        self.kv_1.refresh_from_db()
+        self.assertEqual(self.kv_1.value, {'a': 'changed'})
+        self.assertEqual(
+            KeyValue.objects.with_value({'a': 'changed'}).get(), self.kv_1)
+        self.assertEqual(KeyValue.objects.filter(
+            key__startswith='New ', group_id=group_1).count(), 10)
+
+    def test_upsert_other_group_is_atomic(self):
+        data = [{'group': get_group('group_1').pk, 'key': 'New', 'value': 1},
+                {'group': get_group('group_3').pk, 'key': 'New', 'value': 2}]
+        response = self.client.post('/kv/api/bulk/', data, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(KeyValue.objects.filter(key='New').exists())
+
+        data = [{'group': get_group('group_1').pk, 'key': 'New', 'value': 1},
+                {'id': self.kv_3.pk, 'group': get_group('group_3').pk,
+                 'key': 'Val 3', 'value': 3}]
+        response = self.client.post('/kv/api/bulk/', data, format='json')
+        self.assertEqual(response.status_code, 403)
+
+        data = [{'group': get_group('group_1').pk, 'key': 'New', 'value': 1},
+                {'id': self.kv_2.pk, 'group': get_group('group_1').pk,
+                 'key': 'Val 2', 'value': 2}]
+        response = self.client.post('/kv/api/bulk/', data, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(KeyValue.objects.filter(key='New').exists())
+        self.kv_2.refresh_from_db()
+        self.assertEqual(self.kv_2.group, get_group('group_2'))
+
+    def test_group_membership_queried_once(self):
+        group_1 = get_group('group_1').pk
+        data = [{'id': self.kv_1.pk, 'group': group_1, 'key': 'Val 1',
+                 'value': i} for i in range(20)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/kv/api/bulk/', data,
+                                        format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len([query for query in queries
+                              if 'auth_user_groups' in query['sql']]), 1)
+
+    def test_delete(self):
+        ids = [self.kv_1.pk, self.kv_2.pk, self.kv_3.pk]
+        response = self.client.delete('/kv/api/bulk/', {'ids': ids},
+                                      format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['deleted'], 2)
+        self.assertEqual(list(KeyValue.objects.all()), [self.kv_3])
+
+    def test_delete_query_count(self):
+        group = Group.objects.create(name='Registration')
+        self.user.groups.add(group)
+        profile = self.user.userprofile
+
+        def delete(count):
+            pairs = [create_kv_pair('Del %d' % i, i, 'Registration')
+                     for i in range(count)]
+            profile.kv.add(*pairs)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.delete(
+                    '/kv/api/bulk/', {'ids': [pair.pk for pair in pairs]},
+                    format='json')
+            self.assertEqual(response.data['deleted'], count)
+            return len(queries.captured_queries)
+
+        with self.settings(WAFER_REGISTRATION_MODE='form'):
+            # The same, however many pairs are deleted
+            self.assertEqual(delete(1), delete(20))
@@ -0,0 +1,44 @@
+"""Tests for wafer.kv models and utils."""
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.test import TestCase
+
+from wafer.kv.models import KeyValue, hash_value
+from wafer.kv.utils import upsert_kv
+
+
+class KeyValueHashTests(TestCase):
+    def setUp(self):
+        self.group = Group.objects.create(name='Group')
+
+    def test_save_sets_hash(self):
+        pair = KeyValue.objects.create(group=self.group, key='email',
+                                       value='a@example.com')
+        self.assertEqual(pair.value_hash, hash_value('a@example.com'))
+        pair.value = 'b@example.com'
+        pair.save(update_fields=['value'])
+        pair = KeyValue.objects.get(pk=pair.pk)
+        self.assertEqual(pair.value_hash, hash_value('b@example.com'))
+
+    def test_hash_ignores_key_order(self):
+        self.assertEqual(hash_value({'a': 1, 'b': [1, 2]}),
+                         hash_value({'b': [1, 2], 'a': 1}))
+        self.assertNotEqual(hash_value('1'), hash_value(1))
+
+    def test_with_value(self):
+        for value in ('a@example.com', 'b@example.com', {'a': 1}):
+            KeyValue.objects.create(group=self.group, key='k', value=value)
+        self.assertEqual(
+            [pair.value for pair in
+             KeyValue.objects.with_value('b@example.com')],
+            ['b@example.com'])
+        self.assertEqual(KeyValue.objects.with_value({'a': 1}).count(), 1)
+
+    def test_upsert_maintains_hash(self):
+        profile = get_user_model().objects.create_user('user').userprofile
+        upsert_kv(profile.kv, self.group, {'a': 1, 'b': 2})
+        upsert_kv(profile.kv, self.group, {'a': 'changed', 'c': True})
+        for pair in profile.kv.all():
+            self.assertEqual(pair.value_hash, hash_value(pair.value))
+        self.assertEqual(profile.kv.with_value('changed').get().key, 'a')
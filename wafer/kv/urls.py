@@ -2,11 +2,12 @@ from django.conf.urls import include, url
 
 from rest_framework import routers
 
-from wafer.kv.views import KeyValueViewSet
+from wafer.kv.views import KeyValueBulkView, KeyValueViewSet
 
 router = routers.DefaultRouter()
 router.register(r'kv', KeyValueViewSet)
 
 urlpatterns = [
+    url(r'^api/bulk/$', KeyValueBulkView.as_view(), name='kv_bulk'),
     url(r'^api/', include(router.urls)),
 ]
@@ -1,6 +1,14 @@
+import threading
+import uuid
+
 from django import forms
+from django.db import connections, models, transaction
+from django.db.models import Case, Value, When
 from django.utils.dateparse import parse_date, parse_datetime, parse_time
 
+from wafer.kv.models import KeyValue, hash_value
+from wafer.kv.signals import pairs_changed, pairs_deleting
+
 
 def deserialize_by_field(value, field):
     """
@@ -14,3 +22,118 @@ def deserialize_by_field(value, field):
     elif isinstance(field, forms.TimeField):
         value = parse_time(value)
     return value
+
+
+def update_pairs(pairs):
+    """
+    Save the keys and values of existing pairs with a single UPDATE.
+    """
+    if not pairs:
+        return
+    value_field = KeyValue._meta.get_field('value')
+
+    def case(output_field, values):
+        return Case(*[When(pk=pair.pk, then=Value(value))
+                      for pair, value in zip(pairs, values)],
+                    output_field=output_field)
+
+    KeyValue.objects.filter(pk__in=[pair.pk for pair in pairs]).update(
+        key=case(models.CharField(), [pair.key for pair in pairs]),
+        value=case(models.TextField(),
+                   [value_field.get_prep_value(pair.value)
+                    for pair in pairs]),
+        value_hash=case(models.CharField(),
+                        [hash_value(pair.value) for pair in pairs]))
+    pairs_changed.send(sender=KeyValue, pks=[pair.pk for pair in pairs])
+
+
+def create_pairs(pairs):
+    """
+    Insert new pairs with a fixed number of queries. Returns the saved
+    pairs, with their ids.
+    """
+    if not pairs:
+        return pairs
+    features = connections[KeyValue.objects.db].features
+    if getattr(features, 'can_return_ids_from_bulk_insert', False):
+        for pair in pairs:
+            pair.value_hash = hash_value(pair.value)
+        return KeyValue.objects.bulk_create(pairs)
+
+    # Insert them with unique placeholder hashes, so they can be selected
+    # again for their ids, and then set the real hashes
+    placeholders = {}
+    for pair in pairs:
+        pair.value_hash = uuid.uuid4().hex
+        placeholders[pair.value_hash] = pair
+    KeyValue.objects.bulk_create(pairs)
+    for pk, value_hash in KeyValue.objects.filter(
+            value_hash__in=list(placeholders)).values_list(
+                'pk', 'value_hash'):
+        placeholders[value_hash].pk = pk
+    for pair in pairs:
+        pair.value_hash = hash_value(pair.value)
+    KeyValue.objects.filter(pk__in=[pair.pk for pair in pairs]).update(
+        value_hash=Case(*[When(pk=pair.pk, then=Value(pair.value_hash))
+                          for pair in pairs],
+                        output_field=models.CharField()))
+    return pairs
+
+
+# Whether delete_pairs is deleting, in this thread
+_bulk = threading.local()
+
+
+def deleting_in_bulk():
+    """
+    Whether pairs are being deleted by delete_pairs, so per-pair delete
+    signal receivers should leave their work to pairs_deleting.
+    """
+    return getattr(_bulk, 'deleting', False)
+
+
+def delete_pairs(pairs):
+    """
+    Delete a queryset of pairs, sending pairs_deleting once for all of
+    them. Returns the number of pairs deleted.
+    """
+    with transaction.atomic():
+        pks = list(pairs.values_list('pk', flat=True))
+        if not pks:
+            return 0
+        callbacks = [response for receiver, response in
+                     pairs_deleting.send(sender=KeyValue, pks=pks)
+                     if callable(response)]
+        _bulk.deleting = True
+        try:
+            KeyValue.objects.filter(pk__in=pks).delete()
+        finally:
+            _bulk.deleting = False
+        for callback in callbacks:
+            callback()
+    return len(pks)
+
+
+def upsert_kv(kv, group, data):
+    """
+    Store data (a dict) in group, in the kv relation of an object (e.g.
+    UserProfile.kv). Existing keys are updated and missing ones are added.
+
+    This takes a fixed number of queries, however many keys there are.
+    """
+    with transaction.atomic():
+        existing = dict(
+            (pair.key, pair) for pair in
+            kv.filter(group=group, key__in=list(data)).select_for_update())
+
+        changed = []
+        for key, pair in existing.items():
+            if pair.value != data[key]:
+                pair.value = data[key]
+                changed.append(pair)
+        update_pairs(changed)
+
+        new = [KeyValue(group=group, key=key, value=value)
+               for key, value in data.items() if key not in existing]
+        if new:
+            kv.add(*create_pairs(new))
@@ -1,8 +1,20 @@
-from rest_framework import viewsets
+from django.db import transaction
+from django.utils import six
+
+from rest_framework import status, viewsets
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from wafer.kv.models import KeyValue
-from wafer.kv.serializers import KeyValueSerializer
-from wafer.kv.permissions import KeyValueGroupPermission
+from wafer.kv.serializers import (KeyValueBulkItemSerializer,
+                                  KeyValueSerializer)
+from wafer.kv.permissions import KeyValueGroupPermission, get_user_group_ids
+from wafer.kv.utils import create_pairs, delete_pairs, update_pairs
+
+# Maximum number of pairs in a single bulk request
+MAX_BATCH_SIZE = 1000
+
 
 class KeyValueViewSet(viewsets.ModelViewSet):
     """API endpoint that allows key-value pairs to be viewed or edited."""
@@ -14,6 +26,107 @@ class KeyValueViewSet(viewsets.ModelViewSet):
         # Restrict the list to only those that match the user's
         # groups
         if self.request.user.id is not None:
-            grp_ids = [x.id for x in self.request.user.groups.all()]
-            return KeyValue.objects.filter(group_id__in=grp_ids)
+            return KeyValue.objects.filter(
+                group_id__in=get_user_group_ids(self.request.user))
         return KeyValue.objects.none()
+
+
+class KeyValueBulkView(APIView):
+    """API endpoint to get, upsert or delete many key-value pairs at once.
+
+       Group membership is checked once per request, against the cached set
+       of the user's groups, and writes are made in bulk in a single
+       transaction, so either every pair in the request is saved, or none
+       is.
+
+       GET ?ids=1,2,3 returns the pairs the user can see.
+       POST a list of {"id" (optional), "group", "key", "value"} objects
+       updates the pairs with ids, and creates the rest.
+       DELETE {"ids": [1, 2, 3]} deletes the pairs.
+    """
+    permission_classes = (IsAuthenticated, )
+
+    def get_queryset(self):
+        return KeyValue.objects.filter(
+            group_id__in=get_user_group_ids(self.request.user))
+
+    def _error(self, detail, status_code=status.HTTP_400_BAD_REQUEST):
+        return Response({'detail': detail}, status=status_code)
+
+    def _parse_ids(self, ids):
+        if isinstance(ids, six.string_types):
+            ids = [pk for pk in ids.split(',') if pk.strip()]
+        if not isinstance(ids, (list, tuple)):
+            return None
+        try:
+            ids = [int(pk) for pk in ids]
+        except (TypeError, ValueError):
+            return None
+        if len(ids) > MAX_BATCH_SIZE:
+            return None
+        return ids
+
+    def _results(self, pairs):
+        return Response({'results': [
+            {'id': pair.pk, 'group': pair.group_id, 'key': pair.key,
+             'value': pair.value} for pair in pairs]})
+
+    def get(self, request):
+        ids = self._parse_ids(request.query_params.get('ids', ''))
+        if ids is None:
+            return self._error('ids must be a comma separated list of at '
+                               'most %d ids' % MAX_BATCH_SIZE)
+        return self._results(self.get_queryset().filter(
+            pk__in=ids).order_by('pk'))
+
+    def post(self, request):
+        if not isinstance(request.data, list):
+            return self._error('Expected a list of key-value pairs')
+        if len(request.data) > MAX_BATCH_SIZE:
+            return self._error('At most %d pairs can be saved at once'
+                               % MAX_BATCH_SIZE)
+        serializer = KeyValueBulkItemSerializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors,
+                            status=status.HTTP_400_BAD_REQUEST)
+        items = serializer.validated_data
+
+        group_ids = get_user_group_ids(request.user)
+        if any(item['group'] not in group_ids for item in items):
+            return self._error('You are not a member of that group',
+                               status.HTTP_403_FORBIDDEN)
+
+        with transaction.atomic():
+            ids = [item['id'] for item in items if item.get('id')]
+            existing = self.get_queryset().select_for_update().in_bulk(ids)
+            if len(existing) != len(set(ids)):
+                return self._error('Not found', status.HTTP_404_NOT_FOUND)
+
+            pairs, changed, new = [], [], []
+            for item in items:
+                if item.get('id'):
+                    pair = existing[item['id']]
+                    if pair.group_id != item['group']:
+                        return self._error(
+                            'Cannot change the group owning this KeyValue '
+                            'pair', status.HTTP_403_FORBIDDEN)
+                    pair.key = item['key']
+                    pair.value = item['value']
+                    changed.append(pair)
+                else:
+                    pair = KeyValue(group_id=item['group'], key=item['key'],
+                                    value=item['value'])
+                    new.append(pair)
+                pairs.append(pair)
+            update_pairs(changed)
+            create_pairs(new)
+        return self._results(pairs)
+
+    def delete(self, request):
+        ids = self._parse_ids(request.data.get('ids', [])
+                              if hasattr(request.data, 'get') else None)
+        if ids is None:
+            return self._error('ids must be a list of at most %d ids'
+                               % MAX_BATCH_SIZE)
+        deleted = delete_pairs(self.get_queryset().filter(pk__in=ids))
+        return Response({'deleted': deleted})
@@ -0,0 +1,117 @@
+import datetime
+import time
+from itertools import groupby
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from reversion.models import Revision, Version
+
+
+# Versions where one of these fields changed are always kept
+TRANSITION_FIELDS = ('status',)
+
+
+def _field_values(version, fields):
+    try:
+        field_dict = version.field_dict
+    except Exception:
+        # The model has changed since this version was saved, so we can't
+        # tell what changed. Keep it.
+        return None
+    return tuple(field_dict.get(field) for field in fields)
+
+
+def versions_to_prune(versions, cutoff, fields):
+    """Return the pks of the versions of a single object that can go.
+
+       versions must be in pk order. Versions since cutoff are all kept.
+       Older ones are compacted to the last version of each day, plus the
+       versions where one of fields changed."""
+    keep = set()
+    last_of_day = {}
+    old = []
+    previous_values = None
+    for version in versions:
+        if fields:
+            values = _field_values(version, fields)
+            if values is None or values != previous_values:
+                keep.add(version.pk)
+            previous_values = values
+        created = version.revision.date_created
+        if created >= cutoff:
+            continue
+        if timezone.is_aware(created):
+            created = timezone.localtime(created)
+        last_of_day[created.date()] = version.pk
+        old.append(version.pk)
+    keep.update(last_of_day.values())
+    return [pk for pk in old if pk not in keep]
+
+
+class Command(BaseCommand):
+    help = ("Prune old reversion history. Everything newer than --days is"
+            " kept. Older versions are compacted to daily checkpoints,"
+            " keeping every status change.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30,
+                            help='Keep all versions from the last DAYS days'
+                                 ' (default 30)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of rows deleted per transaction')
+        parser.add_argument('--sleep', type=float, default=0.1,
+                            help='Seconds to pause between batches, to let'
+                                 ' other queries through')
+        parser.add_argument('--dry-run', action='store_true', default=False,
+                            help="Report what would be pruned, but don't"
+                                 " delete anything")
+
+    def _delete_in_batches(self, queryset, pks, options):
+        batch_size = options['batch_size']
+        for i in range(0, len(pks), batch_size):
+            with transaction.atomic():
+                queryset.filter(pk__in=pks[i:i + batch_size]).delete()
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(days=options['days'])
+        # Only objects with history older than the cutoff can be pruned
+        old_versions = Version.objects.filter(
+            revision__date_created__lt=cutoff)
+        content_types = old_versions.order_by().values_list(
+            'content_type', flat=True).distinct()
+
+        prune = []
+        for content_type in list(content_types):
+            model = ContentType.objects.get_for_id(content_type).model_class()
+            fields = tuple(field for field in TRANSITION_FIELDS
+                           if model is not None and
+                           field in [f.name for f in model._meta.fields])
+            object_ids = old_versions.filter(
+                content_type=content_type).order_by().values_list(
+                    'object_id', flat=True).distinct()
+            versions = Version.objects.filter(content_type=content_type,
+                                              object_id__in=object_ids)
+            if not fields:
+                versions = versions.defer('serialized_data')
+            versions = versions.select_related('revision').order_by(
+                'db', 'object_id', 'pk')
+            for key, group in groupby(versions.iterator(),
+                                      lambda v: (v.db, v.object_id)):
+                prune.extend(versions_to_prune(group, cutoff, fields))
+
+        if options['dry_run']:
+            self.stdout.write('Would prune %d versions' % len(prune))
+            return
+
+        self._delete_in_batches(Version.objects.all(), prune, options)
+        # Revisions that no longer have any versions are empty
+        empty = list(Revision.objects.filter(
+            version__isnull=True).values_list('pk', flat=True))
+        self._delete_in_batches(Revision.objects.all(), empty, options)
+        self.stdout.write('Pruned %d versions and %d empty revisions'
+                          % (len(prune), len(empty)))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from wafer.users.models import UserProfile, refresh_registered
+
+
+class Command(BaseCommand):
+    help = ("Recompute every user's registration status. Run this after"
+            " changing WAFER_REGISTRATION_MODE or the registration form.")
+
+    def handle(self, *args, **options):
+        refresh_registered()
+        registered = UserProfile.objects.filter(registered=True).count()
+        self.stdout.write('%d users are registered' % registered)
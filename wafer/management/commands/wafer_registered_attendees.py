@@ -1,12 +1,15 @@
 import codecs
+import json
 import sys
 
 from django.conf import settings
 from django.contrib.auth.models import Group
 from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils.module_loading import import_string
 
-from wafer.users.models import UserProfile
+from wafer.tickets.models import Ticket
+from wafer.users.models import UserProfile, get_registration_data
 
 if sys.version_info >= (3,):
     import csv
@@ -15,10 +18,18 @@ else:
 
 
 class RegisteredUserList(object):
+    """Lists registered attendees.
+
+       Registered people are read in chunks, ordered by username, and each
+       chunk's registration data is loaded with one query, so the number
+       of queries only grows with the number of chunks."""
+
+    chunk_size = 1000
+
     def fields(self):
         return ('username', 'name', 'email')
 
-    def details(self, person):
+    def details(self, person, data):
         user = person.user
         return (
             user.username,
@@ -26,13 +37,29 @@ class RegisteredUserList(object):
             user.email,
         )
 
-    def attendees(self):
-        people = UserProfile.objects.all().order_by(
-            'user__username').prefetch_related('user', 'kv')
+    def load_data(self, people):
+        """Return the registration data for a chunk of people, by pk."""
+        return {}
+
+    def chunks(self):
+        people = UserProfile.objects.filter(registered=True).select_related(
+            'user').order_by('user__username')
+        last = None
+        while True:
+            chunk = people
+            if last is not None:
+                chunk = chunk.filter(user__username__gt=last)
+            chunk = list(chunk[:self.chunk_size])
+            if not chunk:
+                return
+            yield chunk
+            last = chunk[-1].user.username
 
-        for person in people:
-            if person.is_registered():
-                yield self.details(person)
+    def attendees(self):
+        for people in self.chunks():
+            data = self.load_data(people)
+            for person in people:
+                yield self.details(person, data.get(person.pk))
 
 
 class TicketRegisteredUserList(RegisteredUserList):
@@ -40,12 +67,22 @@ class TicketRegisteredUserList(RegisteredUserList):
         return super(TicketRegisteredUserList, self).fields() + (
             'ticket_type', 'ticket_barcode')
 
-    def details(self, person):
-        ticket = person.user.ticket.first()
+    def load_data(self, people):
+        profiles = dict((person.user_id, person.pk) for person in people)
+        tickets = {}
+        for ticket in Ticket.objects.filter(
+                user__in=list(profiles)).select_related('type').order_by(
+                    'barcode'):
+            # Only the first ticket, by barcode
+            tickets.setdefault(profiles[ticket.user_id], ticket)
+        return tickets
+
+    def details(self, person, ticket):
         details = (None, None)
         if ticket:
             details = (ticket.type.name, ticket.barcode)
-        return super(TicketRegisteredUserList, self).details(person) + details
+        return super(TicketRegisteredUserList, self).details(
+            person, ticket) + details
 
 
 class FormRegisteredUserList(RegisteredUserList):
@@ -58,35 +95,52 @@ class FormRegisteredUserList(RegisteredUserList):
         return super(FormRegisteredUserList, self).fields() + tuple(
             self.form.fields.keys())
 
-    def _iter_details(self, registration_data):
-        for field in self.form.fields.keys():
-            item = registration_data.filter(key=field).first()
-            if item:
-                yield item.value
-            else:
-                yield None
+    def load_data(self, people):
+        return get_registration_data(people, self.group)
 
-    def details(self, person):
-        registration_data = person.kv.filter(group=self.group)
-        details = tuple(self._iter_details(registration_data))
-        return super(FormRegisteredUserList, self).details(person) + details
+    def details(self, person, data):
+        data = data or {}
+        details = tuple(data.get(field) for field in self.form.fields.keys())
+        return super(FormRegisteredUserList, self).details(
+            person, data) + details
 
 
 class Command(BaseCommand):
     help = "Dump attendee registration information"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=('csv', 'json'),
+                            default='csv',
+                            help='Output format (default csv)')
+
     def handle(self, *args, **options):
         stream_writer = codecs.getwriter('utf-8')
         bytestream = getattr(sys.stdout, 'buffer', sys.stdout)
-        csv_file = csv.writer(stream_writer(bytestream))
+        output = stream_writer(bytestream)
 
         if settings.WAFER_REGISTRATION_MODE == 'ticket':
             user_list = TicketRegisteredUserList()
         elif settings.WAFER_REGISTRATION_MODE == 'form':
             user_list = FormRegisteredUserList()
         else:
-            raise NotImplemented('Unknown WAFER_REGISTRATION_MODE')
+            raise NotImplementedError('Unknown WAFER_REGISTRATION_MODE')
 
-        csv_file.writerow(user_list.fields())
+        if options['format'] == 'json':
+            self._write_json(output, user_list)
+        else:
+            csv_file = csv.writer(output)
+            csv_file.writerow(user_list.fields())
+            for row in user_list.attendees():
+                csv_file.writerow(row)
+
+    def _write_json(self, output, user_list):
+        # A list of objects, written one at a time
+        fields = user_list.fields()
+        output.write('[')
+        separator = '\n'
         for row in user_list.attendees():
-            csv_file.writerow(row)
+            output.write(separator)
+            output.write(json.dumps(dict(zip(fields, row)),
+                                    cls=DjangoJSONEncoder, sort_keys=True))
+            separator = ',\n'
+        output.write('\n]\n')
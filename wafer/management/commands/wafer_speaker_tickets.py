@@ -5,6 +5,8 @@ from django.core.management.base import BaseCommand
 
 from django.contrib.auth import get_user_model
 from wafer.talks.models import ACCEPTED
+from wafer.tickets.models import Ticket
+from wafer.users.models import UserProfile
 
 
 class Command(BaseCommand):
@@ -18,7 +20,17 @@ class Command(BaseCommand):
 
     def _speaker_tickets(self, options):
         people = get_user_model().objects.filter(
-            talks__isnull=False).distinct()
+            talks__isnull=False).distinct().select_related('userprofile')
+
+        # Tickets bought with a speaker's email address, that nobody has
+        # claimed yet
+        unclaimed = {}
+        for barcode, email in Ticket.objects.filter(
+                user=None, search_email__in=UserProfile.objects.filter(
+                    user__in=people).exclude(search_email='').values(
+                        'search_email')).order_by('barcode').values_list(
+                            'barcode', 'search_email'):
+            unclaimed.setdefault(email, barcode)
 
         csv_file = csv.writer(sys.stdout)
         for person in people:
@@ -34,6 +46,9 @@ class Command(BaseCommand):
             tickets = person.ticket.all()
             if tickets:
                 ticket = u'%d' % tickets[0].barcode
+            elif person.userprofile.search_email in unclaimed:
+                ticket = u'%d (UNCLAIMED)' % unclaimed[
+                    person.userprofile.search_email]
             else:
                 ticket = u'NO TICKET PURCHASED'
             row = [x.encode("utf-8") for x in (
@@ -1,17 +1,41 @@
+import json
+
 from django.core.management.base import BaseCommand
 
-from django.contrib.auth import get_user_model
+from wafer.stats import conference_statistics
 
 
 class Command(BaseCommand):
     help = "Misc stats."
 
-    def _speakers(self, *args, **kwargs):
-        return get_user_model().objects.filter(
-            contact_talks__isnull=False).filter(*args, **kwargs).count()
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', default=False,
+                            help='Output the statistics as JSON')
+
+    def _section(self, title, counts, indent='  '):
+        self.stdout.write('%s%s:' % (indent[2:], title))
+        for key, value in sorted(counts.items(), key=lambda x: str(x[0])):
+            if isinstance(value, dict):
+                self._section(key, value, indent + '  ')
+            else:
+                self.stdout.write('%s%s: %s' % (indent, key, value))
 
     def handle(self, *args, **options):
-        print("Speakers:\n")
+        stats = conference_statistics()
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2, sort_keys=True))
+            return
 
-        # FIXME: more stats - accepted, rejected, pending, etc.
-        print("  Total: %s" % self._speakers())
+        self._section('Talks', stats['talks'])
+        self._section('Speakers', stats['speakers'])
+        self._section('Registration', stats['registration'])
+        self._section('Tickets', stats['tickets'])
+        schedule = stats['schedule']
+        self.stdout.write('Schedule:')
+        self.stdout.write('  Slots: %(slots)s' % schedule)
+        self.stdout.write('  Filled: %(filled)s / %(available)s (%(pct).0f%%)'
+                          % dict(schedule, pct=schedule['fill_ratio'] * 100))
+        self.stdout.write('Sponsorship packages:')
+        for package in stats['sponsors']['packages']:
+            self.stdout.write('  %(name)s: %(claimed)s / %(available)s'
+                              % package)
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from django.contrib.auth import get_user_model
+from libravatar import parse_user_identity
+
+from wafer.users.avatars import resolve_avatar_server
+from wafer.utils import bump_cache_version
+
+
+class Command(BaseCommand):
+    help = ("Resolve the libravatar servers for speakers' email domains,"
+            " so rendering avatars never has to wait on DNS.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action="store_true",
+                            help='Resolve avatar servers for all users,'
+                                 ' not only speakers')
+
+    def handle(self, *args, **options):
+        people = get_user_model().objects.exclude(email='')
+        if not options['all']:
+            people = people.filter(talks__isnull=False)
+        emails = people.values_list('email', flat=True).distinct()
+
+        domains = set()
+        for email in emails.iterator():
+            domains.add(parse_user_identity(email, None)[1])
+
+        for domain in sorted(domains):
+            server = resolve_avatar_server(domain)
+            if options['verbosity'] > 1:
+                self.stdout.write('%s: %s' % (domain, server or 'default'))
+        # The speakers list includes avatar URLs
+        bump_cache_version('speakers')
+        self.stdout.write('Resolved avatar servers for %d domains'
+                          % len(domains))
@@ -1,27 +1,79 @@
 import copy
+import logging
+import threading
+import time
+from contextlib import contextmanager
 
-from django.core.cache import cache
+from django.core.cache import caches
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection
 from django.utils import six
 
+from wafer.utils import after_commit, bump_cache_version, get_cache_version
+
+logger = logging.getLogger(__name__)
+
 CACHE_KEY = "WAFER_MENU_CACHE"
+# Menus are rebuilt when their version changes, so this only bounds how
+# long unused versions linger in the cache
+CACHE_TIMEOUT = 24 * 60 * 60
+
+# The menu items of the current version, for this process
+_memo = {'version': None, 'items': None}
+_memo_lock = threading.Lock()
 
 
 def get_cached_menus():
-    """Return the menus from the cache or generate them if needed."""
-    items = cache.get(CACHE_KEY)
+    """Return the menus, generating them if needed.
+
+    The menus are shared through the WAFER_CACHE, under a version stamp
+    that clear_menu_cache() bumps, so every process sees changes. Each
+    process also keeps the current version's menus, so the usual cost is
+    only checking the version stamp.
+
+    The returned menu is shared, so don't modify it.
+    """
+    version = get_cache_version('menus')
+    with _memo_lock:
+        if _memo['version'] == version:
+            return Menu(_memo['items'])
+
+    cache = caches[settings.WAFER_CACHE]
+    key = '%s_%s' % (CACHE_KEY, version)
+    items = cache.get(key)
     if items is None:
-        menu = generate_menu()
-        cache.set(CACHE_KEY, menu.items)
-    else:
-        menu = Menu(items)
-    return menu
+        items = generate_menu().items
+        cache.set(key, items, CACHE_TIMEOUT)
+    with _memo_lock:
+        _memo['version'] = version
+        _memo['items'] = items
+    return Menu(items)
 
 
 def clear_menu_cache():
-    """Clear the cached version of the menu (if any)."""
-    cache.delete(CACHE_KEY)
+    """Invalidate the cached menus, in every process."""
+    bump_cache_version('menus')
+
+
+# Deferred menu refreshes, for this thread
+_deferred = threading.local()
+
+
+@contextmanager
+def defer_menu_refresh():
+    """Hold back menu refreshes until the end of the block, and then
+    refresh the menus once, if any were requested. For bulk changes."""
+    depth = getattr(_deferred, 'depth', 0)
+    if not depth:
+        _deferred.requested = False
+    _deferred.depth = depth + 1
+    try:
+        yield
+    finally:
+        _deferred.depth = depth
+    if not depth and _deferred.requested:
+        refresh_menu_cache()
 
 
 def refresh_menu_cache(**kwargs):
@@ -29,9 +81,15 @@ def refresh_menu_cache(**kwargs):
 
     Takes **kwargs to make it easier to use as a Django signal handler.
     """
+    if getattr(_deferred, 'depth', 0):
+        _deferred.requested = True
+        return
     try:
         clear_menu_cache()
         get_cached_menus()
+        # The version moves again on commit, as other processes may have
+        # cached the menus from before the commit
+        after_commit(get_cached_menus)
     except ObjectDoesNotExist as e:
         # During data loads, treat this as non-fatal, since we'll come back
         # here again with hopefully all the stuff required loaded eventually
@@ -64,11 +122,28 @@ def maybe_obj(str_or_obj):
 
 
 def generate_menu():
-    """Generate a new list of menus."""
+    """Generate a new list of menus.
+
+    The time taken, overall and by each dynamic menu function, is logged
+    at debug level, with the number of queries when they are recorded.
+    """
+    start = time.time()
     root_menu = Menu(list(copy.deepcopy(settings.WAFER_MENUS)))
+    timings = []
     for dynamic_menu_func in settings.WAFER_DYNAMIC_MENUS:
-        dynamic_menu_func = maybe_obj(dynamic_menu_func)
-        dynamic_menu_func(root_menu)
+        func_start = time.time()
+        # Queries are only recorded with DEBUG, or in a QueryTracker
+        queries = (len(connection.queries) if connection.queries_logged
+                   else None)
+        func = maybe_obj(dynamic_menu_func)
+        func(root_menu)
+        timing = '%s: %.1f ms' % (getattr(func, '__name__', func),
+                                  (time.time() - func_start) * 1000)
+        if queries is not None:
+            timing += ', %d queries' % (len(connection.queries) - queries)
+        timings.append(timing)
+    logger.debug('Generated menus in %.1f ms (%s)',
+                 (time.time() - start) * 1000, '; '.join(timings))
     return root_menu
 
 
@@ -131,7 +206,7 @@ class Menu(object):
     def add_item(self, label, url, menu=None, sort_key=None, image=None):
         menu_items = self._descend_items(menu)
         menu_items.append(self.mk_item(label, url, sort_key=sort_key,
-            image=image))
+                                       image=image))
 
     def add_menu(self, name, label, items, sort_key=None):
         self.items.append(self.mk_menu(name, label, items, sort_key=sort_key))
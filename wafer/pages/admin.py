@@ -3,6 +3,7 @@ from django.contrib import admin
 from wafer.pages.models import File, Page
 
 from wafer.compare.admin import CompareVersionAdmin, DateModifiedFilter
+from wafer.users.widgets import UserAutocompleteMultiple
 
 
 class PageAdmin(CompareVersionAdmin, admin.ModelAdmin):
@@ -12,6 +13,11 @@ class PageAdmin(CompareVersionAdmin, admin.ModelAdmin):
 
     list_filter = (DateModifiedFilter,)
 
+    def formfield_for_manytomany(self, db_field, request=None, **kwargs):
+        if db_field.name == 'people':
+            kwargs['widget'] = UserAutocompleteMultiple()
+        return super(PageAdmin, self).formfield_for_manytomany(
+            db_field, request, **kwargs)
 
 
 admin.site.register(Page, PageAdmin)
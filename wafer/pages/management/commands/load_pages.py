@@ -1,66 +1,166 @@
+import hashlib
+import json
+import multiprocessing
 import os
-import sys
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.management.base import BaseCommand
-from wafer.pages.models import Page
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from markitup.fields import render_func
+
+from wafer.menu import defer_menu_refresh, refresh_menu_cache
+from wafer.pages.models import Page, invalidate_page_caches, invalidate_pages
 import yaml
 
 
+class MissingFrontMatter(Exception):
+    pass
+
+
+def read_page(fn):
+    with open(fn) as f:
+        if f.readline() != '---\n':
+            raise MissingFrontMatter(fn)
+        front_matter = []
+        for line in f:
+            if line == '---\n':
+                break
+            front_matter.append(line)
+        meta = yaml.load(''.join(front_matter))
+        contents = f.read()
+    return meta, contents
+
+
+def render_page(content):
+    return render_func(content)
+
+
+def source_hash(name, content, include_in_menu, exclude_from_static,
+                people):
+    """Hash everything load_pages sets on a page, so a file and the page
+       loaded from it can be compared."""
+    source = json.dumps([name, content, bool(include_in_menu),
+                         bool(exclude_from_static), sorted(people)],
+                        sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+
 class Command(BaseCommand):
-    help = 'Load pages from markdown files into the DB'
+    help = ('Load pages from markdown files into the DB. Only pages that '
+            'differ from their files are written.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int,
+                            default=multiprocessing.cpu_count(),
+                            help='Number of processes used to parse and '
+                                 'render the files (default: one per CPU)')
 
     def handle(self, *args, **options):
-        for dirpath, dirnames, filenames in os.walk(settings.PAGE_DIR):
-            parent = self.get_parent(dirpath)
-            for fn in filenames:
-                if not fn.endswith('.md'):
-                    continue
-                slug = fn[:-3]
-                meta, content = self.read_page(os.path.join(dirpath, fn))
-                self.load_page(parent, slug, meta, content)
-
-    def get_parent(self, directory):
-        """
-        Given a directory name, return the Page representing it in the menu
-        heirarchy.
-        """
         assert settings.PAGE_DIR.startswith('/')
         assert settings.PAGE_DIR.endswith('/')
 
-        parents = directory[len(settings.PAGE_DIR):]
-
-        page = None
-        if parents:
-            for slug in parents.split('/'):
-                page = Page.objects.get(parent=page, slug=slug)
-        return page
-
-    def read_page(self, fn):
-        with open(fn) as f:
-            if f.readline() != '---\n':
-                self.stderr.write('Missing front matter in %s\n' % fn)
-                sys.exit(1)
-            front_matter = []
-            for line in f:
-                if line == '---\n':
-                    break
-                front_matter.append(line)
-            meta = yaml.load(''.join(front_matter))
-            contents = f.read()
-        return meta, contents
-
-    def load_page(self, parent, slug, meta, content):
-        page, created = Page.objects.get_or_create(parent=parent, slug=slug)
-        page.name = meta['name']
-        page.content = content
-        page.include_in_menu = meta.get('include_in_menu', False)
-        page.exclude_from_static = meta.get('exclude_from_static', False)
+        files = []
+        for dirpath, dirnames, filenames in os.walk(settings.PAGE_DIR):
+            # Parents before their children
+            dirnames.sort()
+            parent = dirpath[len(settings.PAGE_DIR):].strip('/') or None
+            for fn in sorted(filenames):
+                if fn.endswith('.md'):
+                    files.append((parent, fn[:-3], os.path.join(dirpath, fn)))
+
+        pool = None
+        if options['jobs'] > 1 and len(files) > 1:
+            pool = multiprocessing.Pool(options['jobs'])
+        map_ = pool.map if pool else map
+        try:
+            try:
+                sources = list(map_(read_page, [fn for _, _, fn in files]))
+            except MissingFrontMatter as e:
+                raise CommandError('Missing front matter in %s' % e)
+
+            manifest, self.pages = self.get_manifest()
+            changed = []
+            for (parent, slug, fn), (meta, content) in zip(files, sources):
+                path = '%s/%s' % (parent, slug) if parent else slug
+                people = [str(person) for person in meta.get('people', ())]
+                page_hash = source_hash(
+                    meta['name'], content, meta.get('include_in_menu'),
+                    meta.get('exclude_from_static'), people)
+                if manifest.get(path) != page_hash:
+                    changed.append((parent, slug, meta, content, people))
+
+            rendered = list(map_(render_page,
+                                 [content for _, _, _, content, _ in changed]))
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        users = self.get_users(set(
+            person for _, _, _, _, people in changed for person in people))
+
+        with defer_menu_refresh(), transaction.atomic():
+            for (parent, slug, meta, content, people), html in zip(
+                    changed, rendered):
+                self.load_page(parent, slug, meta, content, html,
+                               [users[person] for person in people])
+            if changed:
+                # Updates bypass post_save
+                invalidate_pages(Page)
+                refresh_menu_cache()
+
+        self.stdout.write('Loaded %d pages, %d unchanged\n'
+                          % (len(changed), len(files) - len(changed)))
+
+    def get_manifest(self):
+        """Return the source hashes of the pages in the DB, and their ids,
+           by path."""
+        people = {}
+        for page_id, username in Page.people.through.objects.values_list(
+                'page_id', 'user__username'):
+            people.setdefault(page_id, []).append(username)
+        manifest, page_ids = {}, {}
+        # Where there are duplicate paths, the oldest page is used
+        for page in Page.objects.order_by('-pk'):
+            manifest[page.path] = source_hash(
+                page.name, page.content.raw, page.include_in_menu,
+                page.exclude_from_static, people.get(page.pk, []))
+            page_ids[page.path] = page.pk
+        return manifest, page_ids
+
+    def get_users(self, usernames):
+        users = dict((user.username, user) for user in
+                     get_user_model().objects.filter(
+                         username__in=list(usernames)))
+        missing = set(usernames) - set(users)
+        if missing:
+            raise CommandError('Unknown people: %s'
+                               % ', '.join(sorted(missing)))
+        return users
+
+    def load_page(self, parent, slug, meta, content, html, people):
+        path = '%s/%s' % (parent, slug) if parent else slug
+        fields = {
+            'name': meta['name'],
+            'content': content,
+            '_content_rendered': html,
+            'include_in_menu': meta.get('include_in_menu', False),
+            'exclude_from_static': meta.get('exclude_from_static', False),
+        }
+        if path in self.pages:
+            page = Page(pk=self.pages[path])
+            # Already rendered, so skip save(), which would render again
+            Page.objects.filter(pk=page.pk).update(**fields)
+            invalidate_page_caches([page.pk])
+        else:
+            if parent is not None and parent not in self.pages:
+                raise CommandError('No page for the directory %s' % parent)
+            page = Page(parent_id=self.pages.get(parent), slug=slug,
+                        **fields)
+            page.save()
+            self.pages[path] = page.pk
         page.people.clear()
-        page.people.add(*(
-            get_user_model().objects.get(username=person)
-            for person in meta.get('people', ())
-        ))
-        page.save()
-        self.stdout.write('Loaded page %s\n' % '/'.join(page.get_path()))
+        page.people.add(*people)
+        self.stdout.write('Loaded page %s\n' % path)
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def fill_paths(apps, schema_editor):
+    # Use apps to ensure we have the correct version
+    Page = apps.get_model('pages', 'Page')
+    pages = dict((pk, (parent, slug)) for pk, parent, slug in
+                 Page.objects.values_list('pk', 'parent', 'slug'))
+
+    def path(pk):
+        slugs, seen = [], set()
+        while pk is not None and pk not in seen:
+            seen.add(pk)
+            parent, slug = pages[pk]
+            slugs.insert(0, slug)
+            pk = parent
+        return '/'.join(slugs)
+
+    for pk in pages:
+        Page.objects.filter(pk=pk).update(path=path(pk))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0004_allow_blank_files_description'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='path',
+            field=models.CharField(default='', max_length=1024, db_index=True, editable=False),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
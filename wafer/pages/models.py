@@ -1,4 +1,5 @@
 import logging
+import threading
 logger = logging.getLogger(__name__)
 
 from django.utils.translation import ugettext_lazy as _
@@ -6,12 +7,14 @@ from django.core.urlresolvers import reverse
 from django.core.exceptions import ValidationError, NON_FIELD_ERRORS
 from django.conf import settings
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
 from django.utils.encoding import python_2_unicode_compatible
 
 
 from markitup.fields import MarkupField
-from wafer.menu import MenuError, refresh_menu_cache
+from wafer.menu import MenuError, defer_menu_refresh, refresh_menu_cache
+from wafer.utils import bump_cache_version, get_cache_version
 
 
 @python_2_unicode_compatible
@@ -51,10 +54,53 @@ class Page(models.Model):
         help_text=_("People associated with this page for display in the"
                     " schedule (Session chairs, panelists, etc.)"))
 
+    # The slugs of the page and its parents, joined by '/', kept in sync
+    # on save, so URLs can be resolved with a single lookup.
+    path = models.CharField(max_length=1024, db_index=True, default='',
+                            editable=False)
+
     def __str__(self):
         return u'%s' % (self.name,)
 
+    def save(self, *args, **kwargs):
+        old_path = None
+        if self.pk is not None:
+            old_path = Page.objects.filter(pk=self.pk).values_list(
+                'path', flat=True).first()
+        parent_path = None
+        if self.parent_id is not None:
+            parent_path = Page.objects.values_list(
+                'path', flat=True).get(pk=self.parent_id)
+        self.path = _join_path(parent_path, self.slug)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(
+                ['slug', 'parent']) & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | set(['path'])
+        # Hold the post_save menu refresh back until the descendants have
+        # moved, so the menus are only built once
+        with defer_menu_refresh():
+            super(Page, self).save(*args, **kwargs)
+            if old_path is not None and old_path != self.path:
+                self._update_descendant_paths()
+                bump_cache_version('pages')
+
+    def _update_descendant_paths(self):
+        paths = {self.pk: self.path}
+        parents = [self.pk]
+        while parents:
+            children = list(Page.objects.filter(
+                parent__in=parents).exclude(pk__in=list(paths)).values_list(
+                    'pk', 'parent', 'slug', 'path'))
+            for pk, parent, slug, path in children:
+                paths[pk] = _join_path(paths[parent], slug)
+                if paths[pk] != path:
+                    Page.objects.filter(pk=pk).update(path=paths[pk])
+            parents = [child[0] for child in children]
+
     def get_path(self):
+        if self.path:
+            # Kept up to date on save, so this needs no queries
+            return self.path.split('/')
         path, parent = [self.slug], self.parent
         while parent is not None:
             path.insert(0, parent.slug)
@@ -62,10 +108,10 @@ class Page(models.Model):
         return path
 
     def get_absolute_url(self):
-        if self.slug == 'index' and not self.parent:
+        if self.slug == 'index' and self.parent_id is None:
             return reverse('wafer_page')
 
-        url = "/".join(self.get_path())
+        url = self.path or "/".join(self.get_path())
         return reverse('wafer_page', args=(url,))
 
     get_absolute_url.short_description = 'page url'
@@ -122,9 +168,85 @@ class Page(models.Model):
         return super(Page, self).validate_unique(exclude)
 
 
+def _join_path(parent_path, slug):
+    if parent_path is None:
+        return slug
+    return u'%s/%s' % (parent_path, slug)
+
+
+# Path to page id, for every page, as of a version of the 'pages' cache
+# version stamp.
+_page_ids = {'version': None, 'ids': {}}
+_page_ids_lock = threading.Lock()
+
+
+def get_page_id(path):
+    """Return the id of the page with the given path (slugs joined by '/'),
+       or None.
+
+       Every page's path is loaded with a single query, and kept in this
+       process until a page changes, so resolving a URL, even one that
+       doesn't exist, only costs a check of the version stamp."""
+    version = get_cache_version('pages')
+    with _page_ids_lock:
+        if _page_ids['version'] == version:
+            return _page_ids['ids'].get(path)
+    # Where there are duplicate paths, the oldest page wins
+    ids = dict(Page.objects.order_by('-pk').values_list('path', 'pk'))
+    with _page_ids_lock:
+        _page_ids['version'] = version
+        _page_ids['ids'] = ids
+    return ids.get(path)
+
+
+def invalidate_pages(sender, **kwargs):
+    bump_cache_version('pages')
+
+
+def get_page_cache_version(page_id):
+    """Version of the rendered page, as anonymous users see it."""
+    return get_cache_version('page_%s' % page_id)
+
+
+def invalidate_page_caches(page_ids):
+    for page_id in set(page_ids):
+        bump_cache_version('page_%s' % page_id)
+
+
+def _file_page_ids(file_id):
+    return Page.files.through.objects.filter(
+        file_id=file_id).values_list('page_id', flat=True)
+
+
+def invalidate_page_cache(sender, instance, **kwargs):
+    invalidate_page_caches([instance.pk])
+
+
+def invalidate_file_pages(sender, instance, **kwargs):
+    invalidate_page_caches(_file_page_ids(instance.pk))
+
+
+def invalidate_related_pages(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    if not reverse:
+        # page.files or page.people changed
+        if action.startswith('post_'):
+            invalidate_page_caches([instance.pk])
+    elif action == 'pre_clear':
+        # We won't know which pages they were afterwards
+        invalidate_page_caches(instance.pages.values_list('pk', flat=True))
+    elif action.startswith('post_') and pk_set:
+        invalidate_page_caches(pk_set)
+
+
 def page_menus(root_menu):
-    """Add page menus."""
-    for page in Page.objects.filter(include_in_menu=True):
+    """Add page menus.
+
+    This is a single query, as the pages' URLs come from their stored
+    paths."""
+    pages = Page.objects.filter(include_in_menu=True).only(
+        'name', 'slug', 'parent', 'path').order_by('pk')
+    for page in pages:
         path = page.get_path()
         menu = path[0] if len(path) > 1 else None
         try:
@@ -135,3 +257,13 @@ def page_menus(root_menu):
 
 
 post_save.connect(refresh_menu_cache, sender=Page)
+post_delete.connect(refresh_menu_cache, sender=Page)
+post_save.connect(invalidate_pages, sender=Page)
+post_delete.connect(invalidate_pages, sender=Page)
+post_save.connect(invalidate_page_cache, sender=Page)
+post_delete.connect(invalidate_page_cache, sender=Page)
+post_save.connect(invalidate_file_pages, sender=File)
+# The links to the pages are gone by post_delete
+pre_delete.connect(invalidate_file_pages, sender=File)
+m2m_changed.connect(invalidate_related_pages, sender=Page.files.through)
+m2m_changed.connect(invalidate_related_pages, sender=Page.people.through)
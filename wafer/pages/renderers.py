@@ -6,11 +6,11 @@ class PagesRenderer(StaticSiteRenderer):
     def get_paths(self):
         paths = []
 
-        items = Page.objects.all()
+        # Container pages are excluded. URLs come from the stored paths,
+        # so this is a single query.
+        items = Page.objects.filter(exclude_from_static=False).only(
+            'slug', 'parent', 'path')
         for item in items:
-            if item.exclude_from_static:
-                # Container page
-                continue
             url = item.get_absolute_url()
             paths.append(url)
         return paths
@@ -0,0 +1,127 @@
+"""Tests for the load_pages management command."""
+
+import os
+import shutil
+import tempfile
+from unittest import skipIf
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import Client, TestCase
+from django.utils.six import StringIO
+
+import mock
+
+from wafer.menu import get_cached_menus
+from wafer.pages.models import Page
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+@skipIf(yaml is None, 'PyYAML is not installed')
+class LoadPagesTests(TestCase):
+    def setUp(self):
+        self.page_dir = tempfile.mkdtemp() + '/'
+        self.addCleanup(shutil.rmtree, self.page_dir)
+        settings = self.settings(PAGE_DIR=self.page_dir)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        get_user_model().objects.create_user('speaker', 'speaker@example.com',
+                                             'password')
+        self.write('index.md', 'Index', 'Welcome')
+        self.write('about.md', 'About', 'About us', include_in_menu=True)
+        self.write('about/venue.md', 'Venue', 'The *venue*',
+                   people=['speaker'])
+
+    def write(self, fn, name, content, **meta):
+        meta['name'] = name
+        path = os.path.join(self.page_dir, fn)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write('---\n%s---\n%s' % (yaml.safe_dump(meta), content))
+
+    def load(self):
+        stdout = StringIO()
+        call_command('load_pages', jobs=1, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_load(self):
+        self.assertIn('Loaded 3 pages, 0 unchanged', self.load())
+        venue = Page.objects.get(path='about/venue')
+        self.assertEqual(venue.parent, Page.objects.get(path='about'))
+        self.assertEqual(venue.content.raw, 'The *venue*')
+        self.assertIn('<em>venue</em>', venue.content.rendered)
+        self.assertEqual([user.username for user in venue.people.all()],
+                         ['speaker'])
+        self.assertTrue(Page.objects.get(path='about').include_in_menu)
+
+    def test_unchanged(self):
+        self.load()
+        with mock.patch('wafer.pages.models.Page.save') as save:
+            output = self.load()
+        self.assertIn('Loaded 0 pages, 3 unchanged', output)
+        self.assertFalse(save.called)
+
+    def test_changed(self):
+        self.load()
+        pks = dict(Page.objects.values_list('path', 'pk'))
+        self.write('about/venue.md', 'Venue', 'A *new* venue')
+        output = self.load()
+        self.assertIn('Loaded page about/venue', output)
+        self.assertIn('Loaded 1 pages, 2 unchanged', output)
+        venue = Page.objects.get(path='about/venue')
+        self.assertEqual(venue.pk, pks['about/venue'])
+        self.assertIn('<em>new</em>', venue.content.rendered)
+        self.assertEqual(list(venue.people.all()), [])
+        self.assertEqual(dict(Page.objects.values_list('path', 'pk')), pks)
+
+    def test_edited_in_db(self):
+        self.load()
+        page = Page.objects.get(path='index')
+        page.content = 'Edited'
+        page.save()
+        self.assertIn('Loaded 1 pages, 2 unchanged', self.load())
+        self.assertEqual(Page.objects.get(path='index').content.raw,
+                         'Welcome')
+
+    def test_menu_refreshed_once(self):
+        self.write('about/travel.md', 'Travel', 'Getting here')
+        with mock.patch('wafer.menu.clear_menu_cache') as clear:
+            self.load()
+        self.assertEqual(clear.call_count, 1)
+
+    def test_renamed_menu_page(self):
+        self.load()
+        self.assertEqual([item['label'] for item in get_cached_menus().items],
+                         ['About'])
+        # Only updates, so no post_save
+        self.write('about.md', 'About Us', 'About us', include_in_menu=True)
+        self.assertIn('Loaded 1 pages, 2 unchanged', self.load())
+        self.assertEqual([item['label'] for item in get_cached_menus().items],
+                         ['About Us'])
+
+    def test_changed_page_and_menu_invalidated(self):
+        self.load()
+        self.assertIn(b'About', Client().get('/').content)
+        self.write('about.md', 'About Us', 'About us', include_in_menu=True)
+        self.write('index.md', 'Index', 'Welcome back')
+        self.load()
+        content = Client().get('/').content
+        self.assertIn(b'Welcome back', content)
+        self.assertIn(b'About Us', content)
+
+    def test_unknown_person(self):
+        self.write('index.md', 'Index', 'Welcome', people=['nobody'])
+        with self.assertRaises(CommandError):
+            self.load()
+        self.assertFalse(Page.objects.exists())
+
+    def test_missing_front_matter(self):
+        with open(os.path.join(self.page_dir, 'bad.md'), 'w') as f:
+            f.write('No front matter')
+        with self.assertRaises(CommandError):
+            self.load()
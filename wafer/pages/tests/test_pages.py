@@ -1,11 +1,23 @@
 # Simple test of the edit logic around pages
 
+import datetime
+from unittest import skipUnless
+
+from django.db import transaction
 from django.test import Client, TestCase
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
 
-from wafer.pages.models import Page
+import mock
+from reversion import revisions
+from reversion.models import Version
+
+from wafer.compare.admin import cached_diff, modified_since
+from wafer.pages import models as page_models
+from wafer.pages.models import File, Page, get_page_id
+from wafer.sponsors.models import Sponsor, SponsorshipPackage
+from wafer.utils import get_cache_version
 
 
 class PageEditTests(TestCase):
@@ -88,3 +100,200 @@ class PageEditTests(TestCase):
         templates = [x.name for x in response.templates]
         self.assertTrue('wafer.pages/page_form.html' in templates)
         self.assertEqual(response.status_code, 200)
+
+
+class PageCompareTests(TestCase):
+
+    def setUp(self):
+        UserModel = get_user_model()
+        self.user = UserModel.objects.create_superuser('compare', 'c@test',
+                                                       'aaaa')
+        self.page = Page.objects.create(name="compare", slug="compare")
+        for content in ('first version', 'second version', 'third version'):
+            with revisions.create_revision():
+                self.page.content = content
+                self.page.save()
+        self.client = Client()
+        self.client.login(username='compare', password='aaaa')
+
+    def test_compare_latest(self):
+        response = self.client.get('/compare/', {'compare': '',
+                                                 'version': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['next'], None)
+        self.assertEqual(response.context['prev'], 2)
+        fields = dict(response.context['diff_list'])
+        self.assertIn('<del style="background:#ffe6e6;">secon</del>',
+                      fields['content'])
+        self.assertIn('<ins style="background:#e6ffe6;">thir</ins>',
+                      fields['content'])
+
+    def test_compare_out_of_range(self):
+        response = self.client.get('/compare/', {'compare': '',
+                                                 'version': '5'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['diff_list'], None)
+
+    def test_diff_is_cached(self):
+        versions = Version.objects.get_for_object(self.page)
+        current, previous = versions[0], versions[1]
+        the_diff = cached_diff(current, previous)
+        with mock.patch('wafer.compare.admin.make_diff') as make_diff:
+            self.assertEqual(cached_diff(current, previous), the_diff)
+        self.assertFalse(make_diff.called)
+
+    def test_modified_since(self):
+        Page.objects.create(name="no history", slug="no_history")
+        today = datetime.date.today()
+        self.assertEqual(
+            list(modified_since(Page.objects.all(), today)), [self.page])
+        self.assertEqual(
+            list(modified_since(Page.objects.all(),
+                                today + datetime.timedelta(days=2))), [])
+
+
+class PagePathTests(TestCase):
+    def setUp(self):
+        self.a = Page.objects.create(name='A', slug='a')
+        self.b = Page.objects.create(name='B', slug='b', parent=self.a)
+        self.c = Page.objects.create(name='C', slug='c', parent=self.b)
+
+    def paths(self):
+        return dict(Page.objects.values_list('slug', 'path'))
+
+    def test_paths(self):
+        self.assertEqual(self.paths(), {'a': 'a', 'b': 'a/b', 'c': 'a/b/c'})
+
+    def test_moves_update_descendants(self):
+        self.a.slug = 'x'
+        self.a.save()
+        self.assertEqual(self.paths(), {'x': 'x', 'b': 'x/b', 'c': 'x/b/c'})
+        self.b.parent = None
+        self.b.save()
+        self.assertEqual(self.paths(), {'x': 'x', 'b': 'b', 'c': 'b/c'})
+
+    def test_lookup(self):
+        self.assertEqual(get_page_id('a/b/c'), self.c.pk)
+        # Only the version check
+        with self.assertNumQueries(1):
+            self.assertEqual(get_page_id('a/b'), self.b.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_page_id('a/b/nope'), None)
+
+    def test_views(self):
+        client = Client()
+        response = client.get('/a/b/c/')
+        self.assertEqual(response.context['object'], self.c)
+        self.assertEqual(client.get('/a//b/').context['object'], self.b)
+        self.assertEqual(client.get('/a/c/').status_code, 404)
+
+        self.b.slug = 'renamed'
+        self.b.save()
+        self.assertEqual(client.get('/a/b/c/').status_code, 404)
+        self.assertEqual(client.get('/a/renamed/c/').context['object'],
+                         self.c)
+        self.c.delete()
+        self.assertEqual(client.get('/a/renamed/c/').status_code, 404)
+
+    @skipUnless(hasattr(transaction, 'on_commit'),
+                'Django 1.8 has no on_commit')
+    def test_lookups_rebuilt_after_commit(self):
+        callbacks = []
+        with mock.patch('django.db.transaction.on_commit',
+                        callbacks.append):
+            Page.objects.create(name='D', slug='d', parent=self.c)
+        # What another process would have memoized before the commit
+        page_models._page_ids.update(version=get_cache_version('pages'),
+                                     ids={})
+        self.assertEqual(get_page_id('a/b/c/d'), None)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(get_page_id('a/b/c/d'),
+                         Page.objects.get(slug='d').pk)
+
+    def test_urls_need_no_queries(self):
+        page = Page.objects.get(pk=self.c.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(page.get_path(), ['a', 'b', 'c'])
+            self.assertEqual(page.get_absolute_url(), '/a/b/c/')
+
+
+class ShowPageCacheTests(TestCase):
+    def setUp(self):
+        self.page = Page.objects.create(name='Venue', slug='venue',
+                                        content='The *venue*')
+
+    def get(self, client=None, **extra):
+        response = (client or Client()).get('/venue/', **extra)
+        self.assertIn(response.status_code, (200, 304))
+        return response
+
+    def test_etag(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get()['ETag'], etag)
+        self.assertFalse(etag.startswith('W/'))
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_cached_html(self):
+        first = self.get()
+        self.assertIn(b'<em>venue</em>', first.content)
+        # Bypasses the signals, so the cached page is still used
+        Page.objects.filter(pk=self.page.pk).update(content='Sneaky')
+        second = self.get()
+        self.assertEqual(second.templates, [])
+        self.assertEqual(second.content, first.content)
+
+    def test_save_invalidates(self):
+        etag = self.get()['ETag']
+        self.page.content = 'A *new* venue'
+        self.page.save()
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn(b'<em>new</em>', response.content)
+
+    def test_related_changes_invalidate(self):
+        etags = [self.get()['ETag']]
+        user = get_user_model().objects.create_user('chair')
+        self.page.people.add(user)
+        etags.append(self.get()['ETag'])
+        user.pages.clear()
+        etags.append(self.get()['ETag'])
+        page_file = File.objects.create(name='map', item='pages_files/map')
+        self.page.files.add(page_file)
+        etags.append(self.get()['ETag'])
+        page_file.description = 'Map'
+        page_file.save()
+        etags.append(self.get()['ETag'])
+        self.assertEqual(len(set(etags)), len(etags))
+
+    def test_sponsors_invalidate(self):
+        etag = self.get()['ETag']
+        package = SponsorshipPackage.objects.create(
+            name='Gold', price=1000, short_description='Gold')
+        self.assertNotEqual(self.get()['ETag'], etag)
+        etag = self.get()['ETag']
+        sponsor = Sponsor.objects.create(name='Sponsor')
+        sponsor.packages.add(package)
+        response = self.get()
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn(b'Sponsor', response.content)
+
+    def test_menus_invalidate(self):
+        etag = self.get()['ETag']
+        Page.objects.create(name='Travel', slug='travel', content='',
+                            include_in_menu=True)
+        response = self.get()
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn(b'/travel/', response.content)
+
+    def test_logged_in(self):
+        get_user_model().objects.create_user('user', password='password')
+        client = Client()
+        client.login(username='user', password='password')
+        self.get()
+        response = self.get(client)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(response.context['object'], self.page)
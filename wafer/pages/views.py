@@ -1,5 +1,12 @@
-from django.http import Http404
+import hashlib
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+from django.http import Http404, HttpResponse
 from django.core.exceptions import PermissionDenied
+from django.utils import translation
+from django.views.decorators.http import condition
 from django.views.generic import DetailView, TemplateView, UpdateView
 
 from reversion import revisions
@@ -7,17 +14,57 @@ from reversion.models import Version
 from rest_framework import viewsets
 from rest_framework.permissions import DjangoModelPermissionsOrAnonReadOnly
 
-from wafer.compare.admin import make_diff, get_author, get_date
+from wafer.compare.admin import (
+    cached_diff, get_author, get_date, versions_for_compare)
 
-from wafer.pages.models import Page
+from wafer.pages.models import Page, get_page_id
 from wafer.pages.serializers import PageSerializer
 from wafer.pages.forms import PageForm
+from wafer.utils import get_cache_versions
+
+
+def page_etag(request, page_id):
+    """The ETag of the page, as anonymous users see it.
+
+       This changes whenever the page, the menus or the sponsors do, so it
+       also keys the cached HTML. None where the page is personal: for
+       logged in users, or when there are messages to show."""
+    if request.user.is_authenticated() or len(get_messages(request)):
+        return None
+    parts = get_cache_versions('page_%s' % page_id, 'menus', 'sponsors')
+    parts.extend([
+        page_id,
+        translation.get_language(),
+        request.GET.get('wafer_hide_navigation') == '1',
+    ])
+    return hashlib.md5(
+        '|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
 
 
 class ShowPage(DetailView):
     template_name = 'wafer.pages/page.html'
     model = Page
 
+    def get(self, request, *args, **kwargs):
+        etag = page_etag(request, kwargs['pk'])
+        if etag is None:
+            return super(ShowPage, self).get(request, *args, **kwargs)
+
+        @condition(etag_func=lambda request: etag)
+        def cached_page(request):
+            cache = caches[settings.WAFER_CACHE]
+            key = 'wafer_page_html_%s' % etag
+            content = cache.get(key)
+            if content is not None:
+                return HttpResponse(content)
+            response = super(ShowPage, self).get(request, *args, **kwargs)
+            response.render()
+            if response.status_code == 200:
+                cache.set(key, response.content, 24 * 60 * 60)
+            return response
+
+        return cached_page(request)
+
 
 class EditPage(UpdateView):
     template_name = 'wafer.pages/page_form.html'
@@ -38,74 +85,70 @@ class ComparePage(DetailView):
     def get_context_data(self, **kwargs):
         context = super(ComparePage, self).get_context_data(**kwargs)
 
-        versions = Version.objects.get_for_object(self.object)
+        versions = versions_for_compare(
+            Version.objects.get_for_object(self.object))
         # By revisions api definition, this is the most recent version
         current = versions[0]
-        context['cur_author'] = get_author(versions[0])
-        context['cur_date'] = get_date(versions[0])
+        context['cur_author'] = get_author(current)
+        context['cur_date'] = get_date(current)
         context['prev_author'] = None
         context['prev_date'] = None
         context['prev'] = None
         context['next'] = None
         context['diff_list'] = None
 
-        if len(versions) == 1:
-            # only 1 version, so short circuit everything
-            return context
         requested_version = int(self.request.GET.get('version', 1))
-        if requested_version > len(versions):
+        if requested_version < 1:
             # Incorrect data, so fail to sane state
             return context
+        # Only fetch the requested version, and whether there's one before
+        # it, rather than the whole history
+        window = list(versions[requested_version:requested_version + 2])
+        if not window:
+            # Only 1 version, or incorrect data, so fail to sane state
+            return context
         if requested_version == 1:
             # No next revision in this case
             context['next'] = None
         else:
             context['next'] = requested_version - 1
-        if requested_version >= len(versions) - 1:
+        if len(window) < 2:
             # No previous revision
             context['prev'] = None
         else:
             context['prev'] = requested_version + 1
 
-        previous = versions[requested_version]
+        previous = window[0]
         context['prev_author'] = get_author(previous)
         context['prev_date'] = get_date(previous)
 
-        context['diff_list'] = make_diff(current, previous)
+        context['diff_list'] = cached_diff(current, previous)
 
         return context
 
 
 def slug(request, url):
     """Look up a page by url (which is a tree of slugs)"""
-    page = None
-
-    if url:
-        for slug in url.split('/'):
-            if not slug:
-                continue
-            try:
-                page = Page.objects.get(slug=slug, parent=page)
-            except Page.DoesNotExist:
-                raise Http404
-    else:
-        try:
-            page = Page.objects.get(slug='index', parent=None)
-        except Page.DoesNotExist:
+    path = '/'.join(
+        segment for segment in (url or '').split('/') if segment)
+    page_id = get_page_id(path or 'index')
+    if page_id is None:
+        if not path:
             return TemplateView.as_view(
                 template_name='wafer/index.html')(request)
+        raise Http404
 
     if 'edit' in request.GET:
         if not request.user.has_perm('pages.change_page'):
             raise PermissionDenied
-        return EditPage.as_view()(request, pk=page.id)
+        return EditPage.as_view()(request, pk=page_id)
 
     if 'compare' in request.GET:
         if not request.user.has_perm('pages.change_page'):
             raise PermissionDenied
-        return ComparePage.as_view()(request, pk=page.id)
+        return ComparePage.as_view()(request, pk=page_id)
 
-    return ShowPage.as_view()(request, pk=page.id)
+    return ShowPage.as_view()(request, pk=page_id)
 
 
 class PageViewSet(viewsets.ModelViewSet):
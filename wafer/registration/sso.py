@@ -11,6 +11,7 @@ from django.db import IntegrityError
 import requests
 
 from wafer.kv.models import KeyValue
+from wafer.tickets.views import link_unclaimed_tickets
 
 MAX_APPEND = 20
 
@@ -72,6 +73,10 @@ def _configure_user(user, name, email, profile_fields):
             setattr(profile, k, v)
     profile.save()
 
+    # Tickets bought with this (SSO verified) address before the account
+    # existed
+    link_unclaimed_tickets([user.pk])
+
 
 def github_sso(code):
     r = requests.post('https://github.com/login/oauth/access_token', data={
@@ -139,8 +144,8 @@ def debian_sso(meta):
 
     user = None
     for kv in KeyValue.objects.filter(
-            group=group, key='debian_sso_email', value=email,
-            userprofile__isnull=False):
+            group=group, key='debian_sso_email',
+            userprofile__isnull=False).with_value(email):
         if kv.userprofile_set.count() > 1:
             message = 'Multiple accounts have Debian SSOed with address %s'
             log.warning(message, email)
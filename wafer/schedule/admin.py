@@ -197,8 +197,11 @@ class ScheduleItemAdminForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super(ScheduleItemAdminForm, self).__init__(*args, **kwargs)
+        # Talk labels include the corresponding author, so fetch them
+        # in the same query rather than one query per talk
         self.fields['talk'].queryset = Talk.objects.filter(
-            Q(status=ACCEPTED) | Q(status=CANCELLED))
+            Q(status=ACCEPTED) | Q(status=CANCELLED)).select_related(
+                'corresponding_author')
         # Present all pages as possible entries in the schedule
         self.fields['page'].queryset = Page.objects.all()
 
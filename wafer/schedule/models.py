@@ -198,9 +198,9 @@ class ScheduleItem(models.Model):
         return ''
 
     def get_url(self):
-        if self.talk:
+        if self.talk_id is not None:
             return self.talk.get_absolute_url()
-        elif self.page:
+        elif self.page_id is not None:
             return self.page.get_absolute_url()
         return None
 
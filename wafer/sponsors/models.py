@@ -2,10 +2,13 @@ from django.utils.translation import ugettext_lazy as _
 from django.core.urlresolvers import reverse
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.utils.encoding import python_2_unicode_compatible
 
 from markitup.fields import MarkupField
 
+from wafer.utils import bump_cache_version
+
 
 @python_2_unicode_compatible
 class File(models.Model):
@@ -86,3 +89,23 @@ class Sponsor(models.Model):
     @property
     def logo(self):
         return self.files.get(name='logo').item
+
+
+def invalidate_sponsors(sender, action=None, **kwargs):
+    """Invalidate the sponsors block, which is part of every cached page."""
+    if action is not None and action.startswith('pre_'):
+        # m2m_changed, we'll invalidate after the change
+        return
+    bump_cache_version('sponsors')
+
+
+post_save.connect(invalidate_sponsors, sender=File)
+post_delete.connect(invalidate_sponsors, sender=File)
+post_save.connect(invalidate_sponsors, sender=SponsorshipPackage)
+post_delete.connect(invalidate_sponsors, sender=SponsorshipPackage)
+post_save.connect(invalidate_sponsors, sender=Sponsor)
+post_delete.connect(invalidate_sponsors, sender=Sponsor)
+m2m_changed.connect(invalidate_sponsors,
+                    sender=SponsorshipPackage.files.through)
+m2m_changed.connect(invalidate_sponsors, sender=Sponsor.packages.through)
+m2m_changed.connect(invalidate_sponsors, sender=Sponsor.files.through)
@@ -0,0 +1,134 @@
+"""Conference statistics.
+
+Everything here is computed with grouped aggregate queries, so the number
+of queries is fixed, no matter how many talks, users or tickets there are.
+"""
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Case, Count, F, When
+
+from wafer.schedule.models import ScheduleItem, Slot, Venue
+from wafer.sponsors.models import SponsorshipPackage
+from wafer.talks.models import Talk, ACCEPTED
+from wafer.tickets.models import Ticket
+from wafer.users.models import UserProfile
+from wafer.utils import cache_result
+
+
+def _counts(queryset, field):
+    """Count the rows of queryset, grouped by field."""
+    return dict(
+        (row[field], row['count'])
+        for row in queryset.values(field).annotate(
+            count=Count('pk')).order_by())
+
+
+def talk_stats():
+    statuses = dict(Talk.TALK_STATUS)
+    by_status = _counts(Talk.objects.all(), 'status')
+    return {
+        'total': sum(by_status.values()),
+        'by_status': dict((statuses.get(status, status), count)
+                          for status, count in by_status.items()),
+        'by_type': dict((name or 'None', count) for name, count in
+                        _counts(Talk.objects.all(),
+                                'talk_type__name').items()),
+        'by_track': dict((name or 'None', count) for name, count in
+                         _counts(Talk.objects.all(),
+                                 'track__name').items()),
+    }
+
+
+def speaker_stats():
+    return Talk.authors.through.objects.aggregate(
+        total=Count('user', distinct=True),
+        accepted=Count(Case(When(talk__status=ACCEPTED, then=F('user'))),
+                       distinct=True))
+
+
+def registration_stats():
+    stats = {
+        'users': get_user_model().objects.count(),
+        'mode': settings.WAFER_REGISTRATION_MODE,
+    }
+    stats['registered'] = UserProfile.objects.filter(
+        registered=True).count()
+    return stats
+
+
+def ticket_stats():
+    by_type = {}
+    for row in Ticket.objects.values('type__name').annotate(
+            count=Count('pk'), claimed=Count('user'),
+            checked_in=Count('checked_in')).order_by():
+        by_type[row['type__name']] = {
+            'total': row['count'],
+            'claimed': row['claimed'],
+            'checked_in': row['checked_in'],
+        }
+    return {
+        'total': sum(t['total'] for t in by_type.values()),
+        'claimed': sum(t['claimed'] for t in by_type.values()),
+        'checked_in': sum(t['checked_in'] for t in by_type.values()),
+        'by_type': by_type,
+    }
+
+
+def schedule_stats():
+    # Resolve each slot's day through the previous_slot chains in memory
+    slots = dict((row[0], row[1:]) for row in
+                 Slot.objects.order_by().values_list(
+                     'pk', 'previous_slot', 'day'))
+
+    def slot_day(pk):
+        seen = set()
+        previous, day = slots[pk]
+        while previous is not None and previous not in seen:
+            seen.add(previous)
+            previous, day = slots[previous]
+        return day
+
+    slots_per_day = {}
+    for pk in slots:
+        day = slot_day(pk)
+        slots_per_day[day] = slots_per_day.get(day, 0) + 1
+
+    available = sum(slots_per_day.get(day, 0) for day in
+                    Venue.days.through.objects.values_list('day',
+                                                           flat=True))
+    filled = ScheduleItem.slots.through.objects.values(
+        'scheduleitem__venue', 'slot').distinct().count()
+    return {
+        'slots': len(slots),
+        'available': available,
+        'filled': filled,
+        'fill_ratio': float(filled) / available if available else 0.0,
+    }
+
+
+def sponsor_stats():
+    packages = SponsorshipPackage.objects.values(
+        'pk', 'name', 'number_available').annotate(claimed=Count('sponsors'))
+    return {'packages': [{
+        'name': package['name'],
+        'available': package['number_available'],
+        'claimed': package['claimed'],
+    } for package in packages]}
+
+
+def conference_statistics():
+    """All the conference statistics, as a JSON-serialisable dict."""
+    return {
+        'talks': talk_stats(),
+        'speakers': speaker_stats(),
+        'registration': registration_stats(),
+        'tickets': ticket_stats(),
+        'schedule': schedule_stats(),
+        'sponsors': sponsor_stats(),
+    }
+
+
+@cache_result('wafer_conference_statistics', 5 * 60)
+def cached_conference_statistics():
+    return conference_statistics()
@@ -7,11 +7,15 @@ from easy_select2 import select2_modelform_meta
 
 from wafer.compare.admin import CompareVersionAdmin, DateModifiedFilter
 from wafer.talks.models import TalkType, Talk, TalkUrl, Track, render_author
+from wafer.users.widgets import UserAutocomplete, UserAutocompleteMultiple
 
 
 class AdminTalkForm(forms.ModelForm):
 
     Meta = select2_modelform_meta(Talk)
+    # Don't inline every user on the site as an <option>
+    Meta.widgets['authors'] = UserAutocompleteMultiple()
+    Meta.widgets['corresponding_author'] = UserAutocomplete()
 
     def __init__(self, *args, **kwargs):
         super(AdminTalkForm, self).__init__(*args, **kwargs)
@@ -12,9 +12,9 @@ from crispy_forms.bootstrap import FormActions
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Submit, HTML
 from markitup.widgets import MarkItUpWidget
-from easy_select2.widgets import Select2Multiple
 
 from wafer.talks.models import Talk, TalkType, Track, render_author
+from wafer.users.widgets import UserAutocompleteMultiple
 
 
 def get_talk_form_class():
@@ -114,5 +114,5 @@ class TalkForm(forms.ModelForm):
         widgets = {
             'abstract': MarkItUpWidget(),
             'notes': forms.Textarea(attrs={'class': 'input-xxlarge'}),
-            'authors': Select2Multiple(),
+            'authors': UserAutocompleteMultiple(),
         }
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """Index reversion's version table by object.
+
+       reversion's own indexes lead with the db column, which doesn't
+       help DateModifiedFilter's per-object lookups on talks."""
+
+    dependencies = [
+        ('talks', '0013_talk_types_optional'),
+        ('reversion', '0001_initial'),
+    ]
+
+    operations = [
+        # Lists of statements, so they don't need splitting with sqlparse
+        migrations.RunSQL(
+            ['CREATE INDEX wafer_version_object_revision ON reversion_version'
+             ' (content_type_id, object_id, revision_id)'],
+            ['DROP INDEX wafer_version_object_revision']),
+    ]
@@ -2,12 +2,14 @@ from django.utils.translation import ugettext_lazy as _
 from django.core.urlresolvers import reverse
 from django.conf import settings
 from django.db import models
+from django.db.models import Q
 from django.utils.encoding import python_2_unicode_compatible
 from django.template.defaultfilters import slugify
 
 from markitup.fields import MarkupField
 
 from wafer.kv.models import KeyValue
+from wafer.utils import cached_on_user
 
 
 # constants to make things clearer elsewhere
@@ -24,6 +26,14 @@ def render_author(author):
     return '%s (%s)' % (author.userprofile.display_name(), author)
 
 
+@cached_on_user('_wafer_authored_talk_ids')
+def get_authored_talk_ids(user):
+    """Return the set of talk ids the user is an author of."""
+    return Talk.objects.filter(
+        Q(authors=user) | Q(corresponding_author=user)
+    ).values_list('talk_id', flat=True)
+
+
 @python_2_unicode_compatible
 class TalkType(models.Model):
     """A type of talk."""
@@ -188,10 +198,11 @@ class Talk(models.Model):
     cancelled = property(fget=lambda x: x.status == CANCELLED)
 
     def _is_among_authors(self, user):
-        if self.corresponding_author.username == user.username:
+        if user.id is None:
+            return False
+        if self.corresponding_author_id == user.id:
             return True
-        # not chaining with logical-or to avoid evaluation of the queryset
-        return self.authors.filter(username=user.username).exists()
+        return self.talk_id in get_authored_talk_ids(user)
 
     def can_view(self, user):
         if user.has_perm('talks.view_all_talks'):
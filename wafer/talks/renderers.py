@@ -1,6 +1,6 @@
 from django_medusa.renderers import StaticSiteRenderer
 from wafer.talks.models import Talk, ACCEPTED
-from wafer.talks.views import UsersTalks
+from wafer.talks.views import Speakers, UsersTalks
 from django.core.urlresolvers import reverse
 
 
@@ -20,6 +20,14 @@ class TalksRenderer(StaticSiteRenderer):
             paths.append(reverse('wafer_users_talks_page',
                                  kwargs={'page': page}))
         paths.append(reverse('wafer_talks_speakers'))
+        view = Speakers()
+        queryset = view.get_queryset()
+        paginate_by = view.get_paginate_by(queryset)
+        if paginate_by:
+            paginator = view.get_paginator(queryset, paginate_by)
+            for page in paginator.page_range:
+                paths.append(reverse('wafer_talks_speakers_page',
+                                     kwargs={'page': page}))
         return paths
 
 renderers = [TalksRenderer, ]
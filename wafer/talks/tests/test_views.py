@@ -1,5 +1,7 @@
 """Tests for wafer.talk views."""
 
+import json
+
 import mock
 
 from django.contrib.auth import get_user_model
@@ -83,6 +85,32 @@ class UsersTalksTests(TestCase):
                          set([self.talk_a, self.talk_r, self.talk_p,
                               self.talk_s, self.talk_u, self.talk_c]))
 
+    def test_author_sees_own_talks(self):
+        """Test that speakers also see their own talks."""
+        self.client.login(username='author_s', password='author_s_password')
+        response = self.client.get('/talks/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.context['talk_list']),
+                         set([self.talk_a, self.talk_s, self.talk_c]))
+
+
+class TalkPermissionCacheTests(TestCase):
+    def setUp(self):
+        self.talk_s = create_talk("Talk S", SUBMITTED, "author_s")
+        self.talk_r = create_talk("Talk R", REJECTED, "author_r")
+        self.co_author = create_user("co_author")
+        self.talk_s.authors.add(self.co_author)
+
+    def test_authorship_loaded_once(self):
+        user = get_user_model().objects.get(username='co_author')
+        # Load the authored talks and the user's permissions
+        self.assertTrue(self.talk_s.can_view(user))
+        with self.assertNumQueries(0):
+            self.assertTrue(self.talk_s.can_edit(user))
+            self.assertFalse(self.talk_r.can_view(user))
+            self.assertFalse(self.talk_r.can_edit(user))
+            self.assertTrue(self.talk_s.can_view(user))
+
 
 class TalkViewTests(TestCase):
     def setUp(self):
@@ -419,6 +447,51 @@ class SpeakerTests(TestCase):
     def test_view_seven_speakers(self):
         self.check_n_speakers(7, [(0, 4), (4, 7)])
 
+    @mock.patch('wafer.users.models.UserProfile.avatar_url', mock_avatar_url)
+    def test_status_change_updates_speakers(self):
+        response = self.client.get(reverse('wafer_talks_speakers'))
+        self.assertEqual(len(response.context["speaker_rows"][0]), 1)
+        self.talk_s.status = ACCEPTED
+        self.talk_s.save()
+        response = self.client.get(reverse('wafer_talks_speakers'))
+        self.assertEqual(response.context["speaker_rows"], [[
+            self.talk_a.corresponding_author.userprofile,
+            self.talk_s.corresponding_author.userprofile,
+        ]])
+
+    @mock.patch('wafer.users.models.UserProfile.avatar_url', mock_avatar_url)
+    def test_paginated_speakers(self):
+        for i in range(4):
+            create_talk("Talk %d" % i, ACCEPTED, "author_%d" % i)
+        with self.settings(WAFER_SPEAKERS_PAGINATE_BY=3):
+            response = self.client.get(reverse('wafer_talks_speakers'))
+            self.assertTrue(response.context['is_paginated'])
+            self.assertEqual(len(response.context["speaker_rows"][0]), 3)
+            response = self.client.get(
+                reverse('wafer_talks_speakers_page', kwargs={'page': 2}))
+            self.assertEqual(len(response.context["speaker_rows"][0]), 2)
+
+    @mock.patch('wafer.users.models.UserProfile.avatar_url', mock_avatar_url)
+    def test_speakers_json(self):
+        self.talk_a.authors.add(self.talk_r.corresponding_author)
+        response = self.client.get(reverse('wafer_talks_speakers_json'))
+        self.assertEqual(response.status_code, 200)
+        talk = {'title': 'Talk A', 'url': '/talks/%d/' % self.talk_a.pk}
+        speakers = json.loads(response.content.decode('utf-8'))['speakers']
+        self.assertEqual(speakers, [{
+            'username': 'author_a',
+            'name': 'author_a',
+            'url': '/users/author_a/',
+            'avatar': 'avatar-author_a@example.com',
+            'talks': [talk],
+        }, {
+            'username': 'author_r',
+            'name': 'author_r',
+            'url': '/users/author_r/',
+            'avatar': 'avatar-author_r@example.com',
+            'talks': [talk],
+        }])
+
 
 class TalkViewSetPermissionTests(TestCase):
 
@@ -3,7 +3,7 @@ from rest_framework_extensions import routers
 
 from wafer.talks.views import (
     Speakers, TalkCreate, TalkDelete, TalkUpdate, TalkView, UsersTalks,
-    TalksViewSet, TalkUrlsViewSet)
+    TalksViewSet, TalkUrlsViewSet, speakers_json)
 
 router = routers.ExtendedSimpleRouter()
 
@@ -23,5 +23,9 @@ urlpatterns = [
     url(r'^(?P<pk>\d+)/delete/$', TalkDelete.as_view(),
         name='wafer_talk_delete'),
     url(r'^speakers/$', Speakers.as_view(), name='wafer_talks_speakers'),
+    url(r'^speakers/page/(?P<page>\d+)/$', Speakers.as_view(),
+        name='wafer_talks_speakers_page'),
+    url(r'^speakers/json/$', speakers_json,
+        name='wafer_talks_speakers_json'),
     url(r'^api/', include(router.urls)),
 ]
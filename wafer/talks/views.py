@@ -1,12 +1,13 @@
 from django.core.exceptions import PermissionDenied, ValidationError
-from django.core.urlresolvers import reverse_lazy
+from django.core.urlresolvers import reverse, reverse_lazy
 from django.http import HttpResponseRedirect
 from django.views.generic import DetailView
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from django.views.generic.list import ListView
 from django.conf import settings
 from django.db.models import Q
-from django.http import Http404
+from django.http import Http404, JsonResponse
+from django.core.cache import caches
 
 from reversion import revisions
 from rest_framework import viewsets
@@ -15,11 +16,12 @@ from rest_framework.permissions import (
     BasePermission)
 from rest_framework_extensions.mixins import NestedViewSetMixin
 
-from wafer.utils import LoginRequiredMixin
-from wafer.talks.models import Talk, TalkType, TalkUrl, ACCEPTED, CANCELLED
+from wafer.utils import LoginRequiredMixin, get_cache_version
+from wafer.talks.models import (
+    Talk, TalkType, TalkUrl, ACCEPTED, CANCELLED, get_authored_talk_ids)
 from wafer.talks.forms import get_talk_form_class
 from wafer.talks.serializers import TalkSerializer, TalkUrlSerializer
-from wafer.users.models import UserProfile
+from wafer.users.models import get_speaker_profiles
 
 
 class EditOwnTalksMixin(object):
@@ -40,10 +42,16 @@ class UsersTalks(ListView):
     def get_queryset(self):
         # self.request will be None when we come here via the static site
         # renderer
-        if (self.request and Talk.can_view_all(self.request.user)):
+        if not self.request:
+            return Talk.objects.filter(Q(status=ACCEPTED) |
+                                       Q(status=CANCELLED))
+        if Talk.can_view_all(self.request.user):
             return Talk.objects.all()
-        return Talk.objects.filter( Q(status=ACCEPTED) |
-                                    Q(status=CANCELLED))
+        # Speakers also see their own talks
+        return Talk.objects.filter(
+            Q(status=ACCEPTED) |
+            Q(status=CANCELLED) |
+            Q(talk_id__in=get_authored_talk_ids(self.request.user)))
 
 
 class TalkView(DetailView):
@@ -140,21 +148,50 @@ class TalkDelete(EditOwnTalksMixin, DeleteView):
 
 
 class Speakers(ListView):
-    model = Talk
     template_name = 'wafer.talks/speakers.html'
 
     def _by_row(self, speakers, n):
         return [speakers[i:i + n] for i in range(0, len(speakers), n)]
 
+    def get_queryset(self):
+        return get_speaker_profiles()
+
+    def get_paginate_by(self, queryset):
+        # Unpaginated by default
+        return getattr(settings, 'WAFER_SPEAKERS_PAGINATE_BY', None)
+
     def get_context_data(self, **kwargs):
         context = super(Speakers, self).get_context_data(**kwargs)
-        speakers = UserProfile.objects.filter(
-            user__talks__status='A').distinct().prefetch_related(
-                'user').order_by('user__first_name', 'user__last_name')
-        context["speaker_rows"] = self._by_row(speakers, 4)
+        context["speaker_rows"] = self._by_row(context['object_list'], 4)
         return context
 
 
+def speakers_json(request):
+    """The speakers grid, as JSON"""
+    cache = caches[settings.WAFER_CACHE]
+    key = 'wafer_speakers_json_%s' % get_cache_version('speakers')
+    speakers = cache.get(key)
+    if speakers is None:
+        talks = {}
+        for user_id, talk_id, title in Talk.authors.through.objects.filter(
+                talk__status=ACCEPTED).order_by('talk__title').values_list(
+                    'user_id', 'talk__talk_id', 'talk__title'):
+            talks.setdefault(user_id, []).append({
+                'title': title,
+                'url': reverse('wafer_talk', args=(talk_id,)),
+            })
+        speakers = [{
+            'username': profile.user.username,
+            'name': profile.display_name(),
+            'url': reverse('wafer_user_profile',
+                           args=(profile.user.username,)),
+            'avatar': profile.avatar_url(),
+            'talks': talks.get(profile.user_id, []),
+        } for profile in get_speaker_profiles()]
+        cache.set(key, speakers, 24 * 60 * 60)
+    return JsonResponse({'speakers': speakers})
+
+
 class TalksViewSet(viewsets.ModelViewSet, NestedViewSetMixin):
     """API endpoint that allows talks to be viewed or edited."""
     queryset = Talk.objects.none()  # Needed for the REST Permissions
@@ -172,13 +209,11 @@ class TalksViewSet(viewsets.ModelViewSet, NestedViewSetMixin):
         elif Talk.can_view_all(self.request.user):
             return Talk.objects.all()
         else:
-            # Also include talks owned by the user
-            # XXX: Should this be all authors rather than just
-            # the corresponding author?
+            # Also include talks the user is an author of
             return Talk.objects.filter(
                 Q(status=ACCEPTED) |
                 Q(status=CANCELLED) |
-                Q(corresponding_author=self.request.user))
+                Q(talk_id__in=get_authored_talk_ids(self.request.user)))
 
 
 class TalkExistsPermission(BasePermission):
@@ -0,0 +1,137 @@
+"""Tests for wafer.menu."""
+
+from unittest import skipUnless
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.test import TestCase
+
+import mock
+
+from wafer import menu
+from wafer.menu import (Menu, clear_menu_cache, generate_menu,
+                        get_cached_menus)
+from wafer.pages.models import Page, page_menus
+from wafer.utils import get_cache_version
+
+
+def forget_memo():
+    """Start again, like a newly started process."""
+    menu._memo.update(version=None, items=None)
+
+
+class MenuCacheTests(TestCase):
+    def setUp(self):
+        forget_memo()
+        self.addCleanup(forget_memo)
+
+    def test_memoized(self):
+        with mock.patch('wafer.menu.generate_menu',
+                        return_value=Menu([])) as generate:
+            get_cached_menus()
+            # Only the version check
+            with self.assertNumQueries(1):
+                get_cached_menus()
+        self.assertEqual(generate.call_count, 1)
+
+    def test_shared_between_processes(self):
+        with mock.patch('wafer.menu.generate_menu',
+                        return_value=Menu([])) as generate:
+            get_cached_menus()
+            forget_memo()
+            get_cached_menus()
+        self.assertEqual(generate.call_count, 1)
+
+    def test_clear(self):
+        with mock.patch('wafer.menu.generate_menu',
+                        return_value=Menu([])) as generate:
+            get_cached_menus()
+            clear_menu_cache()
+            get_cached_menus()
+        self.assertEqual(generate.call_count, 2)
+
+    def test_page_save_refreshes(self):
+        get_cached_menus()
+        Page.objects.create(name='In the menu', slug='menu',
+                            include_in_menu=True)
+        labels = [item['label'] for item in get_cached_menus().items]
+        self.assertEqual(labels, ['In the menu'])
+
+    @skipUnless(hasattr(transaction, 'on_commit'),
+                'Django 1.8 has no on_commit')
+    def test_regenerated_after_commit(self):
+        callbacks = []
+        with mock.patch('django.db.transaction.on_commit',
+                        callbacks.append):
+            Page.objects.create(name='In the menu', slug='menu',
+                                include_in_menu=True)
+        # What another process would have cached before the commit
+        version = get_cache_version('menus')
+        caches[settings.WAFER_CACHE].set(
+            '%s_%s' % (menu.CACHE_KEY, version), [])
+        menu._memo.update(version=version, items=[])
+        self.assertEqual(get_cached_menus().items, [])
+        with mock.patch('wafer.menu.generate_menu',
+                        wraps=menu.generate_menu) as generate:
+            for callback in callbacks:
+                callback()
+            self.assertEqual(generate.call_count, 1)
+            labels = [item['label'] for item in get_cached_menus().items]
+        self.assertEqual(labels, ['In the menu'])
+        self.assertEqual(generate.call_count, 1)
+
+    def test_page_delete_refreshes(self):
+        page = Page.objects.create(name='In the menu', slug='menu',
+                                   include_in_menu=True)
+        get_cached_menus()
+        page.delete()
+        self.assertEqual(get_cached_menus().items, [])
+
+    def test_page_move_refreshes(self):
+        parent = Page.objects.create(name='Parent', slug='parent')
+        child = Page.objects.create(name='Child', slug='child',
+                                    parent=parent, include_in_menu=True)
+        menus = ({'menu': 'parent', 'label': 'Parent', 'items': []},
+                 {'menu': 'moved', 'label': 'Moved', 'items': []})
+
+        def urls():
+            return [[item['url'] for item in menu.get('items', [menu])]
+                    for menu in get_cached_menus().items]
+
+        with self.settings(WAFER_MENUS=menus):
+            clear_menu_cache()
+            self.assertEqual(urls(), [['/parent/child/'], []])
+            parent.slug = 'moved'
+            parent.save()
+            self.assertEqual(urls(), [[], ['/moved/child/']])
+            child.parent = None
+            child.save()
+            self.assertEqual(urls(), [[], [], ['/child/']])
+
+    def test_page_move_builds_menus_once(self):
+        parent = Page.objects.create(name='Parent', slug='parent')
+        Page.objects.create(name='Child', slug='child', parent=parent,
+                            include_in_menu=True)
+        parent.slug = 'moved'
+        with mock.patch('wafer.menu.generate_menu',
+                        wraps=menu.generate_menu) as generate:
+            parent.save()
+        self.assertEqual(generate.call_count, 1)
+
+    def test_page_menus_query_count(self):
+        parent = Page.objects.create(name='Parent', slug='parent')
+        for i in range(5):
+            Page.objects.create(name='Child %d' % i, slug='child%d' % i,
+                                parent=parent, include_in_menu=True)
+        root_menu = Menu([Menu.mk_menu('parent', 'Parent', [])])
+        root_menu.items[0]['menu'] = 'parent'
+        with self.assertNumQueries(1):
+            page_menus(root_menu)
+        self.assertEqual([item['url'] for item in root_menu.items[0]['items']],
+                         ['/parent/child%d/' % i for i in range(5)])
+
+    def test_build_time_logged(self):
+        with mock.patch('wafer.menu.logger') as logger:
+            generate_menu()
+        self.assertIn('page_menus', logger.debug.call_args[0][2])
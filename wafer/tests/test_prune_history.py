@@ -0,0 +1,69 @@
+import datetime
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from reversion import revisions
+from reversion.models import Revision, Version
+
+from wafer.talks.models import ACCEPTED, SUBMITTED
+from wafer.talks.tests.test_views import create_talk
+
+
+class PruneHistoryTests(TestCase):
+    def setUp(self):
+        self.talk = create_talk('Talk', SUBMITTED, 'author')
+        now = timezone.now()
+        # (days ago, hour, status) for each save
+        saves = [
+            (40, 9, SUBMITTED),
+            (40, 10, SUBMITTED),
+            (40, 11, SUBMITTED),
+            (39, 9, ACCEPTED),
+            (39, 10, ACCEPTED),
+            (1, 9, ACCEPTED),
+            (1, 10, ACCEPTED),
+        ]
+        self.versions = {}
+        for days, hour, status in saves:
+            with revisions.create_revision():
+                self.talk.status = status
+                self.talk.save()
+            created = (now - datetime.timedelta(days=days)).replace(
+                hour=hour)
+            revision = Revision.objects.latest('pk')
+            revision.date_created = created
+            revision.save()
+            self.versions[(days, hour)] = revision.version_set.get().pk
+
+    def prune(self, *args):
+        out = StringIO()
+        call_command('wafer_prune_history', '--sleep', '0', *args,
+                     stdout=out)
+        return out.getvalue()
+
+    def remaining(self):
+        pks = set(Version.objects.get_for_object(self.talk).values_list(
+            'pk', flat=True))
+        return sorted(key for key, pk in self.versions.items() if pk in pks)
+
+    def test_dry_run(self):
+        self.assertIn('Would prune 1 versions', self.prune('--dry-run'))
+        self.assertEqual(len(self.remaining()), 7)
+
+    def test_prune(self):
+        self.assertIn('Pruned 1 versions and 1 empty revisions',
+                      self.prune())
+        self.assertEqual(self.remaining(), [
+            (1, 9), (1, 10),
+            # Status change and daily checkpoint
+            (39, 9), (39, 10),
+            # First version and daily checkpoint
+            (40, 9), (40, 11),
+        ])
+
+    def test_prune_is_idempotent(self):
+        self.prune()
+        self.assertIn('Pruned 0 versions', self.prune())
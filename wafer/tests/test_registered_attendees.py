@@ -0,0 +1,68 @@
+import io
+import json
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.management import call_command
+from django.test import TestCase
+
+import mock
+
+from wafer.kv.utils import upsert_kv
+from wafer.tickets.models import Ticket, TicketType
+
+
+class RegisteredAttendeesTests(TestCase):
+    def setUp(self):
+        create = get_user_model().objects.create_user
+        self.users = [create('user%d' % i, 'user%d@example.com' % i)
+                      for i in range(5)]
+
+    def export(self, *args):
+        stdout = io.TextIOWrapper(io.BytesIO(), encoding='utf-8')
+        with mock.patch('sys.stdout', stdout):
+            call_command('wafer_registered_attendees', *args)
+        return stdout.buffer.getvalue().decode('utf-8')
+
+    def test_ticket_mode(self):
+        ticket_type = TicketType.objects.create(name='Regular')
+        Ticket.objects.create(barcode=2, type=ticket_type, user=self.users[1])
+        Ticket.objects.create(barcode=3, type=ticket_type, user=self.users[3])
+        Ticket.objects.create(barcode=1, type=ticket_type, user=self.users[3])
+        with self.settings(WAFER_REGISTRATION_MODE='ticket'):
+            output = self.export()
+        self.assertEqual(output.splitlines(), [
+            'username,name,email,ticket_type,ticket_barcode',
+            'user1,user1,user1@example.com,Regular,2',
+            'user3,user3,user3@example.com,Regular,1',
+        ])
+
+    def test_form_mode_json(self):
+        group = Group.objects.create(name='Registration')
+        with self.settings(WAFER_REGISTRATION_MODE='form'):
+            for i, user in enumerate(self.users):
+                upsert_kv(user.userprofile.kv, group,
+                          {'debconf': i % 2 == 0,
+                           'require_sponsorship': True})
+            with mock.patch(
+                    'wafer.management.commands.wafer_registered_attendees.'
+                    'RegisteredUserList.chunk_size', 2):
+                # The group, then registered profiles and their data for
+                # each of 2 chunks, plus the final empty chunk
+                with self.assertNumQueries(6):
+                    rows = json.loads(self.export('--format', 'json'))
+        self.assertEqual([row['username'] for row in rows],
+                         ['user0', 'user2', 'user4'])
+        self.assertEqual(rows[0], {
+            'username': 'user0',
+            'name': 'user0',
+            'email': 'user0@example.com',
+            'debcamp': None,
+            'debconf': True,
+            'require_sponsorship': True,
+        })
+
+    def test_unknown_mode(self):
+        with self.settings(WAFER_REGISTRATION_MODE='bogus'):
+            with self.assertRaises(NotImplementedError):
+                self.export()
@@ -0,0 +1,95 @@
+import datetime as D
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.utils.six import StringIO
+
+from wafer.schedule.models import Day, ScheduleItem, Slot, Venue
+from wafer.sponsors.models import Sponsor, SponsorshipPackage
+from wafer.stats import cached_conference_statistics, conference_statistics
+from wafer.talks.models import ACCEPTED, SUBMITTED
+from wafer.talks.tests.test_views import create_talk, create_user
+from wafer.tickets.models import Ticket, TicketType
+
+
+class StatsTests(TestCase):
+    def setUp(self):
+        create_talk('Talk A', ACCEPTED, 'author_a')
+        create_talk('Talk B', SUBMITTED, 'author_b')
+        create_talk('Talk C', ACCEPTED, 'author_c')
+
+        ticket_type = TicketType.objects.create(name='Regular')
+        Ticket.objects.create(barcode=1, type=ticket_type,
+                              user=get_user_model().objects.get(
+                                  username='author_a'))
+        Ticket.objects.create(barcode=2, type=ticket_type)
+
+        day = Day.objects.create(date=D.date(2013, 9, 22))
+        venue1 = Venue.objects.create(order=1, name='Venue 1')
+        venue2 = Venue.objects.create(order=2, name='Venue 2')
+        venue1.days.add(day)
+        venue2.days.add(day)
+        start = D.time(10, 0, 0)
+        slot1 = Slot.objects.create(day=day, start_time=start,
+                                    end_time=D.time(11, 0, 0))
+        Slot.objects.create(previous_slot=slot1, end_time=D.time(12, 0, 0))
+        item = ScheduleItem.objects.create(venue=venue1)
+        item.slots.add(slot1)
+
+        package = SponsorshipPackage.objects.create(
+            order=1, name='Gold', number_available=3, price=10)
+        sponsor = Sponsor.objects.create(name='Sponsor', order=1)
+        sponsor.packages.add(package)
+
+    def test_counts(self):
+        stats = conference_statistics()
+        self.assertEqual(stats['talks']['total'], 3)
+        self.assertEqual(stats['talks']['by_status'],
+                         {'Accepted': 2, 'Submitted': 1})
+        self.assertEqual(stats['speakers'], {'total': 3, 'accepted': 2})
+        self.assertEqual(stats['tickets']['total'], 2)
+        self.assertEqual(stats['tickets']['claimed'], 1)
+        self.assertEqual(stats['schedule']['available'], 4)
+        self.assertEqual(stats['schedule']['filled'], 1)
+        self.assertEqual(stats['sponsors']['packages'],
+                         [{'name': 'Gold', 'available': 3, 'claimed': 1}])
+
+    def test_query_count_is_fixed(self):
+        with self.assertNumQueries(11):
+            conference_statistics()
+        for i in range(5):
+            create_talk('More %d' % i, SUBMITTED, 'more_%d' % i)
+        with self.assertNumQueries(11):
+            conference_statistics()
+
+    def test_json_command(self):
+        out = StringIO()
+        call_command('wafer_stats', '--json', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['talks']['total'], 3)
+
+    def test_text_command(self):
+        out = StringIO()
+        call_command('wafer_stats', stdout=out)
+        self.assertIn('Filled: 1 / 4', out.getvalue())
+
+
+class StatsViewTests(TestCase):
+    def setUp(self):
+        cached_conference_statistics.invalidate()
+
+    def test_staff_only(self):
+        create_user('normal')
+        client = Client()
+        client.login(username='normal', password='normal_password')
+        response = client.get('/stats/')
+        self.assertEqual(response.status_code, 302)
+
+    def test_staff(self):
+        create_user('staff', superuser=True)
+        client = Client()
+        client.login(username='staff', password='staff_password')
+        response = client.get('/stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('stats', response.context)
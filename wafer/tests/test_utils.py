@@ -0,0 +1,40 @@
+"""Tests for wafer.utils."""
+
+from django.contrib.auth.models import Group
+from django.test import TestCase
+
+import mock
+
+from wafer.kv.models import KeyValue, hash_value
+from wafer.utils import backfill
+
+
+class BackfillTests(TestCase):
+    def setUp(self):
+        group = Group.objects.create(name='Group')
+        for i in range(7):
+            KeyValue.objects.create(group=group, key='key%d' % i, value=i)
+        KeyValue.objects.update(value_hash='')
+
+    def fill(self, pairs):
+        return dict((pair.pk, {'value_hash': hash_value(pair.value)})
+                    for pair in pairs if pair.value % 2)
+
+    def hashes(self):
+        return dict((pair.value, pair.value_hash)
+                    for pair in KeyValue.objects.all())
+
+    def test_backfill(self):
+        # A SELECT per batch, an UPDATE for each batch with changes, and
+        # the empty last SELECT
+        with self.assertNumQueries(3 + 2 + 1):
+            backfill(KeyValue.objects.all(), self.fill, batch_size=3)
+        self.assertEqual(self.hashes(), dict(
+            (i, hash_value(i) if i % 2 else '') for i in range(7)))
+
+    def test_query_params_limit(self):
+        # Room for 2 rows per UPDATE
+        with mock.patch('wafer.utils.MAX_QUERY_PARAMS', 7):
+            with self.assertNumQueries(1 + 2 + 1):
+                backfill(KeyValue.objects.all(), self.fill)
+        self.assertEqual(self.hashes()[5], hash_value(5))
@@ -1,6 +1,29 @@
 from django.contrib import admin
 
-from wafer.tickets.models import Ticket, TicketType
+from wafer.tickets.models import Ticket, TicketEvent, TicketType
+from wafer.users.widgets import UserAutocomplete
 
-admin.site.register(Ticket)
-admin.site.register(TicketType)
+
+class TicketAdmin(admin.ModelAdmin):
+    list_display = ('barcode', 'email', 'type', 'user', 'checked_in')
+    list_filter = ('type', 'checked_in')
+    readonly_fields = ('checked_in',)
+
+    def formfield_for_foreignkey(self, db_field, request=None, **kwargs):
+        if db_field.name == 'user':
+            kwargs['widget'] = UserAutocomplete()
+        return super(TicketAdmin, self).formfield_for_foreignkey(
+            db_field, request, **kwargs)
+
+
+class TicketTypeAdmin(admin.ModelAdmin):
+    list_display = ('name', 'checked_in_count')
+
+
+class TicketEventAdmin(admin.ModelAdmin):
+    list_display = ('event', 'barcode', 'ticket_type', 'email', 'received')
+
+
+admin.site.register(Ticket, TicketAdmin)
+admin.site.register(TicketType, TicketTypeAdmin)
+admin.site.register(TicketEvent, TicketEventAdmin)
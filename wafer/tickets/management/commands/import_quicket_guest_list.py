@@ -3,17 +3,21 @@ import logging
 
 from django.core.management.base import BaseCommand, CommandError
 
-from wafer.tickets.views import import_ticket
+from wafer.tickets.views import IMPORT_CHUNK_SIZE, import_tickets
 
 
 class Command(BaseCommand):
-    args = '<csv file>'
-    help = "Import a guest list CSV from Quicket"
+    help = ("Import a guest list CSV from Quicket. Tickets that have already"
+            " been imported are skipped, so it is safe to re-run.")
 
-    def handle(self, *args, **options):
-        if len(args) != 1:
-            raise CommandError('1 CSV File required')
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help='Quicket guest list CSV')
+        parser.add_argument('--chunk-size', type=int,
+                            default=IMPORT_CHUNK_SIZE,
+                            help='Number of tickets created per transaction'
+                                 ' (default %d)' % IMPORT_CHUNK_SIZE)
 
+    def handle(self, *args, **options):
         logging.basicConfig(level=logging.INFO)
 
         columns = ('Ticket Number', 'Ticket Barcode', 'Purchase Date',
@@ -22,15 +26,30 @@ class Command(BaseCommand):
                    'Complimentary')
         keys = [column.lower().replace(' ', '_') for column in columns]
 
-        with open(args[0], 'r') as f:
+        with open(options['csv_file'], 'r') as f:
             reader = csv.reader(f)
 
             header = tuple(next(reader))
             if header != columns:
                 raise CommandError('CSV format has changed. Update wafer')
 
-            for row in reader:
-                ticket = dict(zip(keys, row))
-                import_ticket(ticket['ticket_barcode'],
-                              ticket['ticket_type'],
-                              ticket['email'])
+            def tickets():
+                for row in reader:
+                    ticket = dict(zip(keys, row))
+                    yield (ticket['ticket_barcode'], ticket['ticket_type'],
+                           ticket['email'])
+
+            def progress(processed):
+                self.stdout.write('Processed %d rows' % processed)
+
+            results = import_tickets(tickets(), options['chunk_size'],
+                                     progress)
+
+        self.stdout.write(
+            'Created %(created)d tickets (%(linked)d linked to users). '
+            'Skipped %(existing)d existing and %(invalid)d invalid tickets.'
+            % results)
+        if results['unmatched']:
+            self.stdout.write('Emails not matched to a user:')
+            for email in sorted(set(results['unmatched'])):
+                self.stdout.write('  %s' % email)
@@ -0,0 +1,15 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from wafer.tickets.views import link_unclaimed_tickets
+
+
+class Command(BaseCommand):
+    help = ("Link unclaimed tickets to the users with the same email address"
+            " (ignoring case), who don't have a ticket yet.")
+
+    def handle(self, *args, **options):
+        logging.basicConfig(level=logging.INFO)
+        linked = link_unclaimed_tickets()
+        self.stdout.write('Linked %d tickets to users' % linked)
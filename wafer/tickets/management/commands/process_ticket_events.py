@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from wafer.tickets.views import IMPORT_CHUNK_SIZE, process_ticket_events
+
+
+class Command(BaseCommand):
+    help = ("Process the ticket events queued by the Zapier webhooks."
+            " Run this regularly (e.g. from cron), or with --loop as a"
+            " worker.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=IMPORT_CHUNK_SIZE,
+                            help='Number of events handled per transaction'
+                                 ' (default %d)' % IMPORT_CHUNK_SIZE)
+        parser.add_argument('--loop', action='store_true', default=False,
+                            help='Keep waiting for new events, instead of'
+                                 ' exiting once the queue is empty')
+        parser.add_argument('--sleep', type=float, default=1.0,
+                            help='Seconds to wait for new events, when'
+                                 ' looping (default 1)')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            processed = process_ticket_events(options['batch_size'])
+            total += processed
+            if processed:
+                if options['verbosity'] > 1:
+                    self.stdout.write('Processed %d events' % processed)
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
+        self.stdout.write('Processed %d ticket events' % total)
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0003_longer_email_field'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketEvent',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('event', models.CharField(max_length=16, choices=[('guest', 'Guest added'), ('cancel', 'Cancelled')])),
+                ('barcode', models.IntegerField()),
+                ('ticket_type', models.CharField(max_length=255, blank=True)),
+                ('email', models.EmailField(max_length=254, blank=True)),
+                ('received', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ('pk',),
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0004_ticketevent'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='ticket',
+            options={'permissions': (('check_in', 'Can check in tickets'),)},
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='checked_in',
+            field=models.DateTimeField(blank=True, null=True, db_index=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tickettype',
+            name='checked_in_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
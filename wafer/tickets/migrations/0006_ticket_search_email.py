@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from wafer.utils import backfill
+
+
+def fill_search_email(apps, schema_editor):
+    # Use apps to ensure we have the correct version
+    Ticket = apps.get_model('tickets', 'Ticket')
+    # A copy of wafer.utils.normalize_email, as it was when this migration
+    # was written
+    backfill(Ticket.objects.exclude(email='').only('pk', 'email'),
+             lambda tickets: dict(
+                 (ticket.pk, {'search_email': ticket.email.strip().lower()})
+                 for ticket in tickets))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0005_ticket_checked_in'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='search_email',
+            field=models.CharField(default='', max_length=254, db_index=True, editable=False),
+        ),
+        migrations.RunPython(fill_search_email,
+                             migrations.RunPython.noop),
+    ]
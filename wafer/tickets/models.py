@@ -1,7 +1,13 @@
-from django.db import models
+import threading
+
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_init, post_save
 from django.conf import settings
 from django.utils.encoding import python_2_unicode_compatible
 
+from wafer.tickets.signals import tickets_deleted
+from wafer.utils import normalize_email
+
 
 @python_2_unicode_compatible
 class TicketType(models.Model):
@@ -9,6 +15,9 @@ class TicketType(models.Model):
     MAX_NAME_LENGTH = 255
 
     name = models.CharField(max_length=MAX_NAME_LENGTH)
+    # Maintained by check_in and refresh_checked_in_counts, so counting
+    # doesn't need to scan the tickets
+    checked_in_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.name
@@ -21,6 +30,124 @@ class Ticket(models.Model):
     type = models.ForeignKey(TicketType)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='ticket',
                              blank=True, null=True, on_delete=models.SET_NULL)
+    checked_in = models.DateTimeField(blank=True, null=True, db_index=True,
+                                      editable=False)
+    # The normalized email, to match tickets to users
+    search_email = models.CharField(max_length=254, db_index=True,
+                                    default='', editable=False)
+
+    class Meta:
+        permissions = (
+            ('check_in', 'Can check in tickets'),
+        )
 
     def __str__(self):
         return u'%s (%s)' % (self.barcode, self.email)
+
+    def save(self, *args, **kwargs):
+        self.search_email = normalize_email(self.email)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'email' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | set(
+                ['search_email'])
+        super(Ticket, self).save(*args, **kwargs)
+        # Only now, so every post_save receiver sees the loaded state
+        ticket_loaded(Ticket, self)
+
+
+@python_2_unicode_compatible
+class TicketEvent(models.Model):
+    """A ticket webhook call, queued until process_ticket_events handles
+       it, so the webhook can respond at once."""
+
+    GUEST_ADDED = 'guest'
+    CANCELLED = 'cancel'
+    EVENT_CHOICES = (
+        (GUEST_ADDED, 'Guest added'),
+        (CANCELLED, 'Cancelled'),
+    )
+
+    event = models.CharField(max_length=16, choices=EVENT_CHOICES)
+    barcode = models.IntegerField()
+    ticket_type = models.CharField(max_length=TicketType.MAX_NAME_LENGTH,
+                                   blank=True)
+    email = models.EmailField(blank=True)
+    received = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ('pk',)
+
+    def __str__(self):
+        return u'%s %s (%s)' % (self.event, self.barcode, self.email)
+
+
+def refresh_checked_in_counts(type_ids=None):
+    """Recount the checked in tickets of the given ticket types, or all."""
+    types = TicketType.objects.all()
+    if type_ids is not None:
+        types = types.filter(pk__in=list(type_ids))
+    counts = dict(Ticket.objects.filter(
+        checked_in__isnull=False, type__in=types).values_list(
+            'type').annotate(count=models.Count('pk')).order_by())
+    for type_id in types.values_list('pk', flat=True):
+        TicketType.objects.filter(pk=type_id).update(
+            checked_in_count=counts.get(type_id, 0))
+
+
+# Bulk ticket deletes, in this thread
+_bulk = threading.local()
+
+
+def deleting_tickets_in_bulk():
+    """Whether tickets are being deleted by delete_tickets, so per-ticket
+       post_delete receivers should leave their work to tickets_deleted."""
+    return getattr(_bulk, 'deleting', False)
+
+
+def delete_tickets(tickets):
+    """Delete a queryset of tickets, recounting the checked in tickets and
+       sending tickets_deleted once for all of them. Returns the number of
+       tickets deleted."""
+    with transaction.atomic():
+        rows = list(tickets.values_list('pk', 'user_id', 'type_id',
+                                        'checked_in'))
+        if not rows:
+            return 0
+        _bulk.deleting = True
+        try:
+            Ticket.objects.filter(pk__in=[row[0] for row in rows]).delete()
+        finally:
+            _bulk.deleting = False
+        type_ids = set(type_id for _, _, type_id, checked_in in rows
+                       if checked_in)
+        if type_ids:
+            refresh_checked_in_counts(type_ids)
+        tickets_deleted.send(sender=Ticket, user_ids=set(
+            user_id for _, user_id, _, _ in rows if user_id is not None))
+    return len(rows)
+
+
+def ticket_loaded(sender, instance, **kwargs):
+    """Remember the loaded state of the ticket, so receivers can tell
+       what changed when it's saved or deleted."""
+    # From __dict__, so deferred fields aren't loaded
+    instance._wafer_loaded_user_id = instance.__dict__.get('user_id')
+    instance._wafer_loaded_type_id = instance.__dict__.get('type_id')
+    instance._wafer_loaded_checked_in = instance.__dict__.get('checked_in')
+
+
+def ticket_saved(sender, instance, raw=False, **kwargs):
+    """Keep the counters right when checked in tickets are edited or
+       deleted. check_in updates them directly."""
+    if raw or deleting_tickets_in_bulk():
+        return
+    loaded_type_id = getattr(instance, '_wafer_loaded_type_id', None)
+    loaded_checked_in = getattr(instance, '_wafer_loaded_checked_in', None)
+    if instance.checked_in or loaded_checked_in:
+        refresh_checked_in_counts(
+            set([instance.type_id, loaded_type_id]) - set([None]))
+
+
+post_init.connect(ticket_loaded, sender=Ticket)
+post_save.connect(ticket_saved, sender=Ticket)
+post_delete.connect(ticket_saved, sender=Ticket)
@@ -0,0 +1,8 @@
+from rest_framework.permissions import BasePermission
+
+
+class CheckInPermission(BasePermission):
+    """Allow people with the tickets.check_in permission to scan tickets."""
+
+    def has_permission(self, request, view):
+        return request.user.has_perm('tickets.check_in')
@@ -0,0 +1,17 @@
+from rest_framework import serializers
+
+
+class ScanSerializer(serializers.Serializer):
+    """A ticket scan. Offline scanners send the time of the scan."""
+    barcode = serializers.IntegerField()
+    scanned = serializers.DateTimeField(required=False)
+
+
+class TicketEventSerializer(serializers.Serializer):
+    """A ticket webhook payload."""
+    # The barcode becomes the ticket's primary key, an IntegerField
+    barcode = serializers.IntegerField(min_value=-2 ** 31,
+                                       max_value=2 ** 31 - 1)
+    ticket_type = serializers.CharField(allow_blank=True, default='')
+    email = serializers.CharField(max_length=254, allow_blank=True,
+                                  default='')
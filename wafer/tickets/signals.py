@@ -0,0 +1,12 @@
+from django.dispatch import Signal
+
+
+# Sent after tickets are created in bulk, which bypasses post_save.
+# user_ids are the users the new tickets were linked to.
+tickets_imported = Signal(providing_args=['user_ids'])
+
+# Sent by delete_tickets after it deletes tickets in bulk, instead of the
+# work done by per-ticket post_delete receivers (see
+# wafer.tickets.models.deleting_tickets_in_bulk). user_ids are the users
+# the deleted tickets were linked to.
+tickets_deleted = Signal(providing_args=['user_ids'])
@@ -1,10 +1,23 @@
+import datetime
 import json
+import os
+import tempfile
 
+from django.contrib.auth.models import Permission
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.utils.six import StringIO
+from rest_framework.test import APIClient
 
-from wafer.tickets.views import import_ticket
-from wafer.tickets.models import Ticket, TicketType
+from wafer.tickets.views import (check_in, import_ticket, import_tickets,
+                                 link_unclaimed_tickets,
+                                 process_ticket_events)
+from wafer.tickets.models import Ticket, TicketEvent, TicketType
+from wafer.users.models import UserProfile
 
 
 class ImportTicketTests(TestCase):
@@ -54,9 +67,93 @@ class ImportTicketTests(TestCase):
         self.assertEqual(ticket, initial_ticket)
 
 
+class ImportTicketsTests(TestCase):
+    def setUp(self):
+        create = get_user_model().objects.create_user
+        self.alice = create('alice', 'alice@example.com')
+        self.bob = create('bob', 'bob@example.com')
+        # Two users with the same email can't be matched
+        create('carol', 'shared@example.com')
+        create('dave', 'shared@example.com')
+
+    def guest_list(self):
+        return [
+            ('1', 'Regular', 'alice@example.com'),
+            ('2', 'Regular', 'alice@example.com'),
+            ('3', 'Student', 'bob@example.com'),
+            ('4', 'Student', 'shared@example.com'),
+            ('5', 'Student', 'unknown@example.com'),
+            ('1', 'Regular', 'alice@example.com'),
+            ('bad', 'Regular', 'alice@example.com'),
+        ]
+
+    def test_import(self):
+        processed = []
+        with self.settings(WAFER_REGISTRATION_MODE='ticket'):
+            results = import_tickets(self.guest_list(), chunk_size=2,
+                                     progress=processed.append)
+        self.assertEqual(results, {
+            'created': 5,
+            'existing': 1,
+            'invalid': 1,
+            'linked': 2,
+            'unmatched': ['alice@example.com', 'shared@example.com',
+                          'unknown@example.com'],
+        })
+        self.assertEqual(processed, [2, 4, 7])
+        self.assertEqual(
+            dict(Ticket.objects.values_list('barcode', 'user__username')),
+            {1: 'alice', 2: None, 3: 'bob', 4: None, 5: None})
+        self.assertEqual(TicketType.objects.count(), 2)
+        # bulk_create bypasses post_save, but the flag is still updated
+        self.assertTrue(UserProfile.objects.get(user=self.alice).registered)
+
+    def test_rerun(self):
+        import_tickets(self.guest_list())
+        results = import_tickets(self.guest_list())
+        self.assertEqual(results['created'], 0)
+        self.assertEqual(results['existing'], 6)
+        self.assertEqual(Ticket.objects.count(), 5)
+
+    def test_query_count(self):
+        TicketType.objects.create(name='Regular')
+        guests = [(i, 'Regular', 'guest%d@example.com' % i)
+                  for i in range(1, 101)]
+        # Ticket types, then for each chunk: savepoint, existing barcodes,
+        # users, insert and release
+        with self.assertNumQueries(1 + 5):
+            import_tickets(guests)
+        self.assertEqual(Ticket.objects.count(), 100)
+
+    def test_command(self):
+        header = ('Ticket Number,Ticket Barcode,Purchase Date,Ticket Type,'
+                  'Ticket Holder,Email,Cellphone,Checked in,Checked in date,'
+                  'Checked in by,Complimentary\n')
+        row = '1,%s,2017-01-01,Regular,Someone,%s,,No,,,No\n'
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w') as f:
+            f.write(header)
+            f.write(row % (100, 'alice@example.com'))
+            f.write(row % (101, 'nobody@example.com'))
+        self.addCleanup(os.remove, path)
+        out = StringIO()
+        call_command('import_quicket_guest_list', path, stdout=out)
+        self.assertIn('Created 2 tickets (1 linked to users)',
+                      out.getvalue())
+        self.assertIn('nobody@example.com', out.getvalue())
+        self.assertEqual(Ticket.objects.get(barcode=100).user, self.alice)
+
+
 class PostTicketTests(TestCase):
     """Test posting data to the web hook"""
 
+    def post(self, client, hook, post_data, **kwargs):
+        response = client.post('/tickets/%s/' % hook, json.dumps(post_data),
+                               content_type="application/json", **kwargs)
+        # The hooks only queue the event
+        process_ticket_events()
+        return response
+
     def test_posts(self):
         UserModel = get_user_model()
         email = "post@example.com"
@@ -69,27 +166,21 @@ class PostTicketTests(TestCase):
             }
         with self.settings(WAFER_TICKETS_SECRET='testsecret'):
             # Check that the secret matters
-            response = client.post('/tickets/zapier_guest_hook/',
-                                   json.dumps(post_data),
-                                   content_type="application/json",
-                                   HTTP_X_ZAPIER_SECRET='wrongsecret')
+            response = self.post(client, 'zapier_guest_hook', post_data,
+                                 HTTP_X_ZAPIER_SECRET='wrongsecret')
             self.assertEqual(response.status_code, 403)
             # Check that the ticket gets processed correctly with an
             # existing user
-            response = client.post('/tickets/zapier_guest_hook/',
-                                   json.dumps(post_data),
-                                   content_type="application/json",
-                                   HTTP_X_ZAPIER_SECRET='testsecret')
+            response = self.post(client, 'zapier_guest_hook', post_data,
+                                 HTTP_X_ZAPIER_SECRET='testsecret')
             self.assertEqual(response.status_code, 200)
             ticket = Ticket.objects.get(barcode=54321)
             self.assertEqual(ticket.barcode, 54321)
             self.assertEqual(ticket.email, email)
             self.assertEqual(ticket.user, user)
             # Check duplicate post doesn't change anything
-            response = client.post('/tickets/zapier_guest_hook/',
-                                   json.dumps(post_data),
-                                   content_type="application/json",
-                                   HTTP_X_ZAPIER_SECRET='testsecret')
+            response = self.post(client, 'zapier_guest_hook', post_data,
+                                 HTTP_X_ZAPIER_SECRET='testsecret')
             self.assertEqual(response.status_code, 200)
             ticket = Ticket.objects.get(barcode=54321)
             self.assertEqual(ticket.barcode, 54321)
@@ -98,22 +189,236 @@ class PostTicketTests(TestCase):
             # Change email to one that doesn't exist
             post_data['email'] = 'none@example.com'
             post_data['barcode'] = 65432
-            response = client.post('/tickets/zapier_guest_hook/',
-                                   json.dumps(post_data),
-                                   content_type="application/json",
-                                   HTTP_X_ZAPIER_SECRET='testsecret')
+            response = self.post(client, 'zapier_guest_hook', post_data,
+                                 HTTP_X_ZAPIER_SECRET='testsecret')
             self.assertEqual(response.status_code, 200)
             ticket = Ticket.objects.get(barcode=65432)
             self.assertEqual(ticket.barcode, 65432)
             self.assertEqual(ticket.email, 'none@example.com')
             self.assertEqual(ticket.user, None)
             # Test cancelation
-            response = client.post('/tickets/zapier_cancel_hook/',
-                                   json.dumps(post_data),
-                                   content_type="application/json",
-                                   HTTP_X_ZAPIER_SECRET='testsecret')
+            response = self.post(client, 'zapier_cancel_hook', post_data,
+                                 HTTP_X_ZAPIER_SECRET='testsecret')
             self.assertEqual(response.status_code, 200)
             # Check ticket has been deleted
             self.assertFalse(Ticket.objects.filter(barcode=65432).exists())
             # Check earlier ticket still exists
             self.assertEqual(Ticket.objects.filter(barcode=54321).count(), 1)
+
+    def test_burst_is_queued(self):
+        client = Client()
+        guest = {"ticket_type": "Test Type", "barcode": "54321",
+                 "email": "post@example.com"}
+        with self.settings(WAFER_TICKETS_SECRET='testsecret'):
+            with self.assertNumQueries(1):
+                response = client.post('/tickets/zapier_guest_hook/',
+                                       json.dumps(guest),
+                                       content_type="application/json",
+                                       HTTP_X_ZAPIER_SECRET='testsecret')
+            self.assertEqual(response.status_code, 200)
+            for i in range(3):
+                # Zapier retries
+                client.post('/tickets/zapier_guest_hook/', json.dumps(guest),
+                            content_type="application/json",
+                            HTTP_X_ZAPIER_SECRET='testsecret')
+            client.post('/tickets/zapier_cancel_hook/', json.dumps(guest),
+                        content_type="application/json",
+                        HTTP_X_ZAPIER_SECRET='testsecret')
+            guest['barcode'] = 12345
+            client.post('/tickets/zapier_guest_hook/', json.dumps(guest),
+                        content_type="application/json",
+                        HTTP_X_ZAPIER_SECRET='testsecret')
+            for payload in ('{}', 'not json', '[]',
+                            json.dumps(dict(guest, email=None)),
+                            json.dumps(dict(guest, ticket_type=None)),
+                            json.dumps(dict(guest, barcode=2 ** 40))):
+                response = client.post('/tickets/zapier_guest_hook/',
+                                       payload,
+                                       content_type="application/json",
+                                       HTTP_X_ZAPIER_SECRET='testsecret')
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(Ticket.objects.exists())
+        self.assertEqual(TicketEvent.objects.count(), 6)
+
+        out = StringIO()
+        call_command('process_ticket_events', stdout=out)
+        self.assertEqual(out.getvalue(), 'Processed 6 ticket events\n')
+        self.assertFalse(TicketEvent.objects.exists())
+        # Cancelled after being added, and then another guest added
+        self.assertEqual(list(Ticket.objects.values_list('barcode',
+                                                         flat=True)),
+                         [12345])
+
+
+class CheckInTests(TestCase):
+    def setUp(self):
+        self.regular = TicketType.objects.create(name='Regular')
+        self.student = TicketType.objects.create(name='Student')
+        for barcode in range(1, 6):
+            Ticket.objects.create(barcode=barcode, type=self.regular,
+                                  email='guest%d@example.com' % barcode)
+        Ticket.objects.create(barcode=10, type=self.student)
+        scanner = get_user_model().objects.create_user(
+            'scanner', password='password')
+        scanner.user_permissions.add(
+            Permission.objects.get(codename='check_in'))
+        self.client = APIClient()
+        self.client.login(username='scanner', password='password')
+
+    def scan(self, barcode):
+        return self.client.post('/tickets/api/checkin/',
+                                {'barcode': barcode}, format='json')
+
+    def test_permission(self):
+        get_user_model().objects.create_user('other', password='password')
+        client = APIClient()
+        client.login(username='other', password='password')
+        response = client.post('/tickets/api/checkin/', {'barcode': 1},
+                               format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertIsNone(Ticket.objects.get(barcode=1).checked_in)
+
+    def test_check_in_queries(self):
+        # Load the ticket, then the conditional update and the counter in
+        # a savepoint
+        with self.assertNumQueries(5):
+            ticket, first = check_in(1)
+        self.assertTrue(first)
+        with self.assertNumQueries(1):
+            ticket, first = check_in(1)
+        self.assertFalse(first)
+
+    def test_scan(self):
+        response = self.scan(1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'checked_in')
+        self.assertEqual(response.data['ticket_type'], 'Regular')
+        self.assertEqual(response.data['email'], 'guest1@example.com')
+        checked_in = Ticket.objects.get(barcode=1).checked_in
+        self.assertIsNotNone(checked_in)
+
+        response = self.scan(1)
+        self.assertEqual(response.data['status'], 'duplicate')
+        self.assertEqual(response.data['checked_in'], checked_in)
+        response = self.scan(999)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['status'], 'unknown')
+        response = self.scan('abc')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get('/tickets/api/checkin/')
+        self.assertEqual(response.data, {
+            'total': 1, 'by_type': {'Regular': 1, 'Student': 0}})
+
+    def test_batch(self):
+        early = timezone.now() - datetime.timedelta(hours=1)
+        late = timezone.now()
+        self.scan(1)
+        scans = [
+            {'barcode': 2, 'scanned': late},
+            {'barcode': 2, 'scanned': early},
+            {'barcode': 1, 'scanned': early},
+            {'barcode': 10, 'scanned': late},
+            {'barcode': 999, 'scanned': late},
+        ]
+        response = self.client.post('/tickets/api/checkin/batch/', scans,
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result
+                          in response.data['results']],
+                         ['duplicate', 'checked_in', 'duplicate',
+                          'checked_in', 'unknown'])
+        self.assertEqual(Ticket.objects.get(barcode=2).checked_in, early)
+        self.assertEqual(
+            dict(TicketType.objects.values_list('name', 'checked_in_count')),
+            {'Regular': 2, 'Student': 1})
+
+    def test_counters_follow_edits(self):
+        self.scan(1)
+        self.scan(2)
+        ticket = Ticket.objects.get(barcode=1)
+        ticket.type = self.student
+        ticket.save()
+        Ticket.objects.get(barcode=2).delete()
+        self.assertEqual(
+            dict(TicketType.objects.values_list('name', 'checked_in_count')),
+            {'Regular': 0, 'Student': 1})
+
+    def cancel(self, barcodes):
+        for barcode in barcodes:
+            TicketEvent.objects.create(event=TicketEvent.CANCELLED,
+                                       barcode=barcode)
+        with CaptureQueriesContext(connection) as queries:
+            process_ticket_events()
+        return len(queries)
+
+    def test_cancel_batch(self):
+        users = []
+        for barcode in range(1, 6):
+            user = get_user_model().objects.create_user('guest%d' % barcode)
+            ticket = Ticket.objects.get(barcode=barcode)
+            ticket.user = user
+            ticket.save()
+            check_in(barcode)
+            users.append(user)
+        self.assertTrue(UserProfile.objects.get(user=users[0]).registered)
+        # Counters and registration flags are refreshed once per batch
+        self.assertEqual(self.cancel([1]), self.cancel([2, 3, 4, 5]))
+        self.assertFalse(Ticket.objects.filter(type=self.regular).exists())
+        self.assertEqual(
+            TicketType.objects.get(pk=self.regular.pk).checked_in_count, 0)
+        self.assertFalse(UserProfile.objects.filter(
+            user__in=users, registered=True).exists())
+
+
+class EmailMatchingTests(TestCase):
+    def setUp(self):
+        create = get_user_model().objects.create_user
+        self.alice = create('alice', 'Alice@Example.com', 'password')
+        self.bob = create('bob', 'bob@example.com', 'password')
+        self.type = TicketType.objects.create(name='Regular')
+
+    def test_import_ignores_case(self):
+        import_ticket(1, 'Regular', ' alice@EXAMPLE.com')
+        ticket = Ticket.objects.get(barcode=1)
+        self.assertEqual(ticket.user, self.alice)
+        self.assertEqual(ticket.search_email, 'alice@example.com')
+
+    def test_email_change(self):
+        self.bob.email = 'Robert@Example.com'
+        self.bob.save(update_fields=['email'])
+        import_ticket(1, 'Regular', 'robert@example.com')
+        self.assertEqual(Ticket.objects.get(barcode=1).user, self.bob)
+
+    def test_link_unclaimed(self):
+        for barcode, email in ((1, 'ALICE@example.com'),
+                               (2, 'alice@example.com'),
+                               (3, 'bob@example.com'),
+                               (4, 'nobody@example.com')):
+            Ticket.objects.create(barcode=barcode, email=email,
+                                  type=self.type)
+        # Bob already has a ticket
+        Ticket.objects.create(barcode=5, type=self.type, user=self.bob)
+        out = StringIO()
+        with self.settings(WAFER_REGISTRATION_MODE='ticket'):
+            call_command('link_unclaimed_tickets', stdout=out)
+        self.assertEqual(out.getvalue(), 'Linked 1 tickets to users\n')
+        self.assertEqual(
+            dict(Ticket.objects.values_list('barcode', 'user__username')),
+            {1: 'alice', 2: None, 3: None, 4: None, 5: 'bob'})
+        self.assertTrue(UserProfile.objects.get(user=self.alice).registered)
+        # Idempotent
+        self.assertEqual(link_unclaimed_tickets(), 0)
+
+    def test_claim_view_does_not_link_by_email(self):
+        # Users can change their email address without verifying it, so
+        # only the barcode can claim a ticket
+        Ticket.objects.create(barcode=1, email='alice@example.com',
+                              type=self.type)
+        client = Client()
+        client.login(username='alice', password='password')
+        with self.settings(WAFER_REGISTRATION_MODE='ticket',
+                           WAFER_REGISTRATION_OPEN=True):
+            response = client.get('/tickets/claim/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Ticket.objects.get(barcode=1).user, None)
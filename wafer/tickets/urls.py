@@ -1,10 +1,15 @@
 from django.conf.urls import url
-from wafer.tickets.views import ClaimView, zapier_cancel_hook, zapier_guest_hook
+from wafer.tickets.views import (CheckInBatchView, CheckInView, ClaimView,
+                                 zapier_cancel_hook, zapier_guest_hook)
 
 
 urlpatterns = [
     url(r'^claim/$', ClaimView.as_view(), name='wafer_ticket_claim'),
     url(r'^zapier_guest_hook/$', zapier_guest_hook),
     url(r'^zapier_cancel_hook/$', zapier_cancel_hook),
+    url(r'^api/checkin/$', CheckInView.as_view(),
+        name='wafer_ticket_checkin'),
+    url(r'^api/checkin/batch/$', CheckInBatchView.as_view(),
+        name='wafer_ticket_checkin_batch'),
 ]
 
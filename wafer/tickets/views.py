@@ -1,22 +1,44 @@
 import json
 import logging
+from itertools import groupby
 
 from django.conf import settings
-from django.contrib.auth import get_user_model
 from django.core.exceptions import PermissionDenied, ValidationError
 from django.core.urlresolvers import reverse
-from django.http import HttpResponse, Http404
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.http import HttpResponse, HttpResponseBadRequest, Http404
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
+from django.utils import timezone
 from django.views.generic.edit import FormView
 
-from wafer.utils import LoginRequiredMixin
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from wafer.tickets.models import Ticket, TicketType
+from wafer.utils import LoginRequiredMixin, normalize_email
+
+from wafer.tickets.models import (
+    Ticket, TicketEvent, TicketType, delete_tickets)
 from wafer.tickets.forms import TicketForm
+from wafer.tickets.permissions import CheckInPermission
+from wafer.tickets.serializers import ScanSerializer, TicketEventSerializer
+from wafer.tickets.signals import tickets_imported
+from wafer.users.models import UserProfile
 
 log = logging.getLogger(__name__)
 
+# Number of tickets created per transaction by import_tickets
+IMPORT_CHUNK_SIZE = 1000
+
+# Maximum number of scans in a single check-in batch
+MAX_SCAN_BATCH_SIZE = 1000
+
+CHECKED_IN = 'checked_in'
+DUPLICATE = 'duplicate'
+UNKNOWN = 'unknown'
+
 
 class ClaimView(LoginRequiredMixin, FormView):
     template_name = 'wafer.tickets/claim.html'
@@ -51,6 +73,31 @@ class ClaimView(LoginRequiredMixin, FormView):
 # Quicket events into web posts via the Zapier webhook endpoint.
 # For Zapier, we assume a shared secret has been set in the X-Zapier-Secret
 # header
+#
+# Zapier sends bursts of these when ticket sales open, and retries slow
+# responses, so the hooks only queue the event. process_ticket_events does
+# the work.
+def queue_ticket_event(request, event):
+    if request.META.get('HTTP_X_ZAPIER_SECRET', None) != settings.WAFER_TICKETS_SECRET:
+        raise PermissionDenied('Incorrect secret')
+
+    try:
+        # This is required for python 3, and in theory fine on python 2
+        payload = json.loads(request.body.decode('utf8'))
+    except ValueError:
+        payload = None
+    serializer = TicketEventSerializer(data=payload)
+    if not serializer.is_valid():
+        return HttpResponseBadRequest("Invalid payload\n",
+                                      content_type='text/plain')
+    TicketEvent.objects.create(
+        event=event,
+        barcode=serializer.validated_data['barcode'],
+        ticket_type=serializer.validated_data['ticket_type'][
+            :TicketType.MAX_NAME_LENGTH],
+        email=serializer.validated_data['email'])
+
+
 @csrf_exempt
 @require_POST
 def zapier_cancel_hook(request):
@@ -62,16 +109,8 @@ def zapier_cancel_hook(request):
         "email": "demo@example.com"
     }
     '''
-    if request.META.get('HTTP_X_ZAPIER_SECRET', None) != settings.WAFER_TICKETS_SECRET:
-        raise PermissionDenied('Incorrect secret')
-
-    # This is required for python 3, and in theory fine on python 2
-    payload = json.loads(request.body.decode('utf8'))
-    ticket = Ticket.objects.filter(barcode=payload['barcode'])
-    if ticket.exists():
-        # delete the ticket
-        ticket.delete()
-    return HttpResponse("Cancelled\n", content_type='text/plain')
+    error = queue_ticket_event(request, TicketEvent.CANCELLED)
+    return error or HttpResponse("Cancelled\n", content_type='text/plain')
 
 
 # We assume this is connected to the Quicket's 'guest added' Zapier
@@ -89,47 +128,350 @@ def zapier_guest_hook(request):
         "email": "demo@example.com"
     }
     '''
-    if request.META.get('HTTP_X_ZAPIER_SECRET', None) != settings.WAFER_TICKETS_SECRET:
-        raise PermissionDenied('Incorrect secret')
+    error = queue_ticket_event(request, TicketEvent.GUEST_ADDED)
+    return error or HttpResponse("Noted\n", content_type='text/plain')
 
-    # This is required for python 3, and in theory fine on python 2
-    payload = json.loads(request.body.decode('utf8'))
-    import_ticket(payload['barcode'], payload['ticket_type'],
-                  payload['email'])
 
-    return HttpResponse("Noted\n", content_type='text/plain')
+def _dedupe(events):
+    """Drop repeated (event, barcode) pairs, e.g. from Zapier retries."""
+    seen = set()
+    for event in events:
+        if (event.event, event.barcode) not in seen:
+            seen.add((event.event, event.barcode))
+            yield event
+
+
+def process_ticket_events(batch_size=IMPORT_CHUNK_SIZE):
+    """Handle the oldest batch of queued ticket events, in a single
+       transaction, and delete them. Returns the number of events handled.
+
+       Runs of guests are imported with import_tickets, and runs of
+       cancellations are deleted together, keeping the order between
+       them."""
+    with transaction.atomic():
+        events = list(TicketEvent.objects.select_for_update()[:batch_size])
+        if not events:
+            return 0
+        for event_type, run in groupby(events, lambda e: e.event):
+            run = list(_dedupe(run))
+            if event_type == TicketEvent.GUEST_ADDED:
+                import_tickets([(event.barcode, event.ticket_type,
+                                 event.email) for event in run])
+            elif event_type == TicketEvent.CANCELLED:
+                delete_tickets(Ticket.objects.filter(
+                    barcode__in=[event.barcode for event in run]))
+        TicketEvent.objects.filter(
+            pk__in=[event.pk for event in events]).delete()
+    return len(events)
 
 
 def import_ticket(ticket_barcode, ticket_type, email):
-    if Ticket.objects.filter(barcode=ticket_barcode).exists():
-        log.debug('Ticket already registered: %s', ticket_barcode)
-        return
+    import_tickets([(ticket_barcode, ticket_type, email)])
+
+
+def _match_users(emails):
+    """Return a dict of normalized email to the id of the user that a new
+       ticket for that email should be linked to. Users who already have a
+       ticket are skipped, and so are emails shared by more than one user.
+       The latter can claim their tickets via the 'claim ticket'
+       interface."""
+    users = {}
+    for email, user_id in UserProfile.objects.filter(
+            search_email__in=list(emails), user__ticket=None).values_list(
+                'search_email', 'user_id'):
+        users.setdefault(email, []).append(user_id)
+    return dict((email, user_ids[0]) for email, user_ids in users.items()
+                if len(user_ids) == 1)
+
+
+def import_tickets(tickets, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """Import (barcode, ticket type, email) tuples.
+
+       Tickets with barcodes that already exist are skipped, so this can be
+       re-run with the same list. Tickets are created in bulk, a chunk at a
+       time, each chunk in its own transaction. Existing barcodes, ticket
+       types and the users to link to are loaded up front, for each chunk,
+       so the number of queries only grows with the number of chunks.
+
+       progress, if given, is called with the number of tickets processed
+       after each chunk.
+
+       Returns a dict of counts, and the emails that didn't match a user.
+    """
+    results = {
+        'created': 0,
+        'existing': 0,
+        'invalid': 0,
+        'linked': 0,
+        'unmatched': [],
+    }
+    # Ticket types are few, so keep all of them
+    types = dict((type_.name, type_) for type_ in TicketType.objects.all())
+    seen = set()
+    processed = 0
+
+    tickets = iter(tickets)
+    while True:
+        chunk = []
+        for barcode, ticket_type, email in tickets:
+            processed += 1
+            try:
+                barcode = int(barcode)
+            except (TypeError, ValueError):
+                log.warning('Invalid ticket barcode: %r', barcode)
+                results['invalid'] += 1
+                continue
+            if barcode in seen:
+                results['existing'] += 1
+                continue
+            seen.add(barcode)
+            # truncate long ticket type names to length allowed by database
+            chunk.append((barcode, ticket_type[:TicketType.MAX_NAME_LENGTH],
+                          email))
+            if len(chunk) >= chunk_size:
+                break
+        if not chunk:
+            break
+
+        with transaction.atomic():
+            existing = set(Ticket.objects.filter(
+                barcode__in=[barcode for barcode, _, _ in chunk]
+            ).values_list('barcode', flat=True))
+            new = [ticket for ticket in chunk if ticket[0] not in existing]
+            results['existing'] += len(chunk) - len(new)
+
+            for _, ticket_type, _ in new:
+                if ticket_type not in types:
+                    types[ticket_type] = TicketType.objects.create(
+                        name=ticket_type)
+
+            users = _match_users(set(normalize_email(email)
+                                     for _, _, email in new))
+            created = []
+            for barcode, ticket_type, email in new:
+                # Each user can only be matched to a single new ticket
+                user_id = users.pop(normalize_email(email), None)
+                created.append(Ticket(barcode=barcode, email=email,
+                                      search_email=normalize_email(email),
+                                      type=types[ticket_type],
+                                      user_id=user_id))
+                if user_id:
+                    log.debug('Ticket registered: %s and linked to user',
+                              created[-1])
+                else:
+                    log.debug('Ticket registered: %s. Unclaimed',
+                              created[-1])
+                    results['unmatched'].append(email)
+            Ticket.objects.bulk_create(created)
 
-    # truncate long ticket type names to length allowed by database
-    ticket_type = ticket_type[:TicketType.MAX_NAME_LENGTH]
-    type_, created = TicketType.objects.get_or_create(name=ticket_type)
+            user_ids = [ticket.user_id for ticket in created
+                        if ticket.user_id is not None]
+            if user_ids:
+                tickets_imported.send(sender=Ticket, user_ids=user_ids)
+            results['created'] += len(created)
+            results['linked'] += len(user_ids)
 
-    UserModel = get_user_model()
+        if progress:
+            progress(processed)
 
+    log.info('Imported %(created)d tickets, %(linked)d linked to users. '
+             '%(existing)d already existed, %(invalid)d invalid', results)
+    return results
+
+
+def link_unclaimed_tickets(user_ids=None):
+    """Link unclaimed tickets to the users with the same (normalized) email
+       address, for the given users, or everyone.
+
+       As when importing, users who already have a ticket are skipped, and
+       so are emails shared by more than one user. Each user is linked to
+       at most one ticket, the one with the lowest barcode. This is a fixed
+       number of queries, plus one UPDATE per IMPORT_CHUNK_SIZE tickets.
+
+       Returns the number of tickets linked.
+    """
+    tickets = Ticket.objects.filter(user=None).exclude(search_email='')
+    profiles = UserProfile.objects.filter(
+        user__ticket=None, search_email__in=tickets.values('search_email'))
+    if user_ids is not None:
+        profiles = profiles.filter(
+            search_email__in=UserProfile.objects.filter(
+                user_id__in=list(user_ids)).exclude(
+                    search_email='').values('search_email'))
+    users = {}
+    for email, user_id in profiles.values_list('search_email', 'user_id'):
+        users.setdefault(email, []).append(user_id)
+    users = dict((email, ids[0]) for email, ids in users.items()
+                 if len(ids) == 1)
+    if not users:
+        return 0
+
+    links = {}
+    for barcode, email in tickets.filter(
+            search_email__in=list(users)).order_by('barcode').values_list(
+                'barcode', 'search_email'):
+        links.setdefault(users[email], barcode)
+    links = sorted((barcode, user_id) for user_id, barcode in links.items())
+
+    with transaction.atomic():
+        for i in range(0, len(links), IMPORT_CHUNK_SIZE):
+            chunk = links[i:i + IMPORT_CHUNK_SIZE]
+            Ticket.objects.filter(
+                pk__in=[barcode for barcode, _ in chunk], user=None
+            ).update(user=Case(
+                *[When(pk=barcode, then=Value(user_id))
+                  for barcode, user_id in chunk],
+                output_field=IntegerField()))
+        tickets_imported.send(sender=Ticket,
+                              user_ids=[user_id for _, user_id in links])
+    log.info('Linked %d tickets to users', len(links))
+    return len(links)
+
+
+def check_in(barcode, when=None):
+    """Check in the ticket with barcode.
+
+       Returns the ticket (None if there is no such ticket), and whether
+       this was the first scan. Checking in is a single conditional UPDATE,
+       so concurrent scans of the same ticket only check it in once.
+    """
+    when = when or timezone.now()
     try:
-        user = UserModel.objects.get(email=email, ticket=None)
-    except UserModel.DoesNotExist:
-        user = None
-    except UserModel.MultipleObjectsReturned:
-        # We're can't uniquely identify the user to associate this ticket
-        # with, so leave it for them to figure out via the 'claim ticket'
-        # interface
-        user = None
-
-    ticket = Ticket.objects.create(
-        barcode=ticket_barcode,
-        email=email,
-        type=type_,
-        user=user,
-    )
-    ticket.save()
-
-    if user:
-        log.info('Ticket registered: %s and linked to user', ticket)
-    else:
-        log.info('Ticket registered: %s. Unclaimed', ticket)
+        ticket = Ticket.objects.select_related('type').get(barcode=barcode)
+    except Ticket.DoesNotExist:
+        return None, False
+    if ticket.checked_in:
+        return ticket, False
+    with transaction.atomic():
+        if Ticket.objects.filter(barcode=barcode, checked_in__isnull=True
+                                 ).update(checked_in=when):
+            TicketType.objects.filter(pk=ticket.type_id).update(
+                checked_in_count=F('checked_in_count') + 1)
+            ticket.checked_in = when
+            return ticket, True
+    # Another scanner got there first
+    ticket.checked_in = Ticket.objects.values_list(
+        'checked_in', flat=True).get(barcode=barcode)
+    return ticket, False
+
+
+def check_in_many(scans):
+    """Check in a batch of (barcode, when) scans, from an offline scanner.
+
+       A ticket is checked in at its earliest scan, and every other scan
+       of it is a duplicate. This is a fixed number of queries, plus one
+       per ticket type checked in.
+
+       Returns a (ticket, first scan) tuple per scan, as check_in does.
+    """
+    earliest = {}
+    for barcode, when in scans:
+        if barcode not in earliest or when < earliest[barcode]:
+            earliest[barcode] = when
+
+    with transaction.atomic():
+        tickets = Ticket.objects.select_for_update().in_bulk(list(earliest))
+        new = dict((barcode, earliest[barcode])
+                   for barcode, ticket in tickets.items()
+                   if not ticket.checked_in)
+        if new:
+            Ticket.objects.filter(pk__in=list(new)).update(checked_in=Case(
+                *[When(pk=barcode, then=Value(when))
+                  for barcode, when in new.items()],
+                output_field=Ticket._meta.get_field('checked_in')))
+            per_type = {}
+            for barcode, when in new.items():
+                ticket = tickets[barcode]
+                ticket.checked_in = when
+                per_type[ticket.type_id] = per_type.get(ticket.type_id, 0) + 1
+            for type_id, count in per_type.items():
+                TicketType.objects.filter(pk=type_id).update(
+                    checked_in_count=F('checked_in_count') + count)
+
+    types = TicketType.objects.in_bulk(
+        list(set(ticket.type_id for ticket in tickets.values())))
+    results = []
+    for barcode, when in scans:
+        ticket = tickets.get(barcode)
+        if ticket is None:
+            results.append((None, False))
+            continue
+        ticket.type = types[ticket.type_id]
+        first = new.get(barcode) == when
+        if first:
+            del new[barcode]
+        results.append((ticket, first))
+    return results
+
+
+def checked_in_counts():
+    """The number of checked in tickets, by ticket type. This reads the
+       counters, so it doesn't touch the tickets table."""
+    by_type = dict(TicketType.objects.values_list('name',
+                                                  'checked_in_count'))
+    return {'total': sum(by_type.values()), 'by_type': by_type}
+
+
+def scan_result(barcode, ticket, first):
+    if ticket is None:
+        return {'barcode': barcode, 'status': UNKNOWN}
+    return {
+        'barcode': barcode,
+        'status': CHECKED_IN if first else DUPLICATE,
+        'checked_in': ticket.checked_in,
+        'ticket_type': ticket.type.name,
+        'email': ticket.email,
+    }
+
+
+class CheckInView(APIView):
+    """Check in a scanned ticket.
+
+       POST {"barcode": 12345}. The response's status is "checked_in" on
+       the first scan, "duplicate" after that, and "unknown" (with a 404)
+       for barcodes that aren't tickets. GET returns the check-in counters.
+    """
+    permission_classes = (CheckInPermission, )
+
+    def get(self, request):
+        return Response(checked_in_counts())
+
+    def post(self, request):
+        serializer = ScanSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors,
+                            status=status.HTTP_400_BAD_REQUEST)
+        barcode = serializer.validated_data['barcode']
+        ticket, first = check_in(barcode)
+        return Response(scan_result(barcode, ticket, first),
+                        status=status.HTTP_404_NOT_FOUND if ticket is None
+                        else status.HTTP_200_OK)
+
+
+class CheckInBatchView(APIView):
+    """Upload the queued scans of an offline scanner.
+
+       POST a list of {"barcode": 12345, "scanned": "<ISO 8601 time>"}
+       objects. The response has a result per scan, in the same order, as
+       CheckInView returns them.
+    """
+    permission_classes = (CheckInPermission, )
+
+    def post(self, request):
+        if not isinstance(request.data, list):
+            return Response({'detail': 'Expected a list of scans'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(request.data) > MAX_SCAN_BATCH_SIZE:
+            return Response({'detail': 'At most %d scans can be uploaded at '
+                             'once' % MAX_SCAN_BATCH_SIZE},
+                            status=status.HTTP_400_BAD_REQUEST)
+        serializer = ScanSerializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors,
+                            status=status.HTTP_400_BAD_REQUEST)
+        now = timezone.now()
+        scans = [(scan['barcode'], scan.get('scanned') or now)
+                 for scan in serializer.validated_data]
+        return Response({'results': [
+            scan_result(barcode, ticket, first) for (barcode, _), (
+                ticket, first) in zip(scans, check_in_many(scans))]})
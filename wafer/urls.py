@@ -3,6 +3,8 @@ from django.conf.urls.static import static
 from django.conf import settings
 from django.contrib import admin
 
+from wafer.views import StatsView
+
 admin.autodiscover()
 
 urlpatterns = [
@@ -16,6 +18,7 @@ urlpatterns = [
     url(r'^schedule/', include('wafer.schedule.urls')),
     url(r'^tickets/', include('wafer.tickets.urls')),
     url(r'^kv/', include('wafer.kv.urls')),
+    url(r'^stats/$', StatsView.as_view(), name='wafer_stats'),
 ]
 
 # Serve media
@@ -14,8 +14,19 @@ class UserProfileInline(admin.StackedInline):
     exclude = ('kv',)
 
 
+def registered(obj):
+    return obj.userprofile.registered
+
+
+registered.boolean = True
+registered.admin_order_field = 'userprofile__registered'
+
+
 class UserAdmin(UserAdmin):
     inlines = (UserProfileInline,)
+    list_display = UserAdmin.list_display + (registered,)
+    list_filter = UserAdmin.list_filter + ('userprofile__registered',)
+    list_select_related = ('userprofile',)
 
 
 def username(obj):
@@ -0,0 +1,87 @@
+"""Avatar URL resolution that keeps DNS out of the request path.
+
+libravatar supports federation: a domain can point at its own avatar
+server with a DNS SRV record. Looking that up for every rendered avatar
+blocks the request, so we only ever read the result from the WAFER_CACHE,
+and the wafer_warm_avatars command does the actual DNS lookups. Until a
+domain has been resolved, we use the main libravatar server.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from libravatar import (compose_avatar_url, lookup_avatar_server,
+                        parse_options, parse_user_identity)
+
+
+# How long a resolved avatar server is trusted for
+SERVER_TIMEOUT = 24 * 60 * 60
+
+# Maximum number of URLs memoized in each process
+MEMO_SIZE = 4096
+
+# How long a memoized URL is used for, so servers re-resolved by
+# wafer_warm_avatars, or expired from the WAFER_CACHE, are picked up
+MEMO_TIMEOUT = 10 * 60
+
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def _server_key(domain, https):
+    return 'wafer_avatar_server_%s_%s' % (
+        'https' if https else 'http', domain)
+
+
+def resolve_avatar_server(domain, https=True):
+    """Look up the avatar server for the domain in DNS and store it.
+
+       This blocks on DNS, so don't call it while handling a request."""
+    server = lookup_avatar_server(domain, https) or ''
+    cache = caches[settings.WAFER_CACHE]
+    cache.set(_server_key(domain, https), server, SERVER_TIMEOUT)
+    return server
+
+
+def get_avatar_url(email, size=96, https=True, default='mm'):
+    """Return the avatar URL for the email address, without touching DNS.
+
+       URLs are memoized per (email, size, https, default), for up to
+       MEMO_TIMEOUT seconds. As the email is part of the key, changing a
+       user's email address never returns the old avatar, and stale
+       entries are evicted as new ones arrive.
+    """
+    memo_key = (email.strip().lower(), size, https, default)
+    now = time.time()
+    with _memo_lock:
+        url, expires = _memo.pop(memo_key, (None, None))
+        if url is not None and expires > now:
+            # Back in, at the most recently used end
+            _memo[memo_key] = (url, expires)
+            return url
+
+    avatar_hash, domain = parse_user_identity(email, None)
+    query_string = parse_options(default, size)
+    cache = caches[settings.WAFER_CACHE]
+    server = cache.get(_server_key(domain, https))
+    url = compose_avatar_url(server or None, avatar_hash, query_string,
+                             https)
+
+    if server is not None:
+        # Only memoize once the domain has been resolved, so warming the
+        # cache later is picked up
+        with _memo_lock:
+            _memo[memo_key] = (url, now + MEMO_TIMEOUT)
+            while len(_memo) > MEMO_SIZE:
+                _memo.popitem(last=False)
+    return url
+
+
+def clear_avatar_memo():
+    """Forget all memoized URLs in this process."""
+    with _memo_lock:
+        _memo.clear()
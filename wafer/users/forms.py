@@ -76,10 +76,17 @@ class ExampleRegistrationForm(forms.Form):
         Given a user's kv_data query, determine if they have registered to
         attend.
         """
-        for item in kv_data.filter(key__in=('debcamp', 'debconf')):
-            if item.value is True:
-                return True
-        return False
+        return cls.is_registered_values(dict(
+            (item.key, item.value)
+            for item in kv_data.filter(key__in=('debcamp', 'debconf'))))
+
+    @classmethod
+    def is_registered_values(cls, values):
+        """
+        Given a dict of a user's registration data, determine if they have
+        registered to attend. This lets bulk exports avoid a query per user.
+        """
+        return any(values.get(key) is True for key in ('debcamp', 'debconf'))
 
     def initial_values(self, user):
         """Set default values, based on the user"""
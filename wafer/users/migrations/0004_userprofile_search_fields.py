@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from wafer.utils import backfill
+
+
+def fill_search_fields(apps, schema_editor):
+    # Use apps to ensure we have the correct version
+    UserProfile = apps.get_model('users', 'UserProfile')
+
+    def search_fields(profiles):
+        fields = {}
+        for profile in profiles:
+            user = profile.user
+            full_name = u'%s %s' % (user.first_name, user.last_name)
+            display_name = full_name.strip() or user.username
+            fields[profile.pk] = {
+                'search_username': user.username.lower(),
+                'search_name': display_name.lower()[:255],
+            }
+        return fields
+
+    backfill(UserProfile.objects.select_related('user'), search_fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_auto_20160329_2003'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='search_name',
+            field=models.CharField(default='', max_length=255, db_index=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='search_username',
+            field=models.CharField(default='', max_length=150, db_index=True, editable=False),
+        ),
+        migrations.RunPython(fill_search_fields,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """Index auth_user by the ordering of the users list, for its keyset
+       pagination."""
+
+    dependencies = [
+        ('users', '0004_userprofile_search_fields'),
+    ]
+
+    operations = [
+        # Lists of statements, so they don't need splitting with sqlparse
+        migrations.RunSQL(
+            ['CREATE INDEX wafer_user_name_ordering ON auth_user'
+             ' (first_name, last_name, username)'],
+            ['DROP INDEX wafer_user_name_ordering']),
+    ]
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+from wafer.utils import backfill
+
+
+def fill_registered(apps, schema_editor):
+    # Use apps to ensure we have the correct version
+    UserProfile = apps.get_model('users', 'UserProfile')
+    if settings.WAFER_REGISTRATION_MODE == 'ticket':
+        Ticket = apps.get_model('tickets', 'Ticket')
+        UserProfile.objects.filter(user_id__in=Ticket.objects.filter(
+            user__isnull=False).values('user_id')).update(registered=True)
+    elif settings.WAFER_REGISTRATION_MODE == 'form':
+        form = import_string(settings.WAFER_REGISTRATION_FORM)
+        Group = apps.get_model('auth', 'Group')
+        KeyValue = apps.get_model('kv', 'KeyValue')
+        group = Group.objects.filter(name='Registration').first()
+        if group is None:
+            # Nobody has registered
+            return
+
+        def registered(profiles):
+            if not hasattr(form, 'is_registered_values'):
+                return dict((profile.pk, {'registered': True})
+                            for profile in profiles
+                            if form.is_registered(profile.kv))
+            # The batch's registration data, in one query
+            data = {}
+            for pair in KeyValue.objects.filter(
+                    group=group,
+                    userprofile__in=[profile.pk for profile in profiles]
+                    ).annotate(profile_id=F('userprofile')).order_by('pk'):
+                data.setdefault(pair.profile_id, {}).setdefault(
+                    pair.key, pair.value)
+            return dict((profile.pk, {'registered': True})
+                        for profile in profiles
+                        if form.is_registered_values(
+                            data.get(profile.pk, {})))
+
+        backfill(UserProfile.objects.all(), registered)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_user_name_index'),
+        ('tickets', '0003_longer_email_field'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='registered',
+            field=models.BooleanField(default=False, db_index=True, editable=False),
+        ),
+        migrations.RunPython(fill_registered,
+                             migrations.RunPython.noop),
+    ]
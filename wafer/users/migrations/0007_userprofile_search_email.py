@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from wafer.utils import backfill
+
+
+def fill_search_email(apps, schema_editor):
+    # Use apps to ensure we have the correct version
+    UserProfile = apps.get_model('users', 'UserProfile')
+
+    def search_email(profiles):
+        # A copy of wafer.utils.normalize_email, as it was when this
+        # migration was written
+        emails = dict((profile.pk, (profile.user.email or u'').strip().lower())
+                      for profile in profiles)
+        return dict((pk, {'search_email': email[:254]})
+                    for pk, email in emails.items() if email)
+
+    backfill(UserProfile.objects.select_related('user'), search_email)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_userprofile_registered'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='search_email',
+            field=models.CharField(default='', max_length=254, db_index=True, editable=False),
+        ),
+        migrations.RunPython(fill_search_email,
+                             migrations.RunPython.noop),
+    ]
@@ -1,20 +1,29 @@
 from django.conf import settings
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Group, User
+from django.core.cache import caches
 from django.db import models
-from django.db.models import Q
-from django.db.models.signals import post_save
+from django.db.models import F, Q
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
 from django.utils.encoding import python_2_unicode_compatible
 from django.core.validators import RegexValidator
 
-from libravatar import libravatar_url
 try:
     from urllib2 import urlparse
 except ImportError:
     from urllib import parse as urlparse
 
 from wafer.kv.models import KeyValue
-from wafer.talks.models import (ACCEPTED, SUBMITTED, UNDER_CONSIDERATION,
-                                PROVISIONAL, CANCELLED)
+from wafer.kv.signals import pairs_changed, pairs_deleting
+from wafer.kv.utils import deleting_in_bulk
+from wafer.schedule.models import ScheduleItem
+from wafer.tickets.models import Ticket, deleting_tickets_in_bulk
+from wafer.tickets.signals import tickets_deleted, tickets_imported
+from wafer.users.avatars import get_avatar_url
+from wafer.utils import (bump_cache_version, get_cache_version,
+                         normalize_email)
+from wafer.talks.models import (Talk, ACCEPTED, SUBMITTED,
+                                UNDER_CONSIDERATION, PROVISIONAL, CANCELLED)
 
 
 # validate format of twitter handle
@@ -42,6 +51,22 @@ class UserProfile(models.Model):
                                       validators=[TwitterValidator])
     github_username = models.CharField(max_length=32, null=True, blank=True)
 
+    # Lower-cased copies of the username and display name, kept in sync
+    # when the user is saved, so autocompletion can use indexed prefix
+    # searches. search_email is the normalized email address, used to
+    # match users to tickets.
+    search_username = models.CharField(max_length=150, db_index=True,
+                                       default='', editable=False)
+    search_name = models.CharField(max_length=255, db_index=True,
+                                   default='', editable=False)
+    search_email = models.CharField(max_length=254, db_index=True,
+                                    default='', editable=False)
+
+    # Whether the user has registered to attend (see compute_registered),
+    # kept up to date by refresh_registered.
+    registered = models.BooleanField(default=False, db_index=True,
+                                     editable=False)
+
     def __str__(self):
         return u'%s' % self.user
 
@@ -61,7 +86,7 @@ class UserProfile(models.Model):
     def avatar_url(self, size=96, https=True, default='mm'):
         if not self.user.email:
             return None
-        return libravatar_url(self.user.email, size=size, https=https,
+        return get_avatar_url(self.user.email, size=size, https=https,
                               default=default)
 
     def homepage_url(self):
@@ -84,6 +109,13 @@ class UserProfile(models.Model):
         return self.user.get_full_name() or self.user.username
 
     def is_registered(self):
+        return self.registered
+
+    is_registered.boolean = True
+
+    def compute_registered(self):
+        """Work out whether the user is registered, from their tickets or
+           registration form data, ignoring the registered field."""
         from wafer.users.forms import get_registration_form_class
 
         if settings.WAFER_REGISTRATION_MODE == 'ticket':
@@ -91,16 +123,308 @@ class UserProfile(models.Model):
         elif settings.WAFER_REGISTRATION_MODE == 'form':
             form = get_registration_form_class()
             return form.is_registered(self.kv)
-        raise NotImplemented('Invalid WAFER_REGISTRATION_MODE: %s'
-                             % settings.WAFER_REGISTRATION_MODE)
+        raise NotImplementedError('Invalid WAFER_REGISTRATION_MODE: %s'
+                                  % settings.WAFER_REGISTRATION_MODE)
 
-    is_registered.boolean = True
+
+def get_registration_data(profiles, group):
+    """Return the KV data in group for the profiles, as a dict of dicts,
+       by profile pk. This is a single query."""
+    data = {}
+    pairs = KeyValue.objects.filter(
+        group=group, userprofile__in=[profile.pk for profile in profiles]
+    ).annotate(profile_id=F('userprofile')).order_by('pk')
+    for pair in pairs:
+        # Only the first value for each key
+        data.setdefault(pair.profile_id, {}).setdefault(pair.key, pair.value)
+    return data
+
+
+REFRESH_CHUNK_SIZE = 1000
+
+
+def refresh_registered(user_ids=None):
+    """Update the registered flag of the given users' profiles, or
+       everyone's."""
+    profiles = UserProfile.objects.all()
+    if user_ids is not None:
+        profiles = profiles.filter(user_id__in=list(user_ids))
+
+    if settings.WAFER_REGISTRATION_MODE == 'ticket':
+        ticket_holders = Ticket.objects.filter(
+            user__isnull=False).values('user_id')
+        profiles.filter(user_id__in=ticket_holders).exclude(
+            registered=True).update(registered=True)
+        profiles.exclude(user_id__in=ticket_holders).exclude(
+            registered=False).update(registered=False)
+        return
+    elif settings.WAFER_REGISTRATION_MODE != 'form':
+        raise NotImplementedError('Invalid WAFER_REGISTRATION_MODE: %s'
+                                  % settings.WAFER_REGISTRATION_MODE)
+
+    from wafer.users.forms import get_registration_form_class
+    form = get_registration_form_class()
+    try:
+        group = Group.objects.get_by_natural_key('Registration')
+    except Group.DoesNotExist:
+        profiles.exclude(registered=False).update(registered=False)
+        return
+    profiles = profiles.order_by('pk')
+    last_pk = 0
+    while True:
+        chunk = list(profiles.filter(pk__gt=last_pk).only(
+            'pk', 'registered')[:REFRESH_CHUNK_SIZE])
+        if not chunk:
+            break
+        last_pk = chunk[-1].pk
+        if hasattr(form, 'is_registered_values'):
+            data = get_registration_data(chunk, group)
+            registered = set(profile.pk for profile in chunk
+                             if form.is_registered_values(
+                                 data.get(profile.pk, {})))
+        else:
+            registered = set(profile.pk for profile in chunk
+                             if form.is_registered(profile.kv))
+        to_true = [profile.pk for profile in chunk
+                   if profile.pk in registered and not profile.registered]
+        to_false = [profile.pk for profile in chunk
+                    if profile.pk not in registered and profile.registered]
+        # Separate updates, as an empty pk__in inside a Case matches
+        # nothing on Django 1.8
+        if to_true:
+            UserProfile.objects.filter(pk__in=to_true).update(
+                registered=True)
+        if to_false:
+            UserProfile.objects.filter(pk__in=to_false).update(
+                registered=False)
+
+
+def user_search_fields(user):
+    """Values for the UserProfile search fields of the given user."""
+    display_name = user.get_full_name() or user.username
+    return {
+        'search_username': user.username.lower(),
+        'search_name': display_name.lower()[:255],
+        'search_email': normalize_email(user.email)[:254],
+    }
+
+
+def search_users(term, limit):
+    """Return up to limit profiles whose username or display name starts
+       with term, ignoring case."""
+    term = term.strip().lower()
+    if not term:
+        return UserProfile.objects.none()
+    return UserProfile.objects.filter(
+        Q(search_username__startswith=term) |
+        Q(search_name__startswith=term)
+    ).select_related('user').order_by('search_name', 'search_username')[:limit]
 
 
-def create_user_profile(sender, instance, created, raw=False, **kwargs):
+def get_speaker_profiles():
+    """Return the profiles of all speakers with accepted talks.
+
+       The list is cached until a talk, its authors or a speaker's details
+       change."""
+    cache = caches[settings.WAFER_CACHE]
+    key = 'wafer_speakers_%s' % get_cache_version('speakers')
+    speakers = cache.get(key)
+    if speakers is None:
+        speakers = list(UserProfile.objects.filter(
+            user__talks__status=ACCEPTED).distinct().select_related(
+                'user').order_by('user__first_name', 'user__last_name',
+                                 'user__username'))
+        cache.set(key, speakers, 24 * 60 * 60)
+    return speakers
+
+
+SEARCH_FIELD_SOURCES = frozenset(('username', 'first_name', 'last_name'))
+# User fields that are shown in public speaker details, which are also
+# the ones copied to the UserProfile search fields
+PUBLIC_FIELD_SOURCES = SEARCH_FIELD_SOURCES | frozenset(('email',))
+
+
+def create_user_profile(sender, instance, created, raw=False,
+                        update_fields=None, **kwargs):
     if raw:
         return
     if created:
-        UserProfile.objects.create(user=instance)
+        UserProfile.objects.create(user=instance,
+                                   **user_search_fields(instance))
+    elif update_fields is None or PUBLIC_FIELD_SOURCES & set(update_fields):
+        UserProfile.objects.filter(user=instance).update(
+            **user_search_fields(instance))
+    else:
+        # e.g. last_login updates, which don't affect searches
+        return
+    bump_cache_version('users_search')
+
+
+def invalidate_user_search(sender, **kwargs):
+    bump_cache_version('users_search')
+
+
+def invalidate_users_list(sender, update_fields=None, action=None,
+                          **kwargs):
+    if action is not None and action.startswith('pre_'):
+        return
+    if (sender is User and update_fields is not None and
+            not SEARCH_FIELD_SOURCES & set(update_fields)):
+        # The list is ordered by name, and only shows names
+        return
+    bump_cache_version('users_list')
+
+
+def invalidate_speakers(sender, update_fields=None, action=None, **kwargs):
+    if action is not None and action.startswith('pre_'):
+        # m2m_changed, we'll invalidate after the change
+        return
+    if (sender is User and update_fields is not None and
+            not PUBLIC_FIELD_SOURCES & set(update_fields)):
+        return
+    bump_cache_version('speakers')
+
 
 post_save.connect(create_user_profile, sender=User)
+post_delete.connect(invalidate_user_search, sender=User)
+
+post_save.connect(invalidate_speakers, sender=User)
+post_save.connect(invalidate_speakers, sender=UserProfile)
+post_delete.connect(invalidate_speakers, sender=UserProfile)
+post_save.connect(invalidate_speakers, sender=Talk)
+post_delete.connect(invalidate_speakers, sender=Talk)
+m2m_changed.connect(invalidate_speakers, sender=Talk.authors.through)
+
+# Without a public attendee list, the users list only has speakers
+post_save.connect(invalidate_users_list, sender=User)
+post_delete.connect(invalidate_users_list, sender=User)
+post_save.connect(invalidate_users_list, sender=Talk)
+post_delete.connect(invalidate_users_list, sender=Talk)
+m2m_changed.connect(invalidate_users_list, sender=Talk.authors.through)
+
+
+def ticket_changed(sender, instance, raw=False, **kwargs):
+    if (raw or settings.WAFER_REGISTRATION_MODE != 'ticket' or
+            deleting_tickets_in_bulk()):
+        return
+    # Refresh whoever held the ticket when it was loaded, too
+    user_ids = set([instance.user_id,
+                    getattr(instance, '_wafer_loaded_user_id', None)])
+    user_ids.discard(None)
+    if user_ids:
+        refresh_registered(user_ids)
+
+
+def registration_kv_changed(sender, instance, raw=False, action=None,
+                            **kwargs):
+    if raw or settings.WAFER_REGISTRATION_MODE != 'form':
+        return
+    if action is not None and not action.startswith('post_'):
+        return
+    if isinstance(instance, UserProfile):
+        refresh_registered([instance.user_id])
+    else:
+        refresh_registered(instance.userprofile_set.values_list(
+            'user_id', flat=True))
+
+
+def tickets_changed_in_bulk(sender, user_ids, **kwargs):
+    if settings.WAFER_REGISTRATION_MODE == 'ticket':
+        refresh_registered(user_ids)
+
+
+def registration_pairs_changed(sender, pks, **kwargs):
+    if settings.WAFER_REGISTRATION_MODE != 'form':
+        return
+    refresh_registered(UserProfile.objects.filter(
+        kv__in=pks).values_list('user_id', flat=True))
+
+
+def registration_pairs_deleting(sender, pks, **kwargs):
+    if settings.WAFER_REGISTRATION_MODE != 'form':
+        return
+    user_ids = list(UserProfile.objects.filter(
+        kv__in=pks).values_list('user_id', flat=True))
+    if user_ids:
+        return lambda: refresh_registered(user_ids)
+
+
+def registration_kv_deleting(sender, instance, **kwargs):
+    if settings.WAFER_REGISTRATION_MODE != 'form' or deleting_in_bulk():
+        return
+    # The links to the profiles are gone by post_delete
+    instance._wafer_profile_user_ids = list(
+        instance.userprofile_set.values_list('user_id', flat=True))
+
+
+def registration_kv_deleted(sender, instance, **kwargs):
+    user_ids = getattr(instance, '_wafer_profile_user_ids', None)
+    if user_ids:
+        refresh_registered(user_ids)
+
+
+post_save.connect(ticket_changed, sender=Ticket)
+post_delete.connect(ticket_changed, sender=Ticket)
+tickets_imported.connect(tickets_changed_in_bulk, sender=Ticket)
+tickets_deleted.connect(tickets_changed_in_bulk, sender=Ticket)
+post_save.connect(registration_kv_changed, sender=KeyValue)
+m2m_changed.connect(registration_kv_changed, sender=UserProfile.kv.through)
+pairs_changed.connect(registration_pairs_changed, sender=KeyValue)
+pairs_deleting.connect(registration_pairs_deleting, sender=KeyValue)
+pre_delete.connect(registration_kv_deleting, sender=KeyValue)
+post_delete.connect(registration_kv_deleted, sender=KeyValue)
+
+
+def get_profile_cache_version(user_id):
+    """Version of the cached public profile page of the user."""
+    return get_cache_version('profile_%s' % user_id)
+
+
+def invalidate_profiles(user_ids):
+    for user_id in set(user_ids):
+        bump_cache_version('profile_%s' % user_id)
+
+
+def _talk_author_ids(talk_id):
+    return Talk.authors.through.objects.filter(
+        talk_id=talk_id).values_list('user_id', flat=True)
+
+
+def invalidate_user_profile(sender, instance, **kwargs):
+    if isinstance(instance, UserProfile):
+        invalidate_profiles([instance.user_id])
+    else:
+        invalidate_profiles([instance.pk])
+
+
+def invalidate_talk_profiles(sender, instance, **kwargs):
+    invalidate_profiles(_talk_author_ids(instance.pk))
+
+
+def invalidate_author_profiles(sender, instance, action, reverse, pk_set,
+                               **kwargs):
+    if reverse:
+        # user.talks changed
+        if action.startswith('post_'):
+            invalidate_profiles([instance.pk])
+    elif action == 'pre_clear':
+        # We won't know who they were afterwards
+        invalidate_profiles(_talk_author_ids(instance.pk))
+    elif action.startswith('post_') and pk_set:
+        invalidate_profiles(pk_set)
+
+
+def invalidate_scheduled_talk_profiles(sender, instance, **kwargs):
+    if instance.talk_id:
+        invalidate_profiles(_talk_author_ids(instance.talk_id))
+
+
+post_save.connect(invalidate_user_profile, sender=User)
+post_save.connect(invalidate_user_profile, sender=UserProfile)
+post_save.connect(invalidate_talk_profiles, sender=Talk)
+# The authors are gone by post_delete
+pre_delete.connect(invalidate_talk_profiles, sender=Talk)
+m2m_changed.connect(invalidate_author_profiles,
+                    sender=Talk.authors.through)
+post_save.connect(invalidate_scheduled_talk_profiles, sender=ScheduleItem)
+post_delete.connect(invalidate_scheduled_talk_profiles, sender=ScheduleItem)
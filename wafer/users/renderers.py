@@ -1,6 +1,5 @@
 from django_medusa.renderers import StaticSiteRenderer
 from django.core.urlresolvers import reverse
-from django.contrib.auth import get_user_model
 from django.conf import settings
 
 from wafer.users.views import UsersView
@@ -10,18 +9,14 @@ class UserRenderer(StaticSiteRenderer):
     def get_paths(self):
         paths = ['/users/']
 
-        items = get_user_model().objects.all()
-        for item in items:
-            if not settings.WAFER_PUBLIC_ATTENDEE_LIST:
-                # We need to filter out the non-publically
-                # accessible paths from the static site
-                if not item.userprofile.accepted_talks().exists():
-                    continue
+        # Without a public attendee list, this only has speakers, so we
+        # don't render the non-publically accessible profiles
+        view = UsersView()
+        queryset = view.get_queryset()
+        for username in queryset.values_list('username', flat=True):
             paths.append(reverse('wafer_user_profile',
-                                 kwargs={'username': item.username}))
+                                 kwargs={'username': username}))
         if settings.WAFER_PUBLIC_ATTENDEE_LIST:
-            view = UsersView()
-            queryset = view.get_queryset()
             paginator = view.get_paginator(queryset,
                                            view.get_paginate_by(queryset))
             for page in paginator.page_range:
@@ -2,8 +2,22 @@
 # vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
 """Tests for wafer.user.models"""
 
+import time
+
+import mock
+
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils.six import StringIO
+
+from wafer.kv.models import KeyValue
+from wafer.kv.utils import upsert_kv
+from wafer.tickets.models import Ticket, TicketType
+from wafer.users import avatars
+from wafer.users.avatars import clear_avatar_memo
+from wafer.users.models import UserProfile
 
 import sys
 PY2 = sys.version_info[0] == 2
@@ -21,3 +35,118 @@ class UserModelTestCase(TestCase):
             self.assertEqual(unicode(user.userprofile), u'tést')
         else:
             self.assertEqual(str(user.userprofile), u'tést')
+
+
+def stub_avatar_server(domain, https):
+    if domain == 'federated.example.com':
+        return 'avatars.federated.example.com'
+    return None
+
+
+@mock.patch('wafer.users.avatars.lookup_avatar_server', stub_avatar_server)
+class AvatarUrlTestCase(TestCase):
+
+    def setUp(self):
+        clear_avatar_memo()
+        create = get_user_model().objects.create_user
+        self.user = create('fed', 'Fed@federated.example.com', 'fed_pass')
+
+    def test_no_dns_in_request_path(self):
+        with mock.patch('wafer.users.avatars.lookup_avatar_server') as dns:
+            url = self.user.userprofile.avatar_url()
+        self.assertFalse(dns.called)
+        self.assertTrue(url.startswith(
+            'https://seccdn.libravatar.org/avatar/'))
+
+    def test_warmed_domain(self):
+        call_command('wafer_warm_avatars', '--all', stdout=StringIO())
+        url = self.user.userprofile.avatar_url(size=48)
+        self.assertTrue(url.startswith(
+            'https://avatars.federated.example.com/avatar/'))
+        self.assertTrue(url.endswith('?d=mm&s=48'))
+
+    def test_memo_expires(self):
+        call_command('wafer_warm_avatars', '--all', stdout=StringIO())
+        self.user.userprofile.avatar_url()
+        with mock.patch('wafer.users.avatars.lookup_avatar_server',
+                        return_value='avatars2.federated.example.com'):
+            call_command('wafer_warm_avatars', '--all', stdout=StringIO())
+        # Memoized
+        self.assertTrue(self.user.userprofile.avatar_url().startswith(
+            'https://avatars.federated.example.com/avatar/'))
+        later = time.time() + avatars.MEMO_TIMEOUT + 1
+        with mock.patch('time.time', return_value=later):
+            url = self.user.userprofile.avatar_url()
+        self.assertTrue(url.startswith(
+            'https://avatars2.federated.example.com/avatar/'))
+
+    def test_email_change(self):
+        call_command('wafer_warm_avatars', '--all', stdout=StringIO())
+        old_url = self.user.userprofile.avatar_url()
+        self.user.email = 'fed@example.com'
+        self.user.save()
+        new_url = self.user.userprofile.avatar_url()
+        self.assertNotEqual(old_url, new_url)
+        self.assertTrue(new_url.startswith(
+            'https://seccdn.libravatar.org/avatar/'))
+
+
+class RegisteredFlagTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'attendee', 'attendee@example.com', 'password')
+
+    def profile(self):
+        return UserProfile.objects.get(user=self.user)
+
+    def test_ticket_mode(self):
+        ticket_type = TicketType.objects.create(name='Regular')
+        with self.settings(WAFER_REGISTRATION_MODE='ticket'):
+            ticket = Ticket.objects.create(barcode=1, type=ticket_type)
+            self.assertFalse(self.profile().is_registered())
+            # Claim
+            ticket.user = self.user
+            ticket.save()
+            self.assertTrue(self.profile().is_registered())
+            # Hand over to someone else
+            other = get_user_model().objects.create_user('other')
+            ticket = Ticket.objects.get(barcode=1)
+            ticket.user = other
+            ticket.save()
+            self.assertFalse(self.profile().is_registered())
+            self.assertTrue(UserProfile.objects.get(
+                user=other).is_registered())
+            # Cancel
+            ticket.delete()
+            self.assertFalse(UserProfile.objects.get(
+                user=other).is_registered())
+
+    def test_form_mode(self):
+        group = Group.objects.create(name='Registration')
+        with self.settings(WAFER_REGISTRATION_MODE='form'):
+            upsert_kv(self.user.userprofile.kv, group, {'debconf': True})
+            self.assertTrue(self.profile().is_registered())
+            pair = self.user.userprofile.kv.get(key='debconf')
+            pair.value = False
+            pair.save()
+            self.assertFalse(self.profile().is_registered())
+
+    def test_form_mode_bulk_changes(self):
+        group = Group.objects.create(name='Registration')
+        with self.settings(WAFER_REGISTRATION_MODE='form'):
+            upsert_kv(self.user.userprofile.kv, group, {'debconf': False})
+            self.assertFalse(self.profile().is_registered())
+            # Bulk updates bypass post_save
+            upsert_kv(self.user.userprofile.kv, group, {'debconf': True})
+            self.assertTrue(self.profile().is_registered())
+            KeyValue.objects.filter(key='debconf').delete()
+            self.assertFalse(self.profile().is_registered())
+
+    def test_refresh_all(self):
+        ticket_type = TicketType.objects.create(name='Regular')
+        Ticket.objects.create(barcode=1, type=ticket_type, user=self.user)
+        UserProfile.objects.update(registered=False)
+        with self.settings(WAFER_REGISTRATION_MODE='ticket'):
+            call_command('wafer_refresh_registered', stdout=StringIO())
+        self.assertTrue(self.profile().is_registered())
+        self.assertTrue(self.profile().compute_registered())
@@ -0,0 +1,233 @@
+"""Tests for wafer.users views."""
+
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+
+import mock
+
+from wafer.kv.utils import upsert_kv
+from wafer.talks.forms import TalkForm
+from wafer.talks.models import ACCEPTED, Talk
+from wafer.users.models import get_profile_cache_version
+from wafer.users.views import UsersView
+
+
+class UserAutocompleteTests(TestCase):
+    def setUp(self):
+        create = get_user_model().objects.create_user
+        self.alice = create('alice', 'alice@example.com', 'alice_password',
+                            first_name='Alice', last_name='Smith')
+        self.bob = create('bob', 'bob@example.com', 'bob_password',
+                          first_name='Robert', last_name='Jones')
+        self.client = Client()
+        self.client.login(username='alice', password='alice_password')
+
+    def search(self, term):
+        response = self.client.get('/users/api/autocomplete/', {'q': term})
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content.decode('utf-8'))['results']
+        return [item['id'] for item in results]
+
+    def test_username_prefix(self):
+        self.assertEqual(self.search('BO'), [self.bob.pk])
+
+    def test_display_name_prefix(self):
+        self.assertEqual(self.search('rob'), [self.bob.pk])
+        self.assertEqual(self.search('alice sm'), [self.alice.pk])
+
+    def test_empty_term(self):
+        self.assertEqual(self.search(''), [])
+
+    def test_rename_invalidates_results(self):
+        self.assertEqual(self.search('bobby'), [])
+        self.bob.first_name = 'Bobby'
+        self.bob.save()
+        self.assertEqual(self.search('bobby'), [self.bob.pk])
+
+    def test_limit(self):
+        with self.settings(WAFER_USER_AUTOCOMPLETE_LIMIT=1):
+            self.assertEqual(len(self.search('a')), 1)
+
+    def test_anonymous(self):
+        response = Client().get('/users/api/autocomplete/', {'q': 'bob'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_private_attendee_list(self):
+        with self.settings(WAFER_PUBLIC_ATTENDEE_LIST=False):
+            response = self.client.get('/users/api/autocomplete/',
+                                       {'q': 'bob'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_talk_form_only_renders_selected_authors(self):
+        form = TalkForm(user=self.alice, instance=None)
+        html = form['authors'].as_widget()
+        self.assertIn('alice', html)
+        self.assertNotIn('bob', html)
+
+
+class UsersViewTests(TestCase):
+    def setUp(self):
+        create = get_user_model().objects.create_user
+        for i in range(7):
+            create('user%d' % i, 'user%d@example.com' % i, 'password',
+                   first_name='First', last_name='%d' % (6 - i))
+
+    def usernames(self, response):
+        return [user.username for user in response.context['user_list']]
+
+    def test_pages(self):
+        with self.settings(WAFER_PUBLIC_ATTENDEE_LIST=True):
+            with mock.patch.object(UsersView, 'paginate_by', 3):
+                pages = [self.usernames(self.client.get(url)) for url in
+                         ('/users/', '/users/page/2/', '/users/page/3/')]
+                response = self.client.get('/users/page/4/')
+        self.assertEqual(pages, [['user6', 'user5', 'user4'],
+                                 ['user3', 'user2', 'user1'],
+                                 ['user0']])
+        self.assertEqual(response.status_code, 404)
+
+    def test_pages_seek_from_previous_page(self):
+        with self.settings(WAFER_PUBLIC_ATTENDEE_LIST=True):
+            with mock.patch.object(UsersView, 'paginate_by', 3):
+                self.client.get('/users/')
+                # The first key of page 2 was found on page 1, so it's
+                # a range scan from there, without an OFFSET
+                with CaptureQueriesContext(connection) as queries:
+                    self.client.get('/users/page/2/')
+        selects = [query['sql'] for query in queries.captured_queries
+                   if 'FROM "auth_user"' in query['sql']]
+        self.assertEqual(len(selects), 1)
+        self.assertNotIn('OFFSET', selects[0])
+
+    def test_new_user_invalidates_pages(self):
+        with self.settings(WAFER_PUBLIC_ATTENDEE_LIST=True):
+            with mock.patch.object(UsersView, 'paginate_by', 3):
+                self.client.get('/users/')
+                get_user_model().objects.create_user(
+                    'aaron', 'aaron@example.com', 'password',
+                    first_name='Aaron')
+                response = self.client.get('/users/')
+        self.assertEqual(self.usernames(response), ['aaron', 'user6',
+                                                    'user5'])
+        self.assertEqual(response.context['paginator'].count, 8)
+
+    def test_speakers_only(self):
+        speaker = get_user_model().objects.get(username='user3')
+        talk = Talk.objects.create(title='Talk', status=ACCEPTED,
+                                   corresponding_author=speaker)
+        talk.authors.add(speaker)
+        with self.settings(WAFER_PUBLIC_ATTENDEE_LIST=False):
+            response = self.client.get('/users/')
+        self.assertEqual(self.usernames(response), ['user3'])
+
+
+class RegistrationViewTests(TestCase):
+    def setUp(self):
+        self.group = Group.objects.create(name='Registration')
+        self.user = get_user_model().objects.create_user(
+            'attendee', 'attendee@example.com', 'password')
+        self.client = Client()
+        self.client.login(username='attendee', password='password')
+        self.url = '/users/attendee/register/'
+
+    def saved(self):
+        return dict((pair.key, pair.value) for pair in
+                    self.user.userprofile.kv.filter(group=self.group))
+
+    def test_initial(self):
+        upsert_kv(self.user.userprofile.kv, self.group,
+                  {'debcamp': True, 'debconf': False})
+        with self.settings(WAFER_REGISTRATION_MODE='form'):
+            response = self.client.get(self.url)
+        self.assertEqual(response.context['form'].initial,
+                         {'debcamp': True, 'debconf': False})
+
+    def test_upsert_updates_in_place(self):
+        kv = self.user.userprofile.kv
+        upsert_kv(kv, self.group, {'debcamp': False, 'debconf': True})
+        pks = set(kv.values_list('pk', flat=True))
+        upsert_kv(kv, self.group, {'debcamp': True, 'debconf': True})
+        self.assertEqual(self.saved(), {'debcamp': True, 'debconf': True})
+        self.assertEqual(set(kv.values_list('pk', flat=True)), pks)
+
+    def test_upsert_query_count(self):
+        profile = self.user.userprofile
+
+        def upsert(new_keys):
+            data = dict(('key%d_%d' % (new_keys, i), i)
+                        for i in range(new_keys))
+            data['a'] = 'changed %d' % new_keys
+            with CaptureQueriesContext(connection) as queries:
+                upsert_kv(profile.kv, self.group, data)
+            return len(queries.captured_queries)
+
+        upsert_kv(profile.kv, self.group, {'a': 1, 'b': 2})
+        # The same, however many keys are new
+        self.assertEqual(upsert(1), upsert(20))
+        # Savepoint, select existing, one UPDATE, inserting the new keys
+        # (at most 3, with their ids), linking them (2), and releasing the
+        # savepoint
+        self.assertLessEqual(upsert(50), 9)
+        self.assertEqual(profile.kv.get(key='a').value, 'changed 50')
+        self.assertEqual(profile.kv.filter(key__startswith='key20_').count(),
+                         20)
+
+
+class ProfileViewTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'speaker', 'speaker@example.com', 'password')
+        self.talk = Talk.objects.create(title='Old Title', status=ACCEPTED,
+                                        corresponding_author=self.user)
+        self.talk.authors.add(self.user)
+
+    def get(self, client=None):
+        response = (client or Client()).get('/users/speaker/')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode('utf-8')
+
+    def test_cached_for_other_viewers(self):
+        self.assertIn('Old Title', self.get())
+        # Bypasses the signals, so the cached page is still used
+        Talk.objects.filter(pk=self.talk.pk).update(title='Sneaky')
+        self.assertIn('Old Title', self.get())
+
+    def test_shared_between_processes(self):
+        self.get()
+        key = make_template_fragment_key('wafer_profile', [
+            self.user.pk, get_profile_cache_version(self.user.pk),
+            settings.LANGUAGE_CODE])
+        self.assertIsNotNone(caches[settings.WAFER_CACHE].get(key))
+
+    def test_talk_change_invalidates(self):
+        self.get()
+        self.talk.title = 'New Title'
+        self.talk.save()
+        self.assertIn('New Title', self.get())
+
+    def test_profile_change_invalidates(self):
+        self.get()
+        profile = self.user.userprofile
+        profile.bio = 'A new bio'
+        profile.save()
+        self.assertIn('A new bio', self.get())
+
+    def test_removing_author_invalidates(self):
+        self.get()
+        self.talk.authors.clear()
+        self.assertNotIn('Old Title', self.get())
+
+    def test_edit_controls_per_viewer(self):
+        self.get()
+        client = Client()
+        client.login(username='speaker', password='password')
+        self.assertIn('Edit Profile', self.get(client))
+        self.assertNotIn('Edit Profile', self.get())
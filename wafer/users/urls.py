@@ -2,7 +2,8 @@ from django.conf.urls import include, url
 from rest_framework import routers
 
 from wafer.users.views import (UsersView, ProfileView, EditProfileView,
-                               EditUserView, RegistrationView, UserViewSet)
+                               EditUserView, RegistrationView, UserViewSet,
+                               autocomplete_users)
 
 
 router = routers.DefaultRouter()
@@ -11,6 +12,8 @@ router.register(r'users', UserViewSet)
 urlpatterns = [
     url(r'^$', UsersView.as_view(),
         name='wafer_users'),
+    url(r'^api/autocomplete/$', autocomplete_users,
+        name='wafer_users_autocomplete'),
     url(r'^api/', include(router.urls)),
     url(r'^page/(?P<page>\d+)/$', UsersView.as_view(),
         name='wafer_users_page'),
@@ -1,3 +1,4 @@
+import hashlib
 import logging
 
 from django.conf import settings
@@ -5,14 +6,18 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
 from django.contrib.sites.shortcuts import get_current_site
 from django.core.exceptions import (
-    ObjectDoesNotExist, PermissionDenied, ValidationError,
+    PermissionDenied, ValidationError,
 )
+from django.core.cache import caches
 from django.core.mail import EmailMultiAlternatives
+from django.core.paginator import Page, Paginator
 from django.core.urlresolvers import reverse
-from django.http import Http404
+from django.http import Http404, JsonResponse
 from django.shortcuts import render
 from django.template import RequestContext, TemplateDoesNotExist
+from django.db.models import Q
 from django.template.loader import render_to_string
+from django.utils.encoding import force_bytes
 from django.utils.translation import ugettext as _
 from django.views.generic import DetailView, UpdateView
 from django.views.generic.edit import FormView
@@ -21,28 +26,147 @@ from django.views.generic.list import ListView
 from rest_framework import viewsets
 from rest_framework.permissions import IsAdminUser
 
-from wafer.kv.utils import deserialize_by_field
-from wafer.talks.models import ACCEPTED
+from wafer.kv.utils import deserialize_by_field, upsert_kv
+from wafer.talks.models import ACCEPTED, Talk, render_author
 from wafer.users.forms import (
     UserForm, UserProfileForm, get_registration_form_class,
 )
 from wafer.users.serializers import UserSerializer
-from wafer.users.models import UserProfile
+from wafer.users.models import (
+    UserProfile, get_profile_cache_version, refresh_registered, search_users)
+from wafer.utils import get_cache_version
 
 log = logging.getLogger(__name__)
 
 
+def keyset_filter(fields, values):
+    """Q for rows that sort at or after values, when ordered by fields."""
+    q = Q(**{'%s__gte' % fields[-1]: values[-1]})
+    for field, value in reversed(list(zip(fields[:-1], values[:-1]))):
+        q = Q(**{'%s__gt' % field: value}) | (Q(**{field: value}) & q)
+    return q
+
+
+class KeysetPaginator(Paginator):
+    """Paginate a queryset, ordered ascending by unique columns, by
+       seeking to each page's first key.
+
+       Page boundaries are found lazily: fetching a page also fetches the
+       first row of the next one, whose key is cached, so paging through
+       the list is an index range scan per page, however deep it is,
+       rather than an ever larger OFFSET. Only jumping to a page whose
+       first key isn't known yet costs an OFFSET. The count and the keys
+       are cached until cache_version changes."""
+
+    def __init__(self, object_list, per_page, orphans=0,
+                 allow_empty_first_page=True, cache_version=None):
+        # Orphans would make the page boundaries depend on the total,
+        # so they aren't supported
+        super(KeysetPaginator, self).__init__(
+            object_list, per_page, orphans=0,
+            allow_empty_first_page=allow_empty_first_page)
+        self.ordering = object_list.query.order_by
+        self.cache_version = cache_version
+        self._count = None
+
+    def _cache_key(self, name):
+        return 'wafer_keyset_%s_%s_%d_%s' % (
+            self.cache_version, hashlib.md5(
+                force_bytes(self.object_list.query)).hexdigest(),
+            self.per_page, name)
+
+    @property
+    def count(self):
+        if self._count is None:
+            cache = caches[settings.WAFER_CACHE]
+            key = self._cache_key('count')
+            self._count = cache.get(key)
+            if self._count is None:
+                self._count = self.object_list.count()
+                cache.set(key, self._count, 24 * 60 * 60)
+        return self._count
+
+    def _page_start(self, number):
+        """The key of the first row on the page, or None for the first
+           page."""
+        if number == 1:
+            return None
+        cache = caches[settings.WAFER_CACHE]
+        key = self._cache_key('start_%d' % number)
+        start = cache.get(key)
+        if start is None:
+            offset = (number - 1) * self.per_page
+            start = tuple(self.object_list.values_list(
+                *self.ordering)[offset:offset + 1][0])
+            cache.set(key, start, 24 * 60 * 60)
+        return start
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.count:
+            return Page(self.object_list.none(), number, self)
+        object_list = self.object_list
+        start = self._page_start(number)
+        if start is not None:
+            object_list = object_list.filter(
+                keyset_filter(self.ordering, start))
+        object_list = list(object_list[:self.per_page + 1])
+        if len(object_list) > self.per_page:
+            # The first row of the next page
+            following = object_list.pop()
+            caches[settings.WAFER_CACHE].set(
+                self._cache_key('start_%d' % (number + 1)),
+                tuple(getattr(following, field) for field in self.ordering),
+                24 * 60 * 60)
+        return Page(object_list, number, self)
+
+
 class UsersView(ListView):
     template_name = 'wafer.users/users.html'
     model = get_user_model()
     paginate_by = 25
+    paginator_class = KeysetPaginator
 
     def get_queryset(self, *args, **kwargs):
         qs = super(UsersView, self).get_queryset(*args, **kwargs)
         if not settings.WAFER_PUBLIC_ATTENDEE_LIST:
-            qs = qs.filter(talks__status=ACCEPTED).distinct()
+            qs = qs.filter(pk__in=Talk.authors.through.objects.filter(
+                talk__status=ACCEPTED).values('user_id'))
+        # username is unique, so this is a total ordering for the keyset
         qs = qs.order_by('first_name', 'last_name', 'username')
-        return qs
+        return qs.select_related('userprofile')
+
+    def get_paginator(self, queryset, per_page, **kwargs):
+        return super(UsersView, self).get_paginator(
+            queryset, per_page,
+            cache_version=get_cache_version('users_list'), **kwargs)
+
+
+def can_autocomplete_users(user):
+    """Can this user search the list of users?"""
+    if user.is_staff or user.has_perm('talks.change_talk'):
+        return True
+    return (settings.WAFER_PUBLIC_ATTENDEE_LIST and
+            user.is_authenticated())
+
+
+def autocomplete_users(request):
+    """Select2 AJAX endpoint for picking users (talk authors, etc.)"""
+    if not can_autocomplete_users(request.user):
+        raise PermissionDenied()
+    term = request.GET.get('q', request.GET.get('term', ''))
+    limit = getattr(settings, 'WAFER_USER_AUTOCOMPLETE_LIMIT', 20)
+
+    cache = caches[settings.WAFER_CACHE]
+    key = 'wafer_users_autocomplete_%s_%d_%s' % (
+        get_cache_version('users_search'), limit,
+        hashlib.md5(term.strip().lower().encode('utf-8')).hexdigest())
+    results = cache.get(key)
+    if results is None:
+        results = [{'id': profile.user.pk, 'text': render_author(profile.user)}
+                   for profile in search_users(term, limit)]
+        cache.set(key, results, 60 * 60)
+    return JsonResponse({'results': results})
 
 
 class ProfileView(DetailView):
@@ -53,6 +177,10 @@ class ProfileView(DetailView):
     # avoid a clash with the user object used by the menus
     context_object_name = 'profile_user'
 
+    def get_queryset(self):
+        return super(ProfileView, self).get_queryset().select_related(
+            'userprofile')
+
     def get_object(self, *args, **kwargs):
         object_ = super(ProfileView, self).get_object(*args, **kwargs)
         if not settings.WAFER_PUBLIC_ATTENDEE_LIST:
@@ -64,6 +192,12 @@ class ProfileView(DetailView):
     def get_context_data(self, **kwargs):
         context = super(ProfileView, self).get_context_data(**kwargs)
         context['can_edit'] = self.can_edit(context['object'])
+        if not context['can_edit']:
+            # Part of the key of the cached page, which is shared by all
+            # processes
+            context['profile_version'] = get_profile_cache_version(
+                context['object'].pk)
+            context['profile_cache'] = settings.WAFER_CACHE
         return context
 
     def can_edit(self, user):
@@ -126,17 +260,21 @@ class RegistrationView(EditOneselfMixin, FormView):
         'wafer.users/registration/confirm_mail.html')
 
     def get_user(self):
-        try:
-            return UserProfile.objects.get(
-                user__username=self.kwargs['username'])
-        except UserProfile.DoesNotExist:
-            raise Http404()
+        if not hasattr(self, '_profile'):
+            try:
+                self._profile = UserProfile.objects.select_related(
+                    'user').get(user__username=self.kwargs['username'])
+            except UserProfile.DoesNotExist:
+                raise Http404()
+        return self._profile
 
     def get_form_class(self):
         return get_registration_form_class()
 
     def get_kv_group(self):
-        return Group.objects.get_by_natural_key('Registration')
+        if not hasattr(self, '_kv_group'):
+            self._kv_group = Group.objects.get_by_natural_key('Registration')
+        return self._kv_group
 
     def get_queryset(self):
         if settings.WAFER_REGISTRATION_MODE != 'form':
@@ -147,18 +285,15 @@ class RegistrationView(EditOneselfMixin, FormView):
         return user.kv.filter(group=self.get_kv_group())
 
     def get_initial(self):
-        saved = self.get_queryset()
+        saved = dict((pair.key, pair.value) for pair in self.get_queryset())
 
         form = self.get_form_class()()
         initial = form.initial_values(self.get_user())
 
-        for fieldname in form.fields:
-            try:
-                value = saved.get(key=fieldname).value
-                field = form.fields[fieldname]
-                initial[fieldname] = deserialize_by_field(value, field)
-            except ObjectDoesNotExist:
-                continue
+        for fieldname, field in form.fields.items():
+            if fieldname in saved:
+                initial[fieldname] = deserialize_by_field(saved[fieldname],
+                                                          field)
         return initial
 
     def form_invalid(self, form):
@@ -169,22 +304,17 @@ class RegistrationView(EditOneselfMixin, FormView):
     def form_valid(self, form):
         if not settings.WAFER_REGISTRATION_OPEN:
             raise ValidationError(_('Registration is not open'))
+        # Checks the edit permission
         saved = self.get_queryset()
         user = self.get_user()
-        group = self.get_kv_group()
 
-        for key, value in form.cleaned_data.items():
-            try:
-                pair = saved.get(key=key)
-                pair.value = value
-                pair.save()
-            except ObjectDoesNotExist:
-                user.kv.create(group=group, key=key, value=value)
+        upsert_kv(user.kv, self.get_kv_group(), form.cleaned_data)
+        refresh_registered([user.user_id])
 
         log.info('User %s successfully registered (%r)',
                  user.user.username, form.cleaned_data)
 
-        is_registered = form.is_registered(self.get_queryset())
+        is_registered = form.is_registered(saved)
         send_email = (getattr(form, 'send_email_confirmation', False) and
                       is_registered)
         confirmation_context = self.get_confirmation_context_data(
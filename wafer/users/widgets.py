@@ -0,0 +1,58 @@
+from django.core.urlresolvers import reverse_lazy
+
+from easy_select2.widgets import Select2, Select2Multiple
+
+
+class UserAutocompleteMixin(object):
+    """Select2 widget that looks users up via the autocomplete endpoint.
+
+       Only the currently selected users are rendered as options, so the
+       page size doesn't grow with the number of registered users."""
+
+    def __init__(self, select2attrs=None, attrs=None, *args, **kwargs):
+        attrs = dict(attrs or {})
+        # Select2 reads these from the <select> element itself
+        attrs.setdefault('data-ajax--url',
+                         reverse_lazy('wafer_users_autocomplete'))
+        attrs.setdefault('data-ajax--delay', 250)
+        attrs.setdefault('data-minimum-input-length', 1)
+        super(UserAutocompleteMixin, self).__init__(
+            select2attrs=select2attrs, attrs=attrs, *args, **kwargs)
+
+    def _selected_choices(self, value):
+        if value is None:
+            value = []
+        elif not isinstance(value, (list, tuple)):
+            value = [value]
+        selected = [v for v in value if v not in ('', None)]
+
+        field = self.choices.field
+        choices = []
+        if getattr(field, 'empty_label', None) is not None:
+            choices.append(('', field.empty_label))
+        if selected:
+            for obj in self.choices.queryset.filter(pk__in=selected):
+                choices.append((field.prepare_value(obj),
+                                field.label_from_instance(obj)))
+        return choices
+
+    def render(self, name, value, *args, **kwargs):
+        if not hasattr(self.choices, 'queryset'):
+            # Not attached to a model field, so nothing to trim
+            return super(UserAutocompleteMixin, self).render(
+                name, value, *args, **kwargs)
+        all_choices = self.choices
+        self.choices = self._selected_choices(value)
+        try:
+            return super(UserAutocompleteMixin, self).render(
+                name, value, *args, **kwargs)
+        finally:
+            self.choices = all_choices
+
+
+class UserAutocomplete(UserAutocompleteMixin, Select2):
+    pass
+
+
+class UserAutocompleteMultiple(UserAutocompleteMixin, Select2Multiple):
+    pass
@@ -1,7 +1,9 @@
 import functools
 import unicodedata
+import uuid
 from django.core.cache import caches
 from django.conf import settings
+from django.db import models, transaction
 
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
@@ -14,6 +16,12 @@ def normalize_unicode(u):
     return unicodedata.normalize('NFKD', u).encode('ascii', 'ignore')
 
 
+def normalize_email(email):
+    """The form of an email address used to match it to other addresses,
+       ignoring case and surrounding whitespace."""
+    return (email or u'').strip().lower()
+
+
 def cache_result(cache_key, timeout):
     """A decorator for caching the result of a function."""
     def decorator(f):
@@ -39,6 +47,118 @@ def cache_result(cache_key, timeout):
     return decorator
 
 
+def cached_on_user(attr):
+    """A decorator for functions of a user that return a set of ids.
+
+       The result is cached on the user object, in attr, like Django's
+       permission cache, so it costs a single query per request. Anonymous
+       users get an empty set."""
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(user):
+            if user is None or user.id is None:
+                return frozenset()
+            result = getattr(user, attr, None)
+            if result is None:
+                result = frozenset(f(user))
+                setattr(user, attr, result)
+            return result
+        return wrapper
+    return decorator
+
+
+def get_cache_version(name):
+    """Return the current version stamp for name.
+
+       The stamp lives in the WAFER_CACHE, so all processes see the same
+       value. Include it in cache keys so that bump_cache_version
+       invalidates every entry built from an older version."""
+    cache = caches[settings.WAFER_CACHE]
+    key = 'wafer_version_%s' % name
+    version = cache.get(key)
+    if version is None:
+        # add() so we don't race another process setting up the stamp
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def get_cache_versions(*names):
+    """Return the current version stamps for names, as a list.
+
+       Like get_cache_version, but the stamps are fetched together, so
+       this is a single cache lookup once they've all been set up."""
+    cache = caches[settings.WAFER_CACHE]
+    keys = ['wafer_version_%s' % name for name in names]
+    versions = cache.get_many(keys)
+    return [versions.get(key) or get_cache_version(name)
+            for key, name in zip(keys, names)]
+
+
+def bump_cache_version(name):
+    """Move name to a new version stamp, invalidating all older entries.
+
+       Inside a transaction, other processes can still read the old data
+       until it commits, and cache it under the new stamp, so the stamp
+       is moved again once the transaction commits. (Django 1.8 can't
+       defer this, so there it's only moved at once.)"""
+    cache = caches[settings.WAFER_CACHE]
+    key = 'wafer_version_%s' % name
+    cache.set(key, uuid.uuid4().hex, None)
+    after_commit(lambda: cache.set(key, uuid.uuid4().hex, None))
+
+
+def after_commit(func):
+    """Call func once the current transaction commits, if there is one.
+
+       Outside a transaction, and on Django 1.8, which has no on_commit,
+       this does nothing, so callers should also do the work at once."""
+    if (hasattr(transaction, 'on_commit') and
+            transaction.get_connection().in_atomic_block):
+        transaction.on_commit(func)
+
+
+# The fewest parameters a query can take on our databases (SQLite's default)
+MAX_QUERY_PARAMS = 999
+
+
+def backfill(queryset, compute, batch_size=1000):
+    """Fill in fields on the rows of queryset, for data migrations.
+
+       The rows are read in batches, in pk order, and compute(batch)
+       returns {pk: {field: value}} for the rows of the batch that need
+       changing. Those are set with CASE expressions, in as few UPDATEs
+       as the limit on query parameters allows."""
+    model = queryset.model
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        batch = queryset
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        batch = list(batch[:batch_size])
+        if not batch:
+            return
+        last_pk = batch[-1].pk
+
+        updates = sorted(compute(batch).items())
+        fields = sorted(set(field for pk, values in updates
+                            for field in values))
+        # Each row takes its pk in the WHERE clause, and a pk and a value
+        # for each field
+        rows = max(1, (MAX_QUERY_PARAMS - 1) // (2 * len(fields) + 1))
+        for i in range(0, len(updates), rows):
+            chunk = updates[i:i + rows]
+            model._default_manager.filter(
+                pk__in=[pk for pk, values in chunk]
+            ).update(**dict((field, models.Case(
+                *[models.When(pk=pk, then=models.Value(values[field]))
+                  for pk, values in chunk if field in values],
+                default=models.F(field),
+                output_field=model._meta.get_field(field)))
+                for field in fields))
+
+
 class QueryTracker(object):
     """ Track queries to database. """
 